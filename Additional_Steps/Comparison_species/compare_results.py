@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import argparse
+from multiprocessing import Pool
+
+import pandas as pd
+
+## HolomiRA: non-interactive comparison of N result files
+
+# Mapping of taxonomy prefixes to their full names
+TAXONOMY_LEVELS = {
+    'd__': 'Domain',
+    'p__': 'Phylum',
+    'c__': 'Class',
+    'o__': 'Order',
+    'f__': 'Family',
+    'g__': 'Genus',
+    's__': 'Species'
+}
+FEATURES = ['miRNA', 'Gene', 'MAG'] + list(TAXONOMY_LEVELS.values())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare miRNA, gene, MAG and taxonomy sets across any number of HolomiRA result files."
+    )
+    parser.add_argument("results", nargs="+", help="HolomiRA_results.tsv files (one per dataset).")
+    parser.add_argument("-l", "--labels", nargs="+",
+                        help="Dataset labels, one per result file (default: file name without extension).")
+    parser.add_argument("-o", "--out-dir", default=os.path.join(os.getcwd(), "output"),
+                        help="Output directory (default: ./output). Existing files are overwritten.")
+    parser.add_argument("-g", "--group-by", choices=["environment", "dataset", "both"], default="both",
+                        help="Groups to compare: Environment values, datasets, or dataset:environment "
+                             "(default: both).")
+    parser.add_argument("--strip-mirna-prefix", action="store_true",
+                        help="Drop the species prefix of miRNA names (e.g. bta-miR-1 -> miR-1) to compare species.")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count(),
+                        help="Worker processes used to load datasets (default: all CPUs).")
+    return parser.parse_args()
+
+
+def split_taxonomy(taxonomy):
+    """Split GTDB taxonomy strings once into one categorical column per rank."""
+    parts = taxonomy.fillna("").str.split(";", expand=True)
+    ranks = pd.DataFrame(index=taxonomy.index)
+    for prefix, name in TAXONOMY_LEVELS.items():
+        rank = pd.Series(pd.NA, index=taxonomy.index, dtype=object)
+        for column in parts.columns:
+            values = parts[column].str.strip()
+            rank = rank.where(rank.notna() | ~values.str.startswith(prefix, na=False), values)
+        ranks[name] = rank.astype("category")
+    return ranks
+
+
+def load_dataset(task):
+    """Load one result file and return its per-group feature sets and unique counts."""
+    path, label, group_by, strip_prefix = task
+    df = pd.read_csv(path, sep="\t", usecols=lambda c: c in {'miRNA', 'Gene', 'MAG', 'Taxonomy', 'Environment'})
+    if strip_prefix:
+        df['miRNA'] = df['miRNA'].str.split('-', n=1).str[1]
+    df = pd.concat([df.drop(columns='Taxonomy'), split_taxonomy(df['Taxonomy'])], axis=1)
+
+    if group_by == "environment":
+        df['Group'] = df['Environment'].astype(str)
+    elif group_by == "dataset":
+        df['Group'] = label
+    else:
+        df['Group'] = label + ":" + df['Environment'].astype(str)
+
+    counts = df.groupby('Group', observed=True)[FEATURES].nunique().reset_index()
+    counts.insert(0, 'Dataset', label)
+    sets = {
+        group: {feature: set(sub[feature].dropna()) for feature in FEATURES}
+        for group, sub in df.groupby('Group', observed=True)
+    }
+    return label, counts, sets
+
+
+def merge_sets(loaded):
+    """Merge per-dataset group sets (the same group may appear in several datasets)."""
+    merged = {}
+    for _, _, sets in loaded:
+        for group, features in sets.items():
+            target = merged.setdefault(group, {feature: set() for feature in FEATURES})
+            for feature, values in features.items():
+                target[feature] |= values
+    return merged
+
+
+def membership_tables(group_sets, feature):
+    """Return (per-item membership, intersection sizes, pairwise shared counts) for a feature."""
+    groups = sorted(group_sets)
+    members = {}
+    for group in groups:
+        for item in group_sets[group][feature]:
+            members.setdefault(item, []).append(group)
+
+    membership = pd.DataFrame(
+        [(item, len(found), ";".join(found)) for item, found in members.items()],
+        columns=[feature, 'num_groups', 'groups']
+    ).sort_values(['num_groups', feature], ascending=[False, True])
+
+    intersections = (membership.groupby('groups').size().reset_index(name='count')
+                     .sort_values('count', ascending=False))
+    intersections.insert(0, 'Feature', feature)
+
+    # Item x group indicator matrix; its cross-product counts shared items for every pair of groups
+    indicator = pd.DataFrame(False, index=list(members), columns=groups)
+    for group in groups:
+        indicator.loc[list(group_sets[group][feature]), group] = True
+    indicator = indicator.astype(int)
+    pairwise = indicator.T.dot(indicator)
+    return membership, intersections, pairwise
+
+
+def main():
+    args = parse_args()
+    labels = args.labels or [os.path.splitext(os.path.basename(p))[0] for p in args.results]
+    if len(labels) != len(args.results):
+        print("Error: the number of labels must match the number of result files.")
+        sys.exit(1)
+    if len(set(labels)) != len(labels):
+        print("Error: dataset labels must be unique.")
+        sys.exit(1)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    tasks = [(path, label, args.group_by, args.strip_mirna_prefix) for path, label in zip(args.results, labels)]
+
+    # --- Load and summarize every dataset in parallel ---
+    processes = max(1, min(args.processes or 1, len(tasks)))
+    if processes > 1:
+        with Pool(processes) as pool:
+            loaded = pool.map(load_dataset, tasks)
+    else:
+        loaded = [load_dataset(task) for task in tasks]
+    print(f"Loaded {len(loaded)} datasets")
+
+    # --- Unique counts per dataset and group, for every feature and rank ---
+    counts = pd.concat([c for _, c, _ in loaded], ignore_index=True)
+    counts.to_csv(os.path.join(args.out_dir, "unique_counts.tsv"), sep="\t", index=False)
+    counts_long = counts.melt(id_vars=['Dataset', 'Group'], var_name='Variable', value_name='Counts')
+    counts_long.to_csv(os.path.join(args.out_dir, "unique_counts_long.tsv"), sep="\t", index=False)
+
+    # --- Shared and exclusive elements across all groups, for every feature and rank ---
+    group_sets = merge_sets(loaded)
+    all_intersections = []
+    for feature in FEATURES:
+        membership, intersections, pairwise = membership_tables(group_sets, feature)
+        membership.to_csv(os.path.join(args.out_dir, f"membership_{feature}.tsv"), sep="\t", index=False)
+        pairwise.to_csv(os.path.join(args.out_dir, f"pairwise_shared_{feature}.tsv"), sep="\t")
+        all_intersections.append(intersections)
+    pd.concat(all_intersections, ignore_index=True).to_csv(
+        os.path.join(args.out_dir, "intersections.tsv"), sep="\t", index=False)
+
+    print(f"Compared {len(group_sets)} groups across {len(FEATURES)} features; results saved in {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
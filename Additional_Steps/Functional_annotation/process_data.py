@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import numpy as np
+
+USAGE = """Usage: python process_data.py <superfocus_dir|subsystem_level_X.xls> <sample_type> <dataset_name>
+
+Arguments:
+  <superfocus_dir>         : SUPER-FOCUS output directory; output_subsystem_level_1/2/3.xls are all processed.
+  <subsystem_level_X.xls>  : Alternatively, a single SUPER-FOCUS level file.
+  <sample_type>            : The type of sample (e.g., 'MAG', 'Genes', 'miRNA').
+  <dataset_name>           : The name of the organism to be analyzed (e.g., 'Human', 'Ruminants')
+                           : or the conditions of the same organism (e.g., 'decrease_RME', 'increase_RME').
+
+Outputs (in the current directory), for each level:
+  level_X_<sample_type>_<dataset_name>_counts.txt  : raw counts, same layout as process_data.sh
+  level_X_<sample_type>_<dataset_name>_relab.txt   : relative abundance, same layout as process_data.sh
+  level_X_<sample_type>_<dataset_name>.npz         : functions, samples, counts and relab matrices (numpy)
+"""
+
+if len(sys.argv) > 1 and sys.argv[1] == "--help":
+    print(USAGE)
+    sys.exit(0)
+
+if len(sys.argv) != 4:
+    print(USAGE)
+    sys.exit(1)
+
+input_path = sys.argv[1]
+sample_type = sys.argv[2]
+dataset_name = sys.argv[3]
+
+
+def clean(values):
+    """Remove the characters process_data.sh strips from its outputs."""
+    return [value.replace("'", "").replace("&#", "") for value in values]
+
+
+def read_level(path):
+    """Read a SUPER-FOCUS level table into (first header, functions, sample header, value matrix)."""
+    with open(path, encoding="ISO-8859-1") as handle:
+        lines = handle.read().split("\n")[4:]
+    rows = [line.split("\t") for line in lines if line]
+    header = rows[0]
+    table = np.array(rows[1:], dtype=object).reshape(len(rows) - 1, len(header))
+    return header[0], table[:, 0], np.array(header[1:], dtype=object), table[:, 1:]
+
+
+def write_matrix(path, first, functions, samples, values):
+    """Write a space-separated matrix with the layout read.table(sep = ' ') expects."""
+    with open(path, "w") as out:
+        out.write(" ".join([first] + samples) + " \n")
+        for function, row in zip(functions, values):
+            out.write(" ".join([function] + list(row)) + " \n")
+
+
+# --- Collect the level files to process ---
+if os.path.isdir(input_path):
+    level_files = [(level, os.path.join(input_path, f"output_subsystem_level_{level}.xls")) for level in (1, 2, 3)]
+    level_files = [(level, path) for level, path in level_files if os.path.exists(path)]
+else:
+    level = re.search(r"level_(\d)", os.path.basename(input_path))
+    if not level or not os.path.exists(input_path):
+        print("Invalid file name. The file name must contain 'level_1', 'level_2', or 'level_3'.")
+        sys.exit(1)
+    level_files = [(int(level.group(1)), input_path)]
+
+if not level_files:
+    print(f"No SUPER-FOCUS level files found in: {input_path}")
+    sys.exit(1)
+
+# --- Build counts and relab matrices column-wise for every level ---
+for level, path in level_files:
+    first, functions, header, values = read_level(path)
+
+    # Columns with '%' hold relative abundances, the others raw counts
+    is_relab = np.array(["%" in column for column in header], dtype=bool)
+    functions = clean([function.replace(" ", "_") for function in functions])
+    first = first.replace(" ", "_")
+    count_samples = clean(list(header[~is_relab]))
+    relab_samples = clean([(column + " ").replace("% ", "").rstrip(" ") for column in header[is_relab]])
+    counts = values[:, ~is_relab]
+    relab = values[:, is_relab]
+
+    prefix = f"level_{level}_{sample_type}_{dataset_name}"
+    write_matrix(f"{prefix}_counts.txt", first, functions, count_samples, counts)
+    write_matrix(f"{prefix}_relab.txt", first, functions, relab_samples, relab)
+    np.savez_compressed(
+        f"{prefix}.npz",
+        functions=np.array(functions, dtype=str),
+        count_samples=np.array(count_samples, dtype=str),
+        relab_samples=np.array(relab_samples, dtype=str),
+        counts=counts.astype(np.float64),
+        relab=relab.astype(np.float64),
+    )
+    print(f"Counts and Relative Abundance processing completed for level_{level} with sample type "
+          f"{sample_type} of {dataset_name} ({len(functions)} functions x {len(count_samples)} samples).")
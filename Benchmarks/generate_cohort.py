@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import random
+import argparse
+
+## HolomiRA: synthetic MAG / miRNA cohort for benchmarking
+
+ENVIRONMENTS = ["Rumen", "Feces"]
+PHYLA = ["Firmicutes_A", "Bacteroidota", "Proteobacteria", "Spirochaetota", "Actinobacteriota"]
+
+
+def add_arguments(parser):
+    parser.add_argument("--genomes", type=int, default=10, help="Number of MAGs (default: 10).")
+    parser.add_argument("--contigs", type=int, default=10, help="Contigs per MAG (default: 10).")
+    parser.add_argument("--contig-length", type=int, default=20000, help="Contig length in nt (default: 20000).")
+    parser.add_argument("--mirnas", type=int, default=50, help="Number of host miRNAs (default: 50).")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1).")
+    return parser
+
+
+def random_seq(rng, length):
+    return "".join(rng.choice("ACGT") for _ in range(length))
+
+
+def generate_cohort(out_dir, genomes=10, contigs=10, contig_length=20000, mirnas=50, seed=1):
+    """Write genomes, miRNAs, sample table and taxonomy metadata; return their paths."""
+    rng = random.Random(seed)
+    fasta_dir = os.path.join(out_dir, "Genomes_files")
+    os.makedirs(fasta_dir, exist_ok=True)
+
+    samples = [f"MAG_{ENVIRONMENTS[i % len(ENVIRONMENTS)].lower()}_{i + 1}" for i in range(genomes)]
+    for sample in samples:
+        with open(os.path.join(fasta_dir, f"{sample}.fa"), "w") as out:
+            for c in range(contigs):
+                seq = random_seq(rng, contig_length)
+                out.write(f">k141_{rng.randint(1, 10 ** 6)}_{c}\n")
+                for i in range(0, len(seq), 80):
+                    out.write(seq[i:i + 80] + "\n")
+
+    ref_mir = os.path.join(out_dir, "miRNAs.fa")
+    with open(ref_mir, "w") as out:
+        for m in range(mirnas):
+            out.write(f">bta-miR-{m + 1}\n{random_seq(rng, rng.randint(20, 24)).replace('T', 'U')}\n")
+
+    sample_tab = os.path.join(out_dir, "samples_id")
+    with open(sample_tab, "w") as out:
+        out.write("SampleID\n")
+        for sample in samples:
+            out.write(f"{sample}\n")
+
+    metadata = os.path.join(out_dir, "metadata_samples")
+    with open(metadata, "w") as out:
+        for i, sample in enumerate(samples):
+            phylum = PHYLA[rng.randrange(len(PHYLA))]
+            genus = f"g__UBA{rng.randint(1, 50)}"
+            taxonomy = f"d__Bacteria;p__{phylum};c__C{phylum[:3]};o__O{phylum[:3]};f__F{phylum[:3]};{genus};s__"
+            out.write(f"{sample}\t{taxonomy}\t{ENVIRONMENTS[i % len(ENVIRONMENTS)]}\n")
+
+    return {"fasta_dir": fasta_dir + "/", "ref_mir": ref_mir, "sample_tab": sample_tab,
+            "id": metadata, "samples": samples}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic HolomiRA input cohort.")
+    parser.add_argument("out_dir", help="Directory for the synthetic cohort.")
+    args = add_arguments(parser).parse_args()
+    paths = generate_cohort(args.out_dir, args.genomes, args.contigs, args.contig_length, args.mirnas, args.seed)
+    print(f"Synthetic cohort with {len(paths['samples'])} MAGs written to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
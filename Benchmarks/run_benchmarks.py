@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+
+from generate_cohort import add_arguments, generate_cohort
+
+## HolomiRA: benchmark the per-stage scripts on a synthetic cohort
+#
+# External tools (prokka, RNAhybrid, RNAup, bedtools, superfocus) are replaced by the
+# deterministic stand-ins in Benchmarks/stubs, so the suite runs without them. Only the
+# HolomiRA scripts are compared against the baselines; stand-in stages are reported for
+# context.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+SCRIPTS = os.path.join(REPO_DIR, "Workflow", "Scripts")
+STUBS = os.path.join(BENCH_DIR, "stubs")
+
+SIZES = {
+    "tiny":   dict(genomes=4,   contigs=4,  contig_length=10000, mirnas=20),
+    "small":  dict(genomes=20,  contigs=10, contig_length=20000, mirnas=50),
+    "medium": dict(genomes=100, contigs=20, contig_length=25000, mirnas=100),
+    "large":  dict(genomes=500, contigs=30, contig_length=30000, mirnas=200),
+}
+
+UPS = 15
+DWNS = 20
+DG_CUTOFF = -15
+
+
+class Recorder:
+    """Accumulate wall time, CPU time and peak RSS per stage."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, stage, cmd, stand_in=False, stdout=None, cwd=None, items=None):
+        record = self.stages.setdefault(stage, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "max_rss_mb": 0.0,
+                                                "items": 0, "stand_in": stand_in})
+        out = open(stdout, "w") if stdout else subprocess.DEVNULL
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=out, stderr=subprocess.DEVNULL, cwd=cwd,
+                                shell=isinstance(cmd, str))
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        wall = time.perf_counter() - start
+        if stdout:
+            out.close()
+        if proc.returncode != 0:
+            raise RuntimeError(f"Stage {stage} failed ({proc.returncode}): {cmd}")
+        record["calls"] += 1
+        record["wall_s"] += wall
+        record["cpu_s"] += usage.ru_utime + usage.ru_stime
+        record["max_rss_mb"] = max(record["max_rss_mb"], usage.ru_maxrss / 1024)
+        if items is not None:
+            record["items"] += items
+        return wall
+
+
+def count_lines(path, skip_header=False):
+    if not os.path.exists(path):
+        return 0
+    with open(path) as handle:
+        n = sum(1 for _ in handle)
+    return max(0, n - 1) if skip_header else n
+
+
+def concat(inputs, output):
+    with open(output, "w") as out:
+        for path in inputs:
+            with open(path) as handle:
+                out.write(handle.read())
+
+
+def run_pipeline(work_dir, cohort, rec):
+    """Run the HolomiRA stages in Snakefile order on the synthetic cohort."""
+    py = sys.executable
+    out_dir = os.path.join(work_dir, "Results")
+    samples = cohort["samples"]
+    for sub in ["annotation", "target_fasta", "rnahybrid", "structure", "RNAup", "final_results", "function"]:
+        os.makedirs(os.path.join(out_dir, sub), exist_ok=True)
+
+    for s in samples:
+        ann = f"{out_dir}/annotation/{s}"
+        rec.run("annotate_prokka", ["prokka", "--quiet", "--outdir", ann, "--prefix", s, "--addgenes",
+                                    "--centre", "X", "--compliant", "--cpus", "1",
+                                    f"{cohort['fasta_dir']}{s}.fa", "--force"], stand_in=True)
+        rec.run("filter_cds", f"""awk '$3 == "CDS" && ($5 - $4 + 1) >= 150 {{print $0}}' {ann}/{s}.gff """
+                              f"""> {ann}/{s}_cds.gff""", stand_in=True)
+        rec.run("id", f"""grep -v '^#' {ann}/{s}_cds.gff | awk '{{print $1, $4, $5,$7,$9}}' | """
+                      f"""awk '{{split($5,a,/;/); print $1,$2,$3,a[1],$4}}' OFS="\\t" > {ann}/{s}_IDs.txt""",
+                stand_in=True)
+        rec.run("five_prime", [py, f"{SCRIPTS}/get_fiveprime.py", s, cohort["fasta_dir"], str(UPS), str(DWNS),
+                               out_dir, f"{ann}/{s}_IDs.txt"], cwd=work_dir,
+                items=count_lines(f"{ann}/{s}_IDs.txt"))
+        rec.run("find_targets", ["RNAhybrid", "-s", "3utr_human", "-c", "-t", f"{out_dir}/target_fasta/{s}_filtered.fa",
+                                 "-q", cohort["ref_mir"], "-e", "-20", "-p", "0.01"],
+                stand_in=True, stdout=f"{out_dir}/rnahybrid/{s}_putative_targets.tsv")
+        rec.run("format_rnahybrid", [py, f"{SCRIPTS}/rnahybrid_format.py", s, out_dir,
+                                     f"{out_dir}/rnahybrid/{s}_putative_targets.tsv"],
+                items=count_lines(f"{out_dir}/rnahybrid/{s}_putative_targets.tsv"))
+        rec.run("get_indiv_metrics", [py, f"{SCRIPTS}/get_metrics.py", out_dir, cohort["id"],
+                                      f"{out_dir}/rnahybrid/{s}_bsites.tsv", s],
+                items=count_lines(f"{out_dir}/rnahybrid/{s}_bsites.tsv", skip_header=True))
+
+        # Windows and RNAup inputs are prepared per sample, as in the Snakefile
+        s_finalresults = f"{out_dir}/rnahybrid/{s}_finalresults.tsv"
+        rec.run("extract_significant_binding_windows",
+                [py, f"{SCRIPTS}/generate_extended_binding_windows.py", s_finalresults, ann,
+                 f"{out_dir}/structure/{s}/sig_hits", s], items=count_lines(s_finalresults, skip_header=True))
+        rna_dir = f"{out_dir}/RNAup/{s}"
+        os.makedirs(rna_dir, exist_ok=True)
+        rec.run("prepare_rnaup_inputs",
+                [py, f"{SCRIPTS}/prepare_rnaup_inputs.py", s_finalresults, cohort["ref_mir"],
+                 f"{out_dir}/structure/{s}/sig_hits.fasta", rna_dir])
+        folds = len(glob.glob(f"{rna_dir}/*.fa"))
+        rec.stages["prepare_rnaup_inputs"]["items"] += folds
+        rec.run("run_rnaup", [py, f"{SCRIPTS}/run_rnaup.py", rna_dir], stand_in=True, items=folds)
+
+    finalresults = f"{out_dir}/rnahybrid/finalresults.txt"
+    concat([f"{out_dir}/rnahybrid/{s}_finalresults.tsv" for s in samples], finalresults)
+    rec.run("merge_rnaup_results", [py, f"{SCRIPTS}/merge_rnaup_results.py", f"{out_dir}/RNAup", finalresults,
+                                    f"{out_dir}/final_results", str(DG_CUTOFF)],
+            items=count_lines(finalresults, skip_header=True))
+    results = f"{out_dir}/final_results/HolomiRA_results.tsv"
+    rec.run("impacted", [py, f"{SCRIPTS}/impacted.py", results, out_dir], cwd=work_dir,
+            items=count_lines(results, skip_header=True))
+
+
+def compare(current, baseline, tolerance, min_seconds):
+    """Return report lines and the list of regressed stages."""
+    lines, regressions = [], []
+    lines.append(f"{'stage':40s} {'wall_s':>9s} {'base':>9s} {'ratio':>6s} {'rss_mb':>8s} {'base':>8s}")
+    for stage, rec in current["stages"].items():
+        if rec["stand_in"]:
+            continue
+        base = baseline["stages"].get(stage)
+        if not base:
+            lines.append(f"{stage:40s} {rec['wall_s']:9.2f} {'-':>9s} {'-':>6s} {rec['max_rss_mb']:8.1f} {'-':>8s}")
+            continue
+        ratio = rec["wall_s"] / base["wall_s"] if base["wall_s"] else float("inf")
+        slower = ratio > 1 + tolerance and rec["wall_s"] - base["wall_s"] > min_seconds
+        fatter = rec["max_rss_mb"] > base["max_rss_mb"] * (1 + tolerance)
+        flag = "  <-- REGRESSION" if slower or fatter else ""
+        if flag:
+            regressions.append(stage)
+        lines.append(f"{stage:40s} {rec['wall_s']:9.2f} {base['wall_s']:9.2f} {ratio:6.2f} "
+                     f"{rec['max_rss_mb']:8.1f} {base['max_rss_mb']:8.1f}{flag}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HolomiRA scripts on a synthetic cohort.")
+    parser.add_argument("--size", choices=SIZES, default="tiny", help="Cohort size preset (default: tiny).")
+    parser.add_argument("--hit-rate", type=float, default=0.05,
+                        help="Fraction of (window, miRNA) pairs the RNAhybrid stand-in reports (default: 0.05).")
+    parser.add_argument("--work-dir", help="Working directory (default: a temporary directory).")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory.")
+    parser.add_argument("--output", help="Write the results JSON here.")
+    parser.add_argument("--baseline", help="Baseline JSON (default: Benchmarks/baselines/<size>.json).")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative slowdown / RSS growth before flagging (default: 0.25).")
+    parser.add_argument("--min-seconds", type=float, default=0.5,
+                        help="Ignore slowdowns smaller than this many seconds (default: 0.5).")
+    add_arguments(parser)
+    for action in parser._actions:
+        if action.dest in SIZES["tiny"]:
+            action.default = None
+    args = parser.parse_args()
+
+    params = dict(SIZES[args.size])
+    for key in params:
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="holomira_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    os.environ["PATH"] = STUBS + os.pathsep + os.environ["PATH"]
+    os.environ["HOLOMIRA_STUB_HIT_RATE"] = str(args.hit_rate)
+
+    print(f"Generating synthetic cohort ({args.size}: {params}) in {work_dir}")
+    cohort = generate_cohort(os.path.join(work_dir, "cohort"), seed=args.seed or 1, **params)
+
+    rec = Recorder()
+    start = time.perf_counter()
+    try:
+        run_pipeline(work_dir, cohort, rec)
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    current = {
+        "size": args.size,
+        "params": dict(params, hit_rate=args.hit_rate),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "total_wall_s": time.perf_counter() - start,
+        "stages": rec.stages,
+    }
+
+    print(f"\n{'stage':40s} {'calls':>6s} {'items':>8s} {'wall_s':>9s} {'cpu_s':>9s} {'max_rss_mb':>10s}")
+    for stage, r in rec.stages.items():
+        tag = " (stand-in)" if r["stand_in"] else ""
+        print(f"{stage:40s} {r['calls']:6d} {r['items']:8d} {r['wall_s']:9.2f} {r['cpu_s']:9.2f} "
+              f"{r['max_rss_mb']:10.1f}{tag}")
+
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(current, out, indent=2)
+
+    baseline_path = args.baseline or os.path.join(BENCH_DIR, "baselines", f"{args.size}.json")
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, "w") as out:
+            json.dump(current, out, indent=2)
+        print(f"\nBaseline saved: {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"\nNo baseline at {baseline_path}; run with --save-baseline to create one.")
+        return 0
+
+    with open(baseline_path) as handle:
+        baseline = json.load(handle)
+    if baseline.get("params") != current["params"]:
+        print("\n[!] Baseline was recorded with different cohort parameters; ratios are not comparable.")
+    lines, regressions = compare(current, baseline, args.tolerance, args.min_seconds)
+    print("\nComparison against baseline:")
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) regressed: {', '.join(regressions)}")
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import subprocess
+from shards import link_file
+from stage_profile import StageProfile
+
+## HolomiRA: shared, content-addressed Prokka annotation cache
+#
+#   annotation_cache.py <cache_dir> <genome.fa> <annotation_dir> <prefix> <threads> "<prokka options>"
+#
+# With `annotation_cache: <dir>`, annotate_prokka looks the genome up before running Prokka. The
+# key is the SHA-256 of the genome FASTA, the Prokka version, the Prokka options and the prefix
+# (the sample ID, which Prokka writes into file names and contig IDs); the thread count is not part
+# of it. A cache entry holds the files the workflow reads ({prefix}.gff, .tsv and .fna) and a
+# manifest with their SHA-256, under {cache_dir}/<key[:2]>/<key>/.
+#   hit  : the entry's files are verified and hard-linked (copied across file systems, or when
+#          older than the genome) into annotation_dir; an entry that fails verification is evicted
+#          and the genome reannotated
+#   miss : Prokka runs into annotation_dir and its outputs are published to the cache
+# Entries are built in a private temporary folder and renamed into place, so concurrent jobs of
+# one or several projects never see a partial entry; when two of them annotate the same genome,
+# the first rename wins and the other copy is dropped. The cache can be shared by every project
+# that can reach it and pruned by removing entry folders.
+
+CACHED_SUFFIXES = (".gff", ".tsv", ".fna")
+# Bumped when the layout of an entry changes
+CACHE_FORMAT = 1
+
+
+def sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prokka_version():
+    result = subprocess.run(["prokka", "--version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"prokka --version failed: {result.stdout.strip()}")
+    return result.stdout.strip()
+
+
+def cache_key(fasta, prefix, version, options):
+    parts = [f"format={CACHE_FORMAT}", f"genome={sha256(fasta)}", f"prokka={version}",
+             f"options={' '.join(options.split())}", f"prefix={prefix}"]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+class AnnotationCache:
+    def __init__(self, cache_dir):
+        self.dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry(self, key):
+        return os.path.join(self.dir, key[:2], key)
+
+    def lookup(self, key):
+        """Manifest of a complete, intact entry, or None."""
+        entry = self.entry(key)
+        try:
+            with open(os.path.join(entry, "manifest.json")) as handle:
+                manifest = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        for name, digest in manifest["files"].items():
+            path = os.path.join(entry, name)
+            if not os.path.isfile(path) or sha256(path) != digest:
+                print(f"[!] Annotation cache entry {key} is damaged ({name}); evicting it", file=sys.stderr)
+                self.evict(key)
+                return None
+        return manifest
+
+    def evict(self, key):
+        # Renamed away first, so readers never see a half-removed entry
+        trash = os.path.join(self.dir, f".evicted.{uuid.uuid4().hex}")
+        try:
+            os.rename(self.entry(key), trash)
+        except OSError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def publish(self, key, files, metadata):
+        """Store files ({name: path}) under key; False when another writer stored it first."""
+        tmp = os.path.join(self.dir, f".tmp.{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        try:
+            for name, path in files.items():
+                link_file(path, os.path.join(tmp, name))
+            manifest = dict(metadata, files={name: sha256(os.path.join(tmp, name)) for name in files},
+                            created=time.strftime("%Y-%m-%d %H:%M:%S"))
+            with open(os.path.join(tmp, "manifest.json"), "w") as out:
+                json.dump(manifest, out, indent=1)
+            os.makedirs(os.path.dirname(self.entry(key)), exist_ok=True)
+            try:
+                os.rename(tmp, self.entry(key))
+                return True
+            except OSError:
+                # The entry exists: a concurrent job annotated the same genome
+                return False
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def restore(self, key, manifest, annotation_dir, fasta):
+        for name in manifest["files"]:
+            dest = os.path.join(annotation_dir, name)
+            link_file(os.path.join(self.entry(key), name), dest)
+            # Snakemake reruns jobs whose outputs are older than their inputs; touching a link would
+            # touch every project's copy, so a file older than the genome is copied instead
+            if os.path.getmtime(dest) < os.path.getmtime(fasta):
+                os.remove(dest)
+                shutil.copyfile(os.path.join(self.entry(key), name), dest)
+
+
+def annotate(cache_dir, fasta, annotation_dir, prefix, threads, options):
+    """Restore the annotation of a genome from the cache, or run Prokka and cache it; True on a hit."""
+    with StageProfile("annotate_prokka", prefix) as profile:
+        cache = AnnotationCache(cache_dir)
+        version = prokka_version()
+        key = cache_key(fasta, prefix, version, options)
+        manifest = cache.lookup(key)
+        if manifest:
+            try:
+                cache.restore(key, manifest, annotation_dir, fasta)
+                profile.count("cache_hit")
+                print(f"{prefix}: annotation restored from the cache ({key[:12]})")
+                return True
+            except OSError:
+                # Evicted by another job since the lookup
+                pass
+
+        # Cached files are hard links: remove them rather than let Prokka overwrite them in place
+        for suffix in CACHED_SUFFIXES:
+            if os.path.lexists(os.path.join(annotation_dir, prefix + suffix)):
+                os.remove(os.path.join(annotation_dir, prefix + suffix))
+        subprocess.run(["prokka", "--quiet", "--outdir", annotation_dir, "--prefix", prefix] + options.split() +
+                       ["--cpus", str(threads), fasta, "--force"], check=True)
+        profile.count("cache_miss")
+        files = {prefix + suffix: os.path.join(annotation_dir, prefix + suffix) for suffix in CACHED_SUFFIXES}
+        stored = cache.publish(key, files, {"prefix": prefix, "genome": os.path.abspath(fasta),
+                                            "prokka": version, "options": options})
+        print(f"{prefix}: annotated{'' if stored else ', already cached by a concurrent job'} ({key[:12]})")
+        return False
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 7:
+        print('Usage: annotation_cache.py <cache_dir> <genome.fa> <annotation_dir> <prefix> <threads> "<prokka options>"')
+        sys.exit(1)
+    annotate(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]), sys.argv[6])
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import subprocess
+from shards import link_file, load_samples
+
+## HolomiRA: append mode for the cohort-wide aggregates
+#
+#   append_store.py merge <out_dir> <sample_tab> <dG_cutoff> <threads> <memory_mb> [flank] [--best-site]
+#
+# With `append: True` every cohort-wide aggregate keeps a manifest of the samples it already
+# contains in {out_dir}/append/<aggregate>/manifest.json. When samples are added to sample_tab, only
+# the new samples are processed and their contributions are appended:
+#   all_bsites, finalresults, sig_hits : the new samples' files are appended to the stored copies
+#   HolomiRA_results                   : RNAup results of the new samples only are merged
+#                                        (merge_rnaup_results.py --samples) and appended
+#   summary, functional_inputs         : summary.py / impacted.py --append process the rows of the
+#                                        samples appended to HolomiRA_results since their last run
+# Declared outputs are deleted by Snakemake before a job runs, so the aggregates are kept in the
+# store folder and the outputs are hard links to them. An aggregate is rebuilt from every sample
+# when it has no manifest, a sample it contains was removed or its per-sample files changed, or the
+# aggregate it is built from was rebuilt (a new generation). Rows of appended samples follow the
+# rows already present, so the files equal those of a full run when new samples are added at the
+# end of sample_tab. The RNAup summary is the exception: a full run lists the RNAup folders in
+# sorted sample order, so its appended rows are moved into that order (see sort_summary).
+
+APPEND_DIR = "append"
+
+
+def file_signature(*paths):
+    """Size and modification time of a sample's input files; a change forces a rebuild."""
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+    return ",".join(signature)
+
+
+class AppendStore:
+    """Stored copy of one aggregate and the manifest of the samples it contains."""
+
+    def __init__(self, out_dir, name):
+        self.name = name
+        self.dir = os.path.join(out_dir, APPEND_DIR, name)
+        self.manifest_path = os.path.join(self.dir, "manifest.json")
+        os.makedirs(self.dir, exist_ok=True)
+        self.manifest = None
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as handle:
+                self.manifest = json.load(handle)
+        self.new_generation = None
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    @property
+    def generation(self):
+        return self.new_generation or (self.manifest or {}).get("generation")
+
+    @property
+    def samples(self):
+        """Samples in the aggregate and their signatures, in the order they were added."""
+        return dict((self.manifest or {}).get("samples", {}))
+
+    def pending(self, signatures, source=None):
+        """Samples to add (in sample_tab order) and whether the aggregate is rebuilt from all of them.
+
+        signatures: {sample: signature} of the current cohort; source: generation of the aggregate
+        this one is built from, if any."""
+        manifest = self.manifest
+        rebuild = (manifest is None or manifest.get("source") != source
+                   or any(signatures.get(sample) != signature for sample, signature in manifest["samples"].items())
+                   or any(not os.path.exists(self.path(name)) or os.path.getsize(self.path(name)) < size
+                          for name, size in manifest["sizes"].items()))
+        if rebuild:
+            self.reset()
+            return list(signatures), True
+        # Anything an interrupted run wrote after the last manifest is dropped
+        for name, size in manifest["sizes"].items():
+            os.truncate(self.path(name), size)
+        return [sample for sample in signatures if sample not in manifest["samples"]], False
+
+    def reset(self):
+        for name in os.listdir(self.dir):
+            path = self.path(name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        self.manifest = None
+        self.new_generation = uuid.uuid4().hex
+
+    def commit(self, added, source=None):
+        """Record the samples just added ({sample: signature}) and the size of every stored file."""
+        samples = self.samples
+        samples.update(added)
+        sizes = {name: os.path.getsize(self.path(name)) for name in sorted(os.listdir(self.dir))
+                 if name != "manifest.json" and os.path.isfile(self.path(name))}
+        self.manifest = {"aggregate": self.name, "generation": self.generation, "source": source,
+                         "updated": time.strftime("%Y-%m-%d %H:%M:%S"), "samples": samples, "sizes": sizes}
+        tmp_path = f"{self.manifest_path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as out:
+            json.dump(self.manifest, out, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+        self.new_generation = None
+
+    def publish(self, name, dest):
+        link_file(self.path(name), dest)
+
+
+def append_files(out_dir, name, samples, inputs, outputs):
+    """Concatenation aggregate: inputs[i][j] is the j-th output's file of samples[i]."""
+    store = AppendStore(out_dir, name)
+    signatures = {sample: file_signature(*files) for sample, files in zip(samples, inputs)}
+    files = dict(zip(samples, inputs))
+    added, rebuild = store.pending(signatures)
+    for j, output in enumerate(outputs):
+        with open(store.path(os.path.basename(output)), "a") as out:
+            for sample in added:
+                with open(files[sample][j]) as handle:
+                    shutil.copyfileobj(handle, out)
+    store.commit({sample: signatures[sample] for sample in added})
+    for output in outputs:
+        store.publish(os.path.basename(output), output)
+    print(f"{name}: {'rebuilt from' if rebuild else 'appended'} {len(added)} samples")
+
+
+def read_header(path):
+    with open(path) as handle:
+        return handle.readline()
+
+
+def append_table(stored, delta):
+    """Append the rows of a delta table to a stored table; False when their headers differ."""
+    if os.path.getsize(delta) == 0 or not read_header(delta).strip():
+        return True
+    if not os.path.exists(stored) or os.path.getsize(stored) == 0 or not read_header(stored).strip():
+        shutil.copyfile(delta, stored)
+        return True
+    if read_header(stored) != read_header(delta):
+        return False
+    with open(delta) as handle, open(stored, "a") as out:
+        handle.readline()
+        shutil.copyfileobj(handle, out)
+    return True
+
+
+# --- RNAup merge ---
+MERGED = {"HolomiRA_results.tsv": "final_results", "HolomiRA_discarded.tsv": "final_results",
+          "RNAup_summary_results.tsv": "RNAup"}
+# Rows of each sample in the stored RNAup summary, in file order (merge_rnaup_results.py --samples)
+SUMMARY_COUNTS = "RNAup_summary_counts.tsv"
+
+
+def sort_summary(store):
+    """Reorder the stored RNAup summary by sample, as the sorted walk of a full merge lists it."""
+    summary_path, counts_path = store.path("RNAup_summary_results.tsv"), store.path(SUMMARY_COUNTS)
+    if not os.path.exists(summary_path) or not os.path.exists(counts_path):
+        return
+    with open(counts_path) as handle:
+        handle.readline()
+        counts = [(sample, int(rows)) for sample, rows in (line.rstrip("\n").split("\t") for line in handle)]
+    if [sample for sample, _ in counts] == sorted(sample for sample, _ in counts):
+        return
+    # Byte range of each sample's rows, then the ranges copied in sample order
+    blocks = {}
+    with open(summary_path, "rb") as handle:
+        header = handle.readline()
+        if not header.strip():
+            return
+        for sample, rows in counts:
+            start = handle.tell()
+            for _ in range(rows):
+                handle.readline()
+            blocks[sample] = (start, handle.tell())
+    tmp_path = f"{summary_path}.tmp{os.getpid()}"
+    with open(summary_path, "rb") as handle, open(tmp_path, "wb") as out:
+        out.write(header)
+        for sample in sorted(blocks):
+            start, end = blocks[sample]
+            handle.seek(start)
+            out.write(handle.read(end - start))
+    os.replace(tmp_path, summary_path)
+    with open(counts_path, "w") as out:
+        out.write("sample\trows\n")
+        for sample, rows in sorted(counts):
+            out.write(f"{sample}\t{rows}\n")
+
+
+def merge(out_dir, dg_cutoff, threads, memory_mb, samples, flank=150, best_site=False):
+    store = AppendStore(out_dir, "HolomiRA_results")
+    rnaup_dir = os.path.join(out_dir, "RNAup")
+    finalresults = os.path.join(out_dir, "rnahybrid", "finalresults.txt")
+    per_sample = {sample: os.path.join(out_dir, "rnahybrid", f"{sample}_finalresults.tsv") for sample in samples}
+    signatures = {sample: file_signature(per_sample[sample], os.path.join(rnaup_dir, sample, ".done"))
+                  for sample in samples}
+    added, rebuild = store.pending(signatures)
+
+    def run_merge(finalresults_path, output_dir, merged_samples):
+        subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "merge_rnaup_results.py"),
+                        rnaup_dir, finalresults_path, output_dir, str(dg_cutoff), str(threads), str(memory_mb),
+                        "--flank", str(flank)] + (["--best-site"] if best_site else []) + ["--samples"] + merged_samples,
+                       check=True)
+
+    if not rebuild and added:
+        # The new rows, with the header of finalresults.txt (the samples' own header lines are rows of it)
+        delta_dir = store.path("delta")
+        os.makedirs(delta_dir, exist_ok=True)
+        delta_finalresults = os.path.join(delta_dir, "finalresults.txt")
+        with open(delta_finalresults, "w") as out:
+            out.write(read_header(finalresults))
+            for sample in added:
+                with open(per_sample[sample]) as handle:
+                    shutil.copyfileobj(handle, out)
+        run_merge(delta_finalresults, delta_dir, added)
+        appended = all([append_table(store.path(name), os.path.join(delta_dir, name))
+                        for name in list(MERGED) + [SUMMARY_COUNTS]])
+        shutil.rmtree(delta_dir)
+        if not appended:
+            print("Column layout of the new samples differs from the stored results; merging all samples")
+            store.reset()
+            added, rebuild = list(signatures), True
+    if rebuild:
+        run_merge(finalresults, store.dir, added)
+    sort_summary(store)
+
+    store.commit({sample: signatures[sample] for sample in added})
+    for name, folder in MERGED.items():
+        store.publish(name, os.path.join(out_dir, folder, name))
+    print(f"HolomiRA_results: {'rebuilt from' if rebuild else 'appended'} {len(added)} samples")
+
+
+if __name__ == "__main__":
+    best_site = "--best-site" in sys.argv
+    args = [arg for arg in sys.argv if arg != "--best-site"]
+    if len(args) < 7 or args[1] != "merge":
+        print("Usage: append_store.py merge <out_dir> <sample_tab> <dG_cutoff> <threads> <memory_mb> [flank] [--best-site]")
+        sys.exit(1)
+    flank = int(args[7]) if len(args) > 7 else 150
+    merge(args[2], float(args[4]), int(args[5]), int(args[6]), load_samples(args[3]), flank, best_site)
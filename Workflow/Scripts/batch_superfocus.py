@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import glob
+import shutil
+import tempfile
+import subprocess
+from pathlib import Path
+from collections import defaultdict
+
+from superfocus_app.superfocus import (is_wanted_file, get_subsystems, get_denominators, aggregate_level,
+                                       add_relative_abundance, write_results, write_binning)
+from superfocus_app.do_alignment import parse_alignments
+from stage_profile import StageProfile
+from progress import ProgressReporter, watch_process, count_records
+
+# --- Input arguments ---
+if len(sys.argv) < 4:
+    print("Usage: batch_superfocus.py <output_dir> <threads> <block_size>")
+    sys.exit(1)
+
+out_dir = sys.argv[1]
+threads = sys.argv[2]
+block_size = sys.argv[3]
+profile = StageProfile("batch_superfocus_MAG")
+
+# --- SUPER-FOCUS defaults, as used by `superfocus -a diamond` ---
+ALIGNER = "diamond"
+DATABASE = "90"
+EVALUE = "0.00001"
+MINIMUM_IDENTITY = 60.0
+MINIMUM_ALIGNMENT = 15
+NORMALISE = 1
+
+if "SUPERFOCUS_DB" in os.environ:
+    WORK_DIRECTORY = Path(os.environ["SUPERFOCUS_DB"])
+else:
+    import superfocus_app
+    WORK_DIRECTORY = Path(superfocus_app.__file__).parents[0]
+
+function_dir = os.path.join(out_dir, "function")
+batch_dir = os.path.join(function_dir, "batched")
+os.makedirs(batch_dir, exist_ok=True)
+
+# --- Collect the query files of every MAGs_{environment} directory ---
+query_dirs = sorted(d for d in glob.glob(os.path.join(function_dir, "MAGs_*")) if os.path.isdir(d))
+queries = {}
+for query_dir in query_dirs:
+    files = is_wanted_file([Path(query_dir, f) for f in os.listdir(query_dir)])
+    if files:
+        queries[query_dir] = files
+    else:
+        print(f"No query files in {query_dir}, skipping")
+
+# --- Pool all queries into one tagged FASTA: ">{file index}|{read name}" ---
+all_files = [f for files in queries.values() for f in files]
+pooled_fasta = os.path.join(batch_dir, "pooled_queries.fasta")
+pooled_m8 = os.path.join(batch_dir, "pooled_alignments.m8")
+with open(pooled_fasta, "w") as out:
+    for index, query_file in enumerate(all_files):
+        with open(query_file) as handle:
+            for line in handle:
+                if line.startswith(">"):
+                    out.write(f">{index}|{line[1:]}")
+                else:
+                    out.write(line)
+profile.count("query_files", len(all_files))
+print(f"Pooled {len(all_files)} query files from {len(queries)} directories")
+
+# --- One DIAMOND search for all directories ---
+if all_files:
+    tmpdir = tempfile.mkdtemp(dir=os.environ.get("TMPDIR", "/tmp"))
+    diamond_blast = [
+        "diamond", "blastx",
+        "-d", f"{WORK_DIRECTORY}/db/static/diamond/{DATABASE}_clusters.db",
+        "-q", pooled_fasta,
+        "-o", pooled_m8,
+        "-f", "6",
+        "-t", tmpdir,
+        "-p", str(threads),
+        "-e", EVALUE,
+        "-b", str(block_size),
+    ]
+    print("Running:", " ".join(diamond_blast))
+    # Progress: share of the pooled queries DIAMOND has read (it reads them one block at a time)
+    progress = ProgressReporter("run_superfocus_MAG", "batched", count_records(pooled_fasta), "queries")
+    progress.phase = "diamond"
+    retcode = watch_process(subprocess.Popen(diamond_blast), progress, track_file=pooled_fasta)
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    if retcode != 0:
+        progress.fail()
+        print(f"ERROR: DIAMOND exited with code {retcode}")
+        sys.exit(retcode)
+    progress.update(progress.total, phase="tables")
+
+# --- Split hits back to the per-file alignments SUPER-FOCUS would have written ---
+alignment_names = [f"{query_file.parent}/{query_file.name}_alignments.m8" for query_file in all_files]
+handles = {}
+if all_files and os.path.exists(pooled_m8):
+    with open(pooled_m8, encoding="ISO-8859-1") as hits:
+        for line in hits:
+            index, hit = line.split("|", 1)
+            index = int(index)
+            if index not in handles:
+                handles[index] = open(alignment_names[index], "w", encoding="ISO-8859-1")
+            handles[index].write(hit)
+for handle in handles.values():
+    handle.close()
+
+# --- Parse alignments and write SUPER-FOCUS tables per directory ---
+subsystems_translation = get_subsystems(Path(WORK_DIRECTORY, "db/database_PKs.txt"))
+file_offset = 0
+for query_dir, query_files in queries.items():
+    results = defaultdict(list)
+    binning_reads = defaultdict(lambda: defaultdict(list))
+
+    for sample_position, temp_query in enumerate(query_files):
+        alignment_name = alignment_names[file_offset + sample_position]
+        if file_offset + sample_position not in handles:
+            continue
+        results, binning_reads = parse_alignments(alignment_name, results, NORMALISE, len(query_files),
+                                                  sample_position, MINIMUM_IDENTITY, MINIMUM_ALIGNMENT,
+                                                  subsystems_translation, ALIGNER, binning_reads, temp_query,
+                                                  False)
+    file_offset += len(query_files)
+
+    normalizer = get_denominators(results)
+    header_files = query_files + ["{} %".format(x) for x in query_files]
+
+    write_binning(binning_reads, "{}/output_binning.xls".format(query_dir), [query_dir], DATABASE, ALIGNER)
+
+    for level in [1, 2, 3]:
+        temp_header = ["Subsystem {}".format(level)] + header_files
+        temp_results = aggregate_level(results, level - 1, normalizer)
+        output_file = "{}/output_subsystem_level_{}.xls".format(query_dir, level)
+        write_results(temp_results, temp_header, output_file, [query_dir], DATABASE, ALIGNER)
+
+    temp_header = ["Subsystem Level 1", "Subsystem Level 2", "Subsystem Level 3", "Function"] + header_files
+    output_file = "{}/output_all_levels_and_function.xls".format(query_dir)
+    write_results(add_relative_abundance(results, normalizer), temp_header, output_file, [query_dir],
+                  DATABASE, ALIGNER)
+    print(f"SUPER-FOCUS tables written for {query_dir}")
+
+# --- Remove the pooled query set ---
+for temp_file in [pooled_fasta, pooled_m8]:
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
+
+if all_files:
+    progress.finish()
+print("Batched SUPER-FOCUS done.")
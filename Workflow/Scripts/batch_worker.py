@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+
+## HolomiRA: run the per-sample Python stages of many samples in one process
+#
+#   batch_worker.py prep <out_dir> <fasta_dir> <upstream> <downstream> <sample> [sample ...]
+#   batch_worker.py post <out_dir> <id_table> <ref_mir> [--storage-budget] [--top-k <k> <gene|window> <window_nt>]
+#                        [--flank <nt>] [--best-site <nt>] <sample> [sample ...]
+#
+# prep : five_prime (get_fiveprime.py)
+# post : format_rnahybrid -> get_indiv_metrics -> extract_significant_binding_windows ->
+#        prepare_rnaup_inputs, sample after sample
+# Each stage is the function of its script, so the outputs are the same as those of the per-sample
+# rules. pandas, Biopython and pybedtools are imported once per batch, and the inputs every sample
+# shares (taxonomy table, miRNA FASTA) are parsed once. The Snakefile calls this worker when
+# `batch_size` is set; each stage still writes its own profiling record per sample.
+
+if len(sys.argv) < 3 or sys.argv[1] not in ("prep", "post"):
+    print("Usage: batch_worker.py prep <out_dir> <fasta_dir> <upstream> <downstream> <sample> [sample ...]\n"
+          "       batch_worker.py post <out_dir> <id_table> <ref_mir> [--storage-budget] "
+          "[--top-k <k> <gene|window> <window_nt>] [--flank <nt>] [--best-site <nt>] <sample> [sample ...]")
+    sys.exit(1)
+
+mode = sys.argv[1]
+args = [arg for arg in sys.argv[2:] if arg != "--storage-budget"]
+storage_budget = "--storage-budget" in sys.argv[2:]
+# --- Top-k binding sites per (miRNA, gene) or (miRNA, contig window), see rnahybrid_format.py ---
+top_k = (0, "gene", 1000)
+if "--top-k" in args:
+    at = args.index("--top-k")
+    top_k = (int(args[at + 1]), args[at + 2], int(args[at + 3]))
+    del args[at:at + 4]
+# --- Flank of the RNAup binding windows, see generate_extended_binding_windows.py ---
+flank = 150
+if "--flank" in args:
+    at = args.index("--flank")
+    flank = int(args[at + 1])
+    del args[at:at + 2]
+# --- RNAup best-site mode and its distance, see prepare_rnaup_inputs.py ---
+best_site_distance = None
+if "--best-site" in args:
+    at = args.index("--best-site")
+    best_site_distance = int(args[at + 1])
+    del args[at:at + 2]
+started = time.time()
+
+if mode == "prep":
+    from get_fiveprime import get_fiveprime
+
+    out_dir, fasta_dir, upstream, downstream = args[0], args[1], int(args[2]), int(args[3])
+    samples = args[4:]
+    for sample in samples:
+        get_fiveprime(sample, fasta_dir, upstream, downstream, out_dir,
+                      f"{out_dir}/annotation/{sample}/{sample}_IDs.txt")
+
+else:
+    from rnahybrid_format import rnahybrid_format
+    from get_metrics import load_taxonomy, get_metrics
+    from generate_extended_binding_windows import extract_binding_windows
+    from prepare_rnaup_inputs import load_mirnas, prepare_rnaup_inputs
+
+    out_dir, id_table, ref_mir = args[0], args[1], args[2]
+    samples = args[3:]
+
+    # --- Shared inputs, parsed once for the whole batch ---
+    taxon = load_taxonomy(id_table)
+    mirnas = load_mirnas(ref_mir)
+
+    hits_suffix = "_putative_targets.tsv.gz" if storage_budget else "_putative_targets.tsv"
+    for sample in samples:
+        rnahybrid_format(sample, out_dir, f"{out_dir}/rnahybrid/{sample}{hits_suffix}", *top_k)
+        get_metrics(out_dir, taxon, sample)
+        finalresults = f"{out_dir}/rnahybrid/{sample}_finalresults.tsv"
+        extract_binding_windows(finalresults, f"{out_dir}/annotation/{sample}", f"{out_dir}/structure/{sample}/sig_hits",
+                                sample, flank)
+        prepare_rnaup_inputs(finalresults, mirnas, f"{out_dir}/structure/{sample}/sig_hits.fasta",
+                             os.path.join(out_dir, "RNAup", sample), best_site_distance)
+
+print(f"Batch {mode}: {len(samples)} samples in {time.time() - started:.1f} s")
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+from stage_profile import StageProfile
+from generate_extended_binding_windows import binding_window
+
+## HolomiRA: calibrate the RNAup window flank
+#
+#   calibrate_flank.py <out_dir> <ref_mir> [--flanks 50,75,100,150] [--sites 200] [--dg-cutoff -15]
+#
+# RNAup time grows about cubically with the window length (2 x flank + 1). This folds a random
+# sample of the run's binding sites (rnahybrid/finalresults.txt) at each flank, and compares each
+# flank with the largest one:
+#   s_per_fold, speedup      : RNAup time per fold and relative to the largest flank
+#   on_site_agreement        : fraction of sites whose interaction is on the site at both flanks
+#                              (the position filter of merge_rnaup_results.py)
+#   dG_pearson, dG_median_abs_diff : agreement of dG_total over the sites on-site at both flanks
+#   call_agreement           : fraction of sites kept/discarded alike (on site and dG_total <= cutoff)
+# The smallest flank with call_agreement >= --min-agreement and dG_median_abs_diff <= --max-dg-diff
+# is recommended. Written to {out_dir}/benchmarks/rnaup_flank_calibration.{tsv,json};
+# `rnaup_flank: auto` uses the recommended flank.
+
+ENERGY = re.compile(r"\(([-\d\.]+) = ([-\d\.]+) \+ ([-\d\.]+) \+ ([-\d\.]+)\)")
+COORDS = re.compile(r"(\d+),(\d+)\s+:\s+(\d+,\d+)")
+
+
+def recommended_flank(calibration_path, default):
+    """Flank recommended by a previous calibration, or default."""
+    if not os.path.exists(calibration_path):
+        return default
+    with open(calibration_path) as handle:
+        return int(json.load(handle)["recommended_flank"])
+
+
+def read_fasta(path):
+    sequences, name, chunks = {}, None, []
+    with open(path) as handle:
+        for line in handle:
+            if line.startswith(">"):
+                if name is not None:
+                    sequences[name] = "".join(chunks)
+                name, chunks = line[1:].split()[0], []
+            else:
+                chunks.append(line.strip())
+    if name is not None:
+        sequences[name] = "".join(chunks)
+    return sequences
+
+
+def sample_sites(out_dir, n_sites, seed):
+    """Distinct binding sites of the run, with the contig sequence they lie on."""
+    df = pd.read_csv(os.path.join(out_dir, "rnahybrid", "finalresults.txt"), sep="\t", dtype=str)
+    # The per-sample header lines of the aggregated file are not sites
+    df = df[df["MAG"] != "MAG"].drop_duplicates(subset=["miRNA", "Contig", "Start", "End"])
+    df = df.sample(n=min(n_sites, len(df)), random_state=seed) if len(df) else df
+    df["Start"] = df["Start"].astype(int)
+    df["End"] = df["End"].astype(int)
+    contigs = {}
+    for mag in df["MAG"].unique():
+        contigs.update(read_fasta(os.path.join(out_dir, "annotation", mag, f"{mag}.fna")))
+    df = df[df["Contig"].isin(contigs)]
+    return df.reset_index(drop=True), contigs
+
+
+def fold(work_dir, name, mirna_seq, target_seq):
+    """RNAup -b on one miRNA&window input, as run_rnaup.py does; returns (seconds, pos1, pos2, dG_total)."""
+    with open(os.path.join(work_dir, f"{name}.fa"), "w") as out:
+        out.write(f">{name}\n{mirna_seq}&{target_seq}\n")
+    started = time.perf_counter()
+    with open(os.path.join(work_dir, f"{name}.fa")) as fa:
+        result = subprocess.run(["RNAup", "-b"], stdin=fa, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                cwd=work_dir, text=True)
+    seconds = time.perf_counter() - started
+    lines = [line for line in result.stdout.splitlines() if line.strip()]
+    energy = ENERGY.search(lines[1]) if len(lines) > 1 else None
+    coords = COORDS.search(lines[1]) if len(lines) > 1 else None
+    if result.returncode != 0 or not (energy and coords):
+        return seconds, np.nan, np.nan, np.nan
+    return seconds, int(coords.group(1)), int(coords.group(2)), float(energy.group(1))
+
+
+def calibrate(out_dir, ref_mir, flanks, n_sites, dg_cutoff, seed=0):
+    """Per-site folds at every flank: one row per (site, flank)."""
+    sites, contigs = sample_sites(out_dir, n_sites, seed)
+    mirnas = read_fasta(ref_mir)
+    largest = max(flanks)
+    rows = []
+    work_dir = tempfile.mkdtemp(prefix="rnaup_flank_")
+    try:
+        for i, site in sites.iterrows():
+            sequence = contigs[site["Contig"]]
+            # Sites whose largest window runs past the contig end are skipped (bedtools skips them too)
+            if binding_window(site["Start"], site["End"], largest)[1] > len(sequence) or site["miRNA"] not in mirnas:
+                continue
+            for flank in flanks:
+                gff_start, gff_end, left = binding_window(site["Start"], site["End"], flank)
+                seconds, pos1, pos2, dg_total = fold(work_dir, f"site{i}_{flank}", mirnas[site["miRNA"]],
+                                                     sequence[gff_start - 1:gff_end])
+                on_site = pos1 > left and pos2 < left + (site["End"] - site["Start"] + 1)
+                rows.append({"site": i, "flank": flank, "seconds": seconds, "dG_total": dg_total,
+                             "on_site": bool(on_site), "kept": bool(on_site and dg_total <= dg_cutoff)})
+            for path in os.listdir(work_dir):
+                os.remove(os.path.join(work_dir, path))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return pd.DataFrame(rows, columns=["site", "flank", "seconds", "dG_total", "on_site", "kept"])
+
+
+def summarise(folds, flanks):
+    """Runtime and agreement with the largest flank, per flank."""
+    reference = folds[folds["flank"] == max(flanks)].set_index("site")
+    ref_seconds = reference["seconds"].mean()
+    table = []
+    for flank in sorted(flanks):
+        current = folds[folds["flank"] == flank].set_index("site")
+        both = current["on_site"] & reference["on_site"]
+        dg, ref_dg = current.loc[both, "dG_total"], reference.loc[both, "dG_total"]
+        table.append({
+            "flank": flank,
+            "window_nt": 2 * flank + 1,
+            "folds": len(current),
+            "s_per_fold": current["seconds"].mean(),
+            "speedup": ref_seconds / current["seconds"].mean() if len(current) else np.nan,
+            "on_site_agreement": (current["on_site"] == reference["on_site"]).mean(),
+            "dG_pearson": dg.corr(ref_dg) if both.sum() > 2 else np.nan,
+            "dG_median_abs_diff": (dg - ref_dg).abs().median() if both.any() else np.nan,
+            "call_agreement": (current["kept"] == reference["kept"]).mean(),
+        })
+    return pd.DataFrame(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare RNAup runtime and dG agreement across window flanks.")
+    parser.add_argument("out_dir")
+    parser.add_argument("ref_mir")
+    parser.add_argument("--flanks", default="50,75,100,150", help="comma-separated flanks in nt (default: 50,75,100,150)")
+    parser.add_argument("--sites", type=int, default=200, help="binding sites folded at each flank (default: 200)")
+    parser.add_argument("--dg-cutoff", type=float, default=-15, help="DGopen_cutoff of the run (default: -15)")
+    parser.add_argument("--min-agreement", type=float, default=0.95,
+                        help="minimum call agreement with the largest flank (default: 0.95)")
+    parser.add_argument("--max-dg-diff", type=float, default=1.0,
+                        help="maximum median |dG_total difference| in kcal/mol (default: 1.0)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    flanks = sorted({int(f) for f in args.flanks.split(",")})
+    profile = StageProfile("calibrate_rnaup_flank")
+    folds = calibrate(args.out_dir, args.ref_mir, flanks, args.sites, args.dg_cutoff, args.seed)
+    profile.count("folds", len(folds))
+    if folds.empty:
+        print("No binding sites to calibrate on; run the workflow up to rnahybrid/finalresults.txt first")
+        sys.exit(1)
+    table = summarise(folds, flanks)
+
+    # --- Smallest flank that reproduces the largest one ---
+    good = table[(table["call_agreement"] >= args.min_agreement) &
+                 ((table["dG_median_abs_diff"] <= args.max_dg_diff) | (table["flank"] == max(flanks)))]
+    recommended = int(good["flank"].min())
+
+    out_prefix = os.path.join(args.out_dir, "benchmarks", "rnaup_flank_calibration")
+    os.makedirs(os.path.dirname(out_prefix), exist_ok=True)
+    table.to_csv(f"{out_prefix}.tsv", sep="\t", index=False, float_format="%.4g")
+    with open(f"{out_prefix}.json", "w") as out:
+        json.dump({"recommended_flank": recommended, "reference_flank": max(flanks),
+                   "sites": int(folds["site"].nunique()), "dg_cutoff": args.dg_cutoff,
+                   "min_agreement": args.min_agreement, "max_dg_diff": args.max_dg_diff,
+                   "flanks": json.loads(table.to_json(orient="records"))}, out, indent=1)
+
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.3g}"))
+    print(f"\nRecommended flank: {recommended} nt (reference {max(flanks)} nt, {folds['site'].nunique()} sites)")
+    print(f"Written to {out_prefix}.tsv and {out_prefix}.json")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import numpy as np
+from resource_model import genome_nt, scan_pairs, fold_bytes, file_size, query_bytes
+
+## HolomiRA: calibrate the resource model from a finished run
+#
+# Reads {out_dir}/benchmarks/run_profile.json (see run_profile.py), recomputes each job's input
+# size for the rules with a size model, and fits peak memory and wall time as
+# intercept + slope * size. Rules without a size model get flat estimates (slope 0) from the
+# largest observed job. The fit is written to {out_dir}/benchmarks/resource_calibration.json.
+
+if len(sys.argv) < 4:
+    print("Usage: calibrate_resources.py <output_dir> <fasta_dir> <ref_mir>")
+    sys.exit(1)
+
+out_dir = sys.argv[1]
+fasta_dir = sys.argv[2]
+ref_mir = sys.argv[3]
+profile_path = os.path.join(out_dir, "benchmarks", "run_profile.json")
+calibration_path = os.path.join(out_dir, "benchmarks", "resource_calibration.json")
+
+# Job input size of the modelled rules, from the files the run left behind (job = sample ID,
+# environment for run_superfocus_MAG_env, all for the cohort-wide rules)
+function_dir = os.path.join(out_dir, "function")
+JOB_FEATURES = {
+    "annotate_prokka": lambda job: genome_nt(os.path.join(fasta_dir, f"{job}.fa")),
+    "find_targets": lambda job: scan_pairs(os.path.join(out_dir, "target_fasta", f"{job}_filtered.fa"), ref_mir),
+    "run_rnaup": lambda job: fold_bytes(os.path.join(out_dir, "RNAup", job)),
+    "run_superfocus_MAG_env": lambda job: query_bytes(function_dir, job),
+    "annotate_unique_cds": lambda job: file_size(os.path.join(function_dir, "unique", "unique_affected_cds.fasta")),
+    "batch_superfocus_MAG": lambda job: query_bytes(function_dir),
+}
+
+
+def fit(x, y):
+    """Non-negative (intercept, slope) of y over x; proportional fit when the line is ill-posed."""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if len(np.unique(x)) >= 3:
+        slope, intercept = np.polyfit(x, y, 1)
+        if slope >= 0 and intercept >= 0:
+            return [float(intercept), float(slope)]
+    positive = x > 0
+    if positive.any():
+        return [0.0, float(np.max(y[positive] / x[positive]))]
+    return [float(y.max()), 0.0]
+
+
+if not os.path.exists(profile_path):
+    print(f"No run profile found at {profile_path}; run run_profile.py first")
+    sys.exit(0)
+
+with open(profile_path) as handle:
+    jobs = json.load(handle)["jobs"]
+
+
+def cache_hit(job):
+    """Annotation restored from the shared cache (annotation_cache.py): not a Prokka run."""
+    record = os.path.join(out_dir, "benchmarks", "stages", "annotate_prokka", f"{job}.json")
+    if not os.path.exists(record):
+        return False
+    with open(record) as handle:
+        return json.load(handle).get("items", {}).get("cache_hit", 0) > 0
+
+
+# --- Group the measured jobs per rule ---
+by_rule = {}
+for job in jobs:
+    if job.get("wall_s") is None or job.get("max_rss_mb") is None:
+        continue
+    if job["rule"] == "annotate_prokka" and cache_hit(job["job"]):
+        continue
+    by_rule.setdefault(job["rule"], []).append(job)
+
+# --- Fit memory and wall time per rule ---
+rules = {}
+for rule, rule_jobs in sorted(by_rule.items()):
+    mem = [j["max_rss_mb"] for j in rule_jobs]
+    wall = [j["wall_s"] for j in rule_jobs]
+    if rule in JOB_FEATURES:
+        sizes = [JOB_FEATURES[rule](j["job"]) for j in rule_jobs]
+        measured = [i for i, size in enumerate(sizes) if size > 0]
+        if measured:
+            sizes = [sizes[i] for i in measured]
+            rules[rule] = {
+                "jobs": len(measured),
+                "mem_mb": fit(sizes, [mem[i] for i in measured]),
+                "runtime_s": fit(sizes, [wall[i] for i in measured]),
+            }
+            continue
+        print(f"[!] Inputs of {rule} are gone; using flat estimates")
+    rules[rule] = {"jobs": len(rule_jobs), "mem_mb": [max(mem), 0.0], "runtime_s": [max(wall), 0.0]}
+
+with open(calibration_path, "w") as out:
+    json.dump({"source": os.path.abspath(profile_path), "rules": rules}, out, indent=1)
+print(f"Resource calibration for {len(rules)} rules saved: {calibration_path}")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import glob
+import hashlib
+from stage_profile import StageProfile
+
+# --- Get the output directory from the command line arguments ---
+if len(sys.argv) < 2:
+    print("Usage: dedup_affected_cds.py <output_dir>")
+    sys.exit(1)
+
+out_dir = sys.argv[1]
+profile = StageProfile("dedup_affected_cds")
+function_dir = os.path.join(out_dir, "function")
+unique_dir = os.path.join(function_dir, "unique")
+os.makedirs(unique_dir, exist_ok=True)
+
+unique_fasta = os.path.join(unique_dir, "unique_affected_cds.fasta")
+occurrences_file = os.path.join(unique_dir, "cds_occurrences.tsv")
+
+
+def read_fasta(path):
+    """Yield (header, sequence) pairs from a FASTA file."""
+    header, chunks = None, []
+    with open(path) as handle:
+        for line in handle:
+            line = line.strip()
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, "".join(chunks)
+                header, chunks = line[1:].strip(), []
+            elif line:
+                chunks.append(line)
+    if header is not None:
+        yield header, "".join(chunks)
+
+
+# --- Collect the per-MAG FASTA files written by impacted.py ---
+# (per-miRNA files hold subsets of these CDS; they are derived from affected_cds_map.tsv)
+# Each entry: (level, environment, name, path)
+sources = []
+for env_dir in sorted(glob.glob(os.path.join(function_dir, "MAGs_*"))):
+    environment = os.path.basename(env_dir).replace("MAGs_", "", 1)
+    suffix = f"_{environment}.fasta"
+    for path in sorted(glob.glob(os.path.join(env_dir, f"merged_*{suffix}"))):
+        name = os.path.basename(path)[len("merged_"):-len(suffix)]
+        sources.append(("MAG", environment, name, path))
+
+print(f"Found {len(sources)} affected CDS files to deduplicate")
+
+# --- Hash every sequence; write each distinct sequence once ---
+seen_hashes = set()
+n_occurrences = 0
+with open(unique_fasta, "w") as fasta_out, open(occurrences_file, "w") as occ_out:
+    occ_out.write("Hash\tLevel\tEnvironment\tName\tFile\tHeader\n")
+    for level, environment, name, path in sources:
+        for header, sequence in read_fasta(path):
+            sequence = sequence.upper()
+            seq_hash = hashlib.sha1(sequence.encode()).hexdigest()
+            if seq_hash not in seen_hashes:
+                seen_hashes.add(seq_hash)
+                fasta_out.write(f">{seq_hash}\n{sequence}\n")
+            occ_out.write(f"{seq_hash}\t{level}\t{environment}\t{name}\t{os.path.basename(path)}\t{header}\n")
+            n_occurrences += 1
+
+profile.count("occurrences", n_occurrences)
+profile.count("unique", len(seen_hashes))
+print(f"Affected CDS occurrences: {n_occurrences}")
+print(f"Unique sequences to annotate: {len(seen_hashes)}")
+print(f"Unique FASTA: {unique_fasta}")
+print(f"Occurrence table: {occurrences_file}")
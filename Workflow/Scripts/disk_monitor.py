@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import threading
+
+## HolomiRA: disk high-water mark of a run
+#
+# The Snakefile starts a DiskMonitor in `onstart` and stops it in `onsuccess`/`onerror`. Every
+# `interval` seconds it measures the disk usage of the output directory (allocated blocks, per
+# top-level folder) and keeps the peak. On stop it writes:
+#   {out_dir}/benchmarks/disk_usage.tsv            : one line per sample (elapsed seconds, bytes)
+#   {out_dir}/benchmarks/disk_high_water_mark.json : peak usage, when it happened, per-folder breakdown
+# Run as a script it prints the current usage: disk_monitor.py <output_dir>
+
+
+def disk_usage(path):
+    """Allocated bytes under path, split by top-level entry."""
+    usage = {}
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            total = 0
+            for root, _, files in os.walk(entry.path):
+                for name in files:
+                    try:
+                        total += os.lstat(os.path.join(root, name)).st_blocks * 512
+                    except OSError:
+                        # Files retired between listing and stat
+                        pass
+            usage[entry.name] = total
+        else:
+            try:
+                usage[entry.name] = entry.stat(follow_symlinks=False).st_blocks * 512
+            except OSError:
+                pass
+    return usage
+
+
+def human(n_bytes):
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if n_bytes < 1024 or unit == "TB":
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+
+
+class DiskMonitor(threading.Thread):
+    def __init__(self, out_dir, interval=60):
+        super().__init__(daemon=True)
+        self.out_dir = out_dir
+        self.interval = interval
+        self.samples = []
+        self.peak = {"bytes": 0, "elapsed_s": 0.0, "folders": {}}
+        self.started = time.time()
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        if not os.path.isdir(self.out_dir):
+            return
+        usage = disk_usage(self.out_dir)
+        total = sum(usage.values())
+        elapsed = time.time() - self.started
+        self.samples.append((elapsed, total))
+        if total >= self.peak["bytes"]:
+            self.peak = {"bytes": total, "elapsed_s": elapsed, "folders": usage}
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.sample()
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        """Stop sampling, take a last measurement and write the report."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.sample()
+        bench_dir = os.path.join(self.out_dir, "benchmarks")
+        os.makedirs(bench_dir, exist_ok=True)
+        with open(os.path.join(bench_dir, "disk_usage.tsv"), "w") as out:
+            out.write("elapsed_s\tbytes\n")
+            for elapsed, total in self.samples:
+                out.write(f"{elapsed:.0f}\t{total}\n")
+        final = self.samples[-1][1] if self.samples else 0
+        with open(os.path.join(bench_dir, "disk_high_water_mark.json"), "w") as out:
+            json.dump({"high_water_mark_bytes": self.peak["bytes"],
+                       "at_elapsed_s": round(self.peak["elapsed_s"]),
+                       "final_bytes": final,
+                       "interval_s": self.interval,
+                       "folders_at_peak": self.peak["folders"]}, out, indent=1)
+        print(f"Disk high-water mark of {self.out_dir}: {human(self.peak['bytes'])} "
+              f"after {self.peak['elapsed_s'] / 60:.0f} min (final: {human(final)})")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: disk_monitor.py <output_dir>")
+        sys.exit(1)
+    usage = disk_usage(sys.argv[1])
+    for folder, n_bytes in sorted(usage.items(), key=lambda item: -item[1]):
+        print(f"{human(n_bytes):>10}  {folder}")
+    print(f"{human(sum(usage.values())):>10}  total")
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import csv
+import glob
+from pathlib import Path
+from collections import defaultdict
+
+from superfocus_app.superfocus import aggregate_level, add_relative_abundance, get_denominators, write_results
+
+# --- Get the output directory, the levels to write SUPER-FOCUS tables for and the annotation source ---
+# unique      : the annotate-once run of superfocus_mode: dedup (function/unique/)
+# environments: the per-environment runs of superfocus_mode: per_environment or batched (function/MAGs_*/)
+if len(sys.argv) < 2:
+    print("Usage: fanout_superfocus.py <output_dir> [MAG,miRNA] [unique|environments]")
+    sys.exit(1)
+
+out_dir = sys.argv[1]
+table_levels = sys.argv[2].split(",") if len(sys.argv) > 2 else ["MAG", "miRNA"]
+source = sys.argv[3] if len(sys.argv) > 3 else "unique"
+if source not in ("unique", "environments"):
+    print(f"Unknown annotation source: {source} (expected unique or environments)")
+    sys.exit(1)
+function_dir = os.path.join(out_dir, "function")
+unique_dir = os.path.join(function_dir, "unique")
+binning_file = os.path.join(unique_dir, "output_binning.xls")
+occurrences_file = os.path.join(unique_dir, "cds_occurrences.tsv")
+mapping_file = os.path.join(function_dir, "affected_cds_map.tsv")
+abundance_file = os.path.join(function_dir, "functional_abundance.tsv")
+
+DATABASE = "90"
+ALIGNER = "diamond"
+NORMALISE = True  # SUPER-FOCUS default (-n 1)
+
+
+def read_binning(path, key_of):
+    """Per-sequence annotations of a SUPER-FOCUS binning file, keyed by key_of(sample name, read name)."""
+    annotations = defaultdict(list)
+    with open(path, encoding="ISO-8859-1") as handle:
+        reader = csv.reader(handle, delimiter="\t")
+        for _ in range(5):
+            next(reader, None)
+        for row in reader:
+            if len(row) < 6:
+                continue
+            levels = "\t".join(row[2:6])
+            key = key_of(row[0], row[1])
+            if levels not in annotations[key]:
+                annotations[key].append(levels)
+    return annotations
+
+
+# --- Read the per-sequence annotations (SUPER-FOCUS binning) ---
+# Binning rows: Sample name, Read Name, Level 1, Level 2, Level 3, Function, Identity, Length, E-value
+# groups[(level, environment)][file] -> list of (name, annotation key)
+groups = defaultdict(lambda: defaultdict(list))
+# (environment, MAG, CDS header) -> annotation key: sequence hash (unique) or the CDS itself (environments)
+key_by_cds = {}
+annotations = defaultdict(list)
+if source == "unique":
+    # Keyed by sequence hash; the occurrence table maps every affected CDS to its hash
+    if os.path.exists(binning_file) and os.path.getsize(binning_file) > 0:
+        annotations = read_binning(binning_file, lambda sample, read: read)
+    else:
+        print(f"[!] No binning results found at {binning_file}")
+
+    with open(occurrences_file) as handle:
+        reader = csv.DictReader(handle, delimiter="\t")
+        for row in reader:
+            groups[(row["Level"], row["Environment"])][row["File"]].append((row["Name"], row["Hash"]))
+            key_by_cds[(row["Environment"], row["Name"], row["Header"])] = row["Hash"]
+else:
+    # Keyed by (environment, MAG, read name), as the per-environment runs report them; the query files
+    # list every affected CDS, so files whose CDS have no hit still get their (empty) column
+    for env_dir in sorted(glob.glob(os.path.join(function_dir, "MAGs_*"))):
+        environment = os.path.basename(env_dir).replace("MAGs_", "", 1)
+        suffix = f"_{environment}.fasta"
+        for path in sorted(glob.glob(os.path.join(env_dir, f"merged_*{suffix}"))):
+            file_name = os.path.basename(path)
+            name = file_name[len("merged_"):-len(suffix)]
+            with open(path) as handle:
+                for line in handle:
+                    if line.startswith(">"):
+                        # SUPER-FOCUS names a read after the first word of its FASTA header
+                        key = (environment, name, line[1:].split()[0])
+                        key_by_cds[key] = key
+                        groups[("MAG", environment)][file_name].append((name, key))
+        env_binning = os.path.join(env_dir, "output_binning.xls")
+        if os.path.exists(env_binning) and os.path.getsize(env_binning) > 0:
+            env_annotations = read_binning(env_binning, lambda sample, read: (os.path.basename(sample), read))
+            for (file_name, read), levels in env_annotations.items():
+                annotations[(environment, file_name[len("merged_"):-len(suffix)], read)] = levels
+
+print(f"Annotated {'unique sequences' if source == 'unique' else 'affected CDS'}: {len(annotations)}")
+
+
+def read_contribution(key):
+    """Counts one affected CDS adds to its group, as SUPER-FOCUS would count one read."""
+    levels = annotations.get(key, [])
+    if NORMALISE and len(levels) > 1:
+        return {level: 1 / len(levels) for level in levels}
+    return {level: 1 for level in levels}
+
+
+def write_superfocus_tables(query_dir, file_names, results):
+    """Write the level tables SUPER-FOCUS would have written for query_dir."""
+    query_files = [Path(query_dir, f) for f in file_names]
+    header_files = query_files + ["{} %".format(x) for x in query_files]
+    normalizer = get_denominators(results)
+
+    for sub_level in [1, 2, 3]:
+        temp_header = ["Subsystem {}".format(sub_level)] + header_files
+        temp_results = aggregate_level(results, sub_level - 1, normalizer)
+        output_file = "{}/output_subsystem_level_{}.xls".format(query_dir, sub_level)
+        write_results(temp_results, temp_header, output_file, [str(query_dir)], DATABASE, ALIGNER)
+
+    temp_header = ["Subsystem Level 1", "Subsystem Level 2", "Subsystem Level 3", "Function"] + header_files
+    output_file = "{}/output_all_levels_and_function.xls".format(query_dir)
+    write_results(add_relative_abundance(results, normalizer), temp_header, output_file, [str(query_dir)],
+                  DATABASE, ALIGNER)
+
+
+# --- Derive per-miRNA groups by joining the miRNA -> CDS mapping from impacted.py ---
+n_missing = 0
+if os.path.exists(mapping_file):
+    seen_cds = set()
+    with open(mapping_file) as handle:
+        reader = csv.DictReader(handle, delimiter="\t")
+        for row in reader:
+            mirna, environment = row["miRNA"], row["Environment"]
+            cds = (mirna, environment, row["MAG"], row["Header"])
+            if cds in seen_cds:
+                continue
+            seen_cds.add(cds)
+            header = row["Header"] if source == "unique" else row["Header"].split()[0]
+            key = key_by_cds.get((environment, row["MAG"], header))
+            if key is None:
+                n_missing += 1
+                continue
+            file_name = f"merged_miRNA_{mirna}_{environment}.fasta"
+            groups[("miRNA", environment)][file_name].append((mirna, key))
+else:
+    print(f"[!] miRNA to CDS mapping not found: {mapping_file}")
+
+if n_missing:
+    print(f"[!] {n_missing} miRNA target CDS without an extracted sequence were skipped")
+
+# --- Fan annotations back out, one count column per original query file ---
+abundance_rows = []
+for (level, environment), files in sorted(groups.items()):
+    file_names = sorted(files)
+    results = {}
+    for index, file_name in enumerate(file_names):
+        for name, key in files[file_name]:
+            for levels, value in read_contribution(key).items():
+                if levels not in results:
+                    results[levels] = [0] * len(file_names)
+                results[levels][index] += value
+
+    for levels, counts in sorted(results.items()):
+        for index, file_name in enumerate(file_names):
+            if counts[index] > 0:
+                name = files[file_name][0][0]
+                abundance_rows.append([level, environment, name] + levels.split("\t") + [counts[index]])
+
+    # --- Write the SUPER-FOCUS tables a per-directory run would have written ---
+    if level not in table_levels or not results:
+        continue
+
+    prefix = "MAGs" if level == "MAG" else "miRNA"
+    write_superfocus_tables(Path(function_dir, f"{prefix}_{environment}"), file_names, results)
+    print(f"SUPER-FOCUS tables written for {prefix}_{environment} ({len(file_names)} {level}s)")
+
+# --- Save the long-format abundance table for every MAG and miRNA ---
+with open(abundance_file, "w", newline="") as handle:
+    writer = csv.writer(handle, delimiter="\t", lineterminator="\n")
+    writer.writerow(["Level", "Environment", "Name", "Subsystem Level 1", "Subsystem Level 2",
+                     "Subsystem Level 3", "Function", "Count"])
+    writer.writerows(abundance_rows)
+
+print(f"Functional abundance table saved: {abundance_file}")
@@ -2,104 +2,129 @@
 import sys
 import os
 import pandas as pd
+from stage_profile import StageProfile
 
-# --- Inputs ---
-finalresults = sys.argv[1]        # finalresults.txt
-fasta_dir = sys.argv[2]           # path to .fna files
-output_prefix = sys.argv[3]       # prefix for output (e.g., OUT_DIR/structure/sig_hits)
-window = 150                      # nt upstream and downstream
-
-# --- Load table ---
-df = pd.read_csv(finalresults, sep="\t", comment="#").dropna(how="all")
-
-# --- Validate required columns ---
-required_cols = ["Contig", "Start", "End", "miRNA", "MAG"]
-if not all(col in df.columns for col in required_cols):
-    print("? ERROR: Missing required columns in finalresults.txt")
-    sys.exit(1)
-
-# --- Sanitize positions ---
-df["Start"] = pd.to_numeric(df["Start"], errors="coerce")
-df["End"] = pd.to_numeric(df["End"], errors="coerce")
-df = df.dropna(subset=["Start", "End"])
-
-# --- Remove duplicated GFF target IDs ---
-df["Target_ID"] = df.apply(lambda row: f"{row['miRNA']}_{row['MAG']}", axis=1)
-df = df.drop_duplicates(subset=["Contig", "Target_ID", "Start", "End"])
-
-# --- Create GFF entries (no strand info) ---
-gff_entries = []
-for _, row in df.iterrows():
-    contig = row["Contig"]
-    start = int(row["Start"])
-    end = int(row["End"])
-    name = row["Target_ID"]
+window = 150                      # default flank, nt upstream and downstream of the site centre
 
+
+def binding_window(start, end, flank=window):
+    """1-based GFF window around a site and the nt of it left of the site centre (less than flank at a contig start).
+
+    RNAup positions pos1..pos2 fall on the site when pos1 > left and pos2 < left + (end - start + 1)."""
     center = (start + end) // 2
-    gff_start = max(1, center - window)
-    gff_end = center + window
-
-    gff_line = [
-        contig,
-        "RNAhybrid",
-        "target_site",
-        str(gff_start),
-        str(gff_end),
-        ".",
-        ".",
-        ".",
-        f"ID={name}"
-    ]
-    gff_entries.append("\t".join(gff_line))
-
-# --- Save GFF ---
-gff_out = f"{output_prefix}.gff"
-os.makedirs(os.path.dirname(gff_out), exist_ok=True)
-with open(gff_out, "w") as f:
-    for line in gff_entries:
-        f.write(line + "\n")
-#print(f"? GFF written: {gff_out}")
-
-# --- Identify .fna files by contig ---
-unique_contigs = set(df["Contig"])
-contig_to_fasta = {}
-
-for root, _, files in os.walk(fasta_dir):
-    for file in files:
-        if file.endswith(".fna"):
-            full_path = os.path.join(root, file)
-            with open(full_path) as f:
-                for line in f:
-                    if line.startswith(">"):
-                        header = line[1:].strip().split()[0]
-                        if header not in contig_to_fasta:
-                            contig_to_fasta[header] = full_path
-
-# --- Merge FASTA files that match contigs ---
-matched_fastas = set()
-for contig in unique_contigs:
-    if contig in contig_to_fasta:
-        matched_fastas.add(contig_to_fasta[contig])
-    else:
-        print(f" Contig not found in FASTA files: {contig}")
-
-if matched_fastas:
-    merged_fasta = f"{output_prefix}_merged.fna"
-    seen = set()
-    with open(merged_fasta, "w") as out:
-        for fasta in matched_fastas:
-            with open(fasta) as f:
-                for record in f.read().split(">")[1:]:
-                    header = record.splitlines()[0].strip().split()[0]
-                    if header not in seen:
-                        seen.add(header)
-                        out.write(">" + record)
-    print(f"Merged FASTA: {merged_fasta}")
-
-# --- Run bedtools (without -s to ignore strand) ---
-    fasta_out = f"{output_prefix}.fasta"
-    cmd = f"bedtools getfasta -fi {merged_fasta} -bed {gff_out} -fo {fasta_out}"
-    os.system(cmd)
-    print(f"FASTA written: {fasta_out}")
-else:
-    print("No matching contigs found in .fna files.")
+    gff_start = max(1, center - flank)
+    return gff_start, center + flank, center - gff_start
+
+
+def extract_binding_windows(finalresults, fasta_dir, output_prefix, sample=None, flank=window):
+    """GFF of the windows around the significant binding sites ({output_prefix}.gff) and their sequences ({output_prefix}.fasta)."""
+    with StageProfile("extract_significant_binding_windows", sample) as profile:
+        # --- Load table ---
+        df = pd.read_csv(finalresults, sep="\t", comment="#").dropna(how="all")
+
+        # --- Validate required columns ---
+        required_cols = ["Contig", "Start", "End", "miRNA", "MAG"]
+        if not all(col in df.columns for col in required_cols):
+            print("? ERROR: Missing required columns in finalresults.txt")
+            sys.exit(1)
+
+        # --- Sanitize positions ---
+        df["Start"] = pd.to_numeric(df["Start"], errors="coerce")
+        df["End"] = pd.to_numeric(df["End"], errors="coerce")
+        df = df.dropna(subset=["Start", "End"])
+
+        # --- Remove duplicated GFF target IDs ---
+        df["Target_ID"] = df.apply(lambda row: f"{row['miRNA']}_{row['MAG']}", axis=1)
+        df = df.drop_duplicates(subset=["Contig", "Target_ID", "Start", "End"])
+
+        # --- Create GFF entries (no strand info) ---
+        gff_entries = []
+        for _, row in df.iterrows():
+            contig = row["Contig"]
+            start = int(row["Start"])
+            end = int(row["End"])
+            name = row["Target_ID"]
+
+            gff_start, gff_end, _ = binding_window(start, end, flank)
+
+            gff_line = [
+                contig,
+                "RNAhybrid",
+                "target_site",
+                str(gff_start),
+                str(gff_end),
+                ".",
+                ".",
+                ".",
+                f"ID={name}"
+            ]
+            gff_entries.append("\t".join(gff_line))
+
+        # --- Save GFF ---
+        gff_out = f"{output_prefix}.gff"
+        os.makedirs(os.path.dirname(gff_out), exist_ok=True)
+        with open(gff_out, "w") as f:
+            for line in gff_entries:
+                f.write(line + "\n")
+        #print(f"? GFF written: {gff_out}")
+        profile.count("windows", len(gff_entries))
+
+        # --- Identify .fna files by contig ---
+        unique_contigs = set(df["Contig"])
+        contig_to_fasta = {}
+
+        for root, _, files in os.walk(fasta_dir):
+            for file in files:
+                if file.endswith(".fna"):
+                    full_path = os.path.join(root, file)
+                    with open(full_path) as f:
+                        for line in f:
+                            if line.startswith(">"):
+                                header = line[1:].strip().split()[0]
+                                if header not in contig_to_fasta:
+                                    contig_to_fasta[header] = full_path
+
+        # --- Merge FASTA files that match contigs ---
+        matched_fastas = set()
+        for contig in unique_contigs:
+            if contig in contig_to_fasta:
+                matched_fastas.add(contig_to_fasta[contig])
+            else:
+                print(f" Contig not found in FASTA files: {contig}")
+
+        fasta_out = f"{output_prefix}.fasta"
+        if len(matched_fastas) == 1:
+            # --- Single genome (per-sample run): use its FASTA directly ---
+            merged_fasta = next(iter(matched_fastas))
+        elif matched_fastas:
+            merged_fasta = f"{output_prefix}_merged.fna"
+            seen = set()
+            with open(merged_fasta, "w") as out:
+                for fasta in matched_fastas:
+                    with open(fasta) as f:
+                        for record in f.read().split(">")[1:]:
+                            header = record.splitlines()[0].strip().split()[0]
+                            if header not in seen:
+                                seen.add(header)
+                                out.write(">" + record)
+            print(f"Merged FASTA: {merged_fasta}")
+
+        # --- Run bedtools (without -s to ignore strand) ---
+        if matched_fastas:
+            cmd = f"bedtools getfasta -fi {merged_fasta} -bed {gff_out} -fo {fasta_out}"
+            os.system(cmd)
+            print(f"FASTA written: {fasta_out}")
+        else:
+            # --- MAGs without significant hits still get an (empty) window FASTA ---
+            open(fasta_out, "w").close()
+            print("No matching contigs found in .fna files.")
+
+
+if __name__ == "__main__":
+    # --- Inputs ---
+    finalresults = sys.argv[1]        # finalresults.txt
+    fasta_dir = sys.argv[2]           # path to .fna files
+    output_prefix = sys.argv[3]       # prefix for output (e.g., OUT_DIR/structure/sig_hits)
+    sample = sys.argv[4] if len(sys.argv) > 4 else None  # MAG ID when run per sample
+    flank = int(sys.argv[5]) if len(sys.argv) > 5 else window  # nt on each side of the site centre
+    extract_binding_windows(finalresults, fasta_dir, output_prefix, sample, flank)
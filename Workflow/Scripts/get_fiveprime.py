@@ -5,32 +5,44 @@ from pybedtools import BedTool
 from pybedtools import featurefuncs
 import os
 import pysam
+from stage_profile import StageProfile
 
-# --- incluir variáveis do bash ---
-sample = sys.argv[1]
-fasta_dir = sys.argv[2]
-upstream = int(sys.argv[3])
-downstream = int(sys.argv[4])
-out_dir=sys.argv[5]
-gff=sys.argv[6]
 
+def get_fiveprime(sample, fasta_dir, upstream, downstream, out_dir, gff):
+    """Upstream/downstream windows around the CDS starts of one MAG ({sample}_filtered.fa) and the CDS ({sample}_CDS.fa)."""
+    with StageProfile("five_prime", sample) as profile:
+        a=BedTool(gff)
+        fasta=f"{fasta_dir}/{sample}.fa"
 
-a=BedTool(gff)
-fasta=f"{fasta_dir}/{sample}.fa"
+        b=a.each(pybedtools.featurefuncs.five_prime, upstream, downstream, add_to_name=None, genome=None).saveas(f"{out_dir}/annotation/{sample}/{sample}_cds_fiveprime.gff")
+        profile.count("cds", b.count())
 
-b=a.each(pybedtools.featurefuncs.five_prime, upstream, downstream, add_to_name=None, genome=None).saveas(f"{out_dir}/annotation/{sample}/{sample}_cds_fiveprime.gff")
+        input_gff = f"{out_dir}/annotation/{sample}/{sample}_cds_fiveprime.gff"
+        fasta = f"{out_dir}/annotation/{sample}/{sample}.fna"
+        output_fasta = f"{out_dir}/target_fasta/{sample}_filtered.fa"
+        # bedtools warnings go next to the sample's annotation, not into the working directory
+        warnings_file = f"{out_dir}/annotation/{sample}/{sample}_getfasta_fiveprime.log"
 
-input_gff = f"{out_dir}/annotation/{sample}/{sample}_cds_fiveprime.gff"
-fasta = f"{out_dir}/annotation/{sample}/{sample}.fna"
-output_fasta = f"{out_dir}/target_fasta/{sample}_filtered.fa"
-warnings_file = "warnings.log"
+        command = f"bedtools getfasta -s -fo {output_fasta} -fi {fasta} -bed {input_gff} 2> {warnings_file}"
+        os.system(command)
 
-command = f"bedtools getfasta -s -fo {output_fasta} -fi {fasta} -bed {input_gff} 2> {warnings_file}"
-os.system(command)
+        input_gff2=gff
+        output_fasta = f"{out_dir}/target_fasta/{sample}_CDS.fa"
+        warnings_file = f"{out_dir}/annotation/{sample}/{sample}_getfasta_cds.log"
 
-input_gff2=gff
-output_fasta = f"{out_dir}/target_fasta/{sample}_CDS.fa"
-warnings_file = "warnings2.log"
+        command2 = f"bedtools getfasta -s -fo {output_fasta} -fi {fasta} -bed {input_gff2} 2> {warnings_file}"
+        os.system(command2)
 
-command2 = f"bedtools getfasta -s -fo {output_fasta} -fi {fasta} -bed {input_gff2} 2> {warnings_file}"
-os.system(command2)
\ No newline at end of file
+        # Temporary BED files of this sample; a batch worker would otherwise accumulate them
+        pybedtools.cleanup()
+
+
+if __name__ == "__main__":
+    # --- incluir variáveis do bash ---
+    sample = sys.argv[1]
+    fasta_dir = sys.argv[2]
+    upstream = int(sys.argv[3])
+    downstream = int(sys.argv[4])
+    out_dir=sys.argv[5]
+    gff=sys.argv[6]
+    get_fiveprime(sample, fasta_dir, upstream, downstream, out_dir, gff)
@@ -4,32 +4,50 @@ import numpy as np
 import sys
 import os
 from os import system
+from stage_profile import StageProfile
 
-out_dir=sys.argv[1]
-id=sys.argv[2]
-file=sys.argv[3]
-list0=sys.argv[4]
-
-list=pd.read_csv(list0, sep="\t")
-
-for index,row in list.iterrows():
-    MAG_ID=row["SampleID"]
-    #print(index)
-
-    #print(f"Creating {MAG_ID} final results file")
-    a=pd.read_csv(f'{out_dir}/rnahybrid/{MAG_ID}_bsites.tsv', sep="\t").drop_duplicates()
-    taxon=pd.read_csv(id, sep="\t", names=["sample", "Taxonomy", "Environment"])
-    a_taxon=pd.merge(a, taxon, how="inner", on="sample").drop_duplicates()
-    names={ 'sample' : 'MAG',
-            'seq' : 'Contig',
-            'start': 'Start',
-            'end': 'End',
-            'mir': 'miRNA',
-            'ID' : 'Locus_tag',
-            'mfe': 'MFE',
-            'p': 'Pvalue',
-            'gene': 'Gene',
-            }
-
-    a_taxon.rename(columns=names,inplace=True)
-    a_taxon.to_csv(f"{out_dir}/rnahybrid/{MAG_ID}_finalresults.tsv", sep="\t", index=None)
\ No newline at end of file
+
+def load_taxonomy(id):
+    """Taxonomy and environment of every MAG (the `id` metadata table)."""
+    return pd.read_csv(id, sep="\t", names=["sample", "Taxonomy", "Environment"])
+
+
+def get_metrics(out_dir, taxon, MAG_ID):
+    """Add taxonomy and environment to the binding sites of one MAG ({MAG_ID}_finalresults.tsv)."""
+    with StageProfile("get_indiv_metrics", MAG_ID) as profile:
+        #print(f"Creating {MAG_ID} final results file")
+        a=pd.read_csv(f'{out_dir}/rnahybrid/{MAG_ID}_bsites.tsv', sep="\t").drop_duplicates()
+        a_taxon=pd.merge(a, taxon, how="inner", on="sample").drop_duplicates()
+        names={ 'sample' : 'MAG',
+                'seq' : 'Contig',
+                'start': 'Start',
+                'end': 'End',
+                'mir': 'miRNA',
+                'ID' : 'Locus_tag',
+                'mfe': 'MFE',
+                'p': 'Pvalue',
+                'gene': 'Gene',
+                }
+
+        a_taxon.rename(columns=names,inplace=True)
+        profile.count("rows", len(a_taxon))
+        a_taxon.to_csv(f"{out_dir}/rnahybrid/{MAG_ID}_finalresults.tsv", sep="\t", index=None)
+        return len(a_taxon)
+
+
+if __name__ == "__main__":
+    out_dir=sys.argv[1]
+    id=sys.argv[2]
+    file=sys.argv[3]
+    list0=sys.argv[4]
+
+    # --- One MAG per job; a sample table instead of a MAG ID processes every sample ---
+    if os.path.isfile(list0):
+        samples=pd.read_csv(list0, sep="\t")["SampleID"].to_list()
+    else:
+        samples=[list0]
+
+    taxon=load_taxonomy(id)
+
+    for MAG_ID in samples:
+        get_metrics(out_dir, taxon, MAG_ID)
@@ -7,23 +7,24 @@ import glob
 import pandas as pd
 import subprocess
 import warnings
+from stage_profile import StageProfile
 
 # --- Get input file and output directory from command-line arguments ---
+# With --append (append mode, see append_store.py) only the MAGs added to the results since the
+# last run are extracted, and their sequences are appended to the existing miRNA FASTA files
 if len(sys.argv) < 3:
-    print("Usage: impacted.py <input_file> <output_dir>")
+    print("Usage: impacted.py <input_file> <output_dir> [--append]")
     sys.exit(1)
 
 input_file = sys.argv[1]
 out_dir = sys.argv[2]
+append = "--append" in sys.argv[3:]
+profile = StageProfile("impacted")
 
 # --- Create output directory if it doesn't exist ---
 output_dir_function = os.path.join(out_dir, "function")
 os.makedirs(output_dir_function, exist_ok=True)
 
-# --- Initialize dictionaries to store contigs per miRNA and MAGs per environment ---
-contig_sets_by_mirna = {}
-mag_sets_by_environment = {}
-
 print(f"Reading input file: {input_file}")
 
 # --- Check file existence ---
@@ -34,38 +35,61 @@ if not os.path.exists(input_file):
 # --- Read the input TSV file using pandas with python engine ---
 try:
     df_input = pd.read_csv(input_file, sep='\t', engine='python')
-    if df_input.shape[1] != 22:
-        print(f"ERROR: Expected 22 columns, but found {df_input.shape[1]}.")
+    # 22 columns, plus RNAup_confirmation when RNAup ran in best-site mode (merge_rnaup_results.py --best-site)
+    expected_columns = 23 if "RNAup_confirmation" in df_input.columns else 22
+    if df_input.shape[1] != expected_columns:
+        print(f"ERROR: Expected {expected_columns} columns, but found {df_input.shape[1]}.")
         print(f"Columns detected: {list(df_input.columns)}")
         sys.exit(1)
     print(f"Detected header ({df_input.shape[1]} columns): {list(df_input.columns)}")
+    profile.count("hits", len(df_input))
 except Exception as e:
     print(f"ERROR while reading input file: {e}")
     sys.exit(1)
 
-# --- Parse each row ---
-for line_number, row in df_input.iterrows():
-    try:
-        mag_name = row['MAG']
-        contig_value = row['Contig']
-        start_gene = int(row['start_gene']) if 'start_gene' in row else int(row[11])
-        end_gene = int(row['end_gene']) if 'end_gene' in row else int(row[12])
-        mirna_name = row['miRNA']
-        environment = row['Environment']
-    except Exception as e:
-        print(f"ERROR: Line {line_number + 2} contains invalid data: {e}")
-        continue
+# --- Parse each row into contigs per miRNA and MAGs per environment ---
+def collect_contigs(df):
+    contig_sets_by_mirna = {}
+    mag_sets_by_environment = {}
+    for line_number, row in df.iterrows():
+        try:
+            mag_name = row['MAG']
+            contig_value = row['Contig']
+            start_gene = int(row['start_gene']) if 'start_gene' in row else int(row[11])
+            end_gene = int(row['end_gene']) if 'end_gene' in row else int(row[12])
+            mirna_name = row['miRNA']
+            environment = row['Environment']
+        except Exception as e:
+            print(f"ERROR: Line {line_number + 2} contains invalid data: {e}")
+            continue
 
-    contig_sets_by_mirna.setdefault(mirna_name, {}).setdefault(environment, []).append(
-        (mag_name, contig_value, start_gene, end_gene)
-    )
-    mag_sets_by_environment.setdefault(environment, {}).setdefault(mag_name, []).append(
-        (contig_value, start_gene, end_gene)
-    )
+        contig_sets_by_mirna.setdefault(mirna_name, {}).setdefault(environment, []).append(
+            (mag_name, contig_value, start_gene, end_gene)
+        )
+        mag_sets_by_environment.setdefault(environment, {}).setdefault(mag_name, []).append(
+            (contig_value, start_gene, end_gene)
+        )
+    return contig_sets_by_mirna, mag_sets_by_environment
+
+
+# --- Append mode: only the rows of the MAGs not processed yet ---
+added_samples, rebuild = None, True
+if append:
+    from append_store import AppendStore
+    results = AppendStore(out_dir, "HolomiRA_results")
+    store = AppendStore(out_dir, "functional_inputs")
+    added_samples, rebuild = store.pending(results.samples, source=results.generation)
+    print(f"{'Rebuilding from' if rebuild else 'Appending'} {len(added_samples)} samples")
+df_new = df_input if rebuild else df_input[df_input['MAG'].isin(added_samples)]
+contig_sets_by_mirna, mag_sets_by_environment = collect_contigs(df_new)
+# Files of existing miRNAs get the sequences of the new MAGs appended
+fasta_mode = 'w' if rebuild else 'a'
 
 # --- Extract affected CDS regions with bedtools ---
 all_affected_cds_files = {}
 MAG_folders = glob.glob(os.path.join(out_dir, "annotation/*"))
+if not rebuild:
+    MAG_folders = [os.path.join(out_dir, "annotation", mag) for mag in added_samples]
 
 for MAG_folder in MAG_folders:
     MAG_name = os.path.basename(MAG_folder)
@@ -149,7 +173,7 @@ for mirna_name, env_dict in contig_sets_by_mirna.items():
         contig_coords_list = []
 
         contig_path = os.path.join(mirna_dir, f"contigs_for_{mirna_name}.txt")
-        with open(contig_path, 'w') as contig_file:
+        with open(contig_path, fasta_mode) as contig_file:
             for mag_name, contig, start_gene, end_gene in mirna_contigs:
                 contig_file.write(f"{contig} {start_gene} {end_gene}\n")
                 contig_coords_list.append((contig, start_gene, end_gene))
@@ -177,12 +201,26 @@ for mirna_name, env_dict in contig_sets_by_mirna.items():
 
         if filtered_sequences:
             output_fasta = os.path.join(mirna_dir, f"merged_miRNA_{mirna_name}_{environment}.fasta")
-            with open(output_fasta, 'w') as merged_file:
+            with open(output_fasta, fasta_mode) as merged_file:
                 merged_file.writelines(filtered_sequences)
             print(f"Saved {len(filtered_sequences)} unique sequences to {output_fasta}")
         else:
             print(f"WARNING: No matching sequences found for {mirna_name} in {environment}")
 
+# --- Save the miRNA -> affected CDS mapping (headers as written by bedtools getfasta) ---
+# Grouped by miRNA over every row, so it is rewritten from the whole table in append mode too
+if not rebuild:
+    contig_sets_by_mirna, _ = collect_contigs(df_input)
+mapping_file = os.path.join(out_dir, "function/affected_cds_map.tsv")
+with open(mapping_file, 'w') as map_file:
+    map_file.write("miRNA\tEnvironment\tMAG\tContig\tstart_gene\tend_gene\tHeader\n")
+    for mirna_name, env_dict in contig_sets_by_mirna.items():
+        for environment, mirna_contigs in env_dict.items():
+            for mag_name, contig, start_gene, end_gene in dict.fromkeys(mirna_contigs):
+                header = f"{contig}:{start_gene - 1}-{end_gene}"
+                map_file.write(f"{mirna_name}\t{environment}\t{mag_name}\t{contig}\t{start_gene}\t{end_gene}\t{header}\n")
+print(f"miRNA to CDS mapping saved: {mapping_file}")
+
 # --- Cleanup temporary files ---
 for temp_file in glob.glob(os.path.join(out_dir, "function/*/temp_*.fasta")) + \
                   glob.glob(os.path.join(out_dir, "function/MAGs_*/temp_*.bed")) + \
@@ -193,3 +231,6 @@ for temp_file in glob.glob(os.path.join(out_dir, "function/*/temp_*.fasta")) + \
 final_status_file = os.path.join(out_dir, "function/temp_merged_affected_cds.fasta")
 with open(final_status_file, 'w') as f:
     f.write("Done!\n")
+
+if append:
+    store.commit({sample: results.samples[sample] for sample in added_samples}, source=results.generation)
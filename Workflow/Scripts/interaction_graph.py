@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from stage_profile import StageProfile
+
+## HolomiRA: sparse miRNA-MAG-gene interaction graph
+#
+#   interaction_graph.py <HolomiRA_results.tsv> <output_dir> <top_k> <environment> [environment ...]
+#
+# Per environment the results are encoded once as sparse incidence matrices (miRNA x MAG,
+# miRNA x gene, MAG x gene; values = number of binding sites), and everything else is computed
+# from them. Written to {output_dir}/graph/:
+#   {env}_incidence.npz   : the three matrices (CSR) and their row/column labels, see load_incidence()
+#   {env}_nodes.tsv       : node ID, type, label and degrees (distinct partners of each type)
+#   {env}_edges.tsv.gz    : weighted edge list (source, target, type, sites) for network tools
+#   {env}_top_k.tsv       : top-k miRNAs by MAGs / genes and MAGs by miRNAs / genes
+#   {env}_cotargeting.tsv : miRNA pairs sharing target MAGs or genes (miRNA projection)
+#   {env}_MAG_projection.tsv : MAG pairs targeted by shared miRNAs
+# Genes are the `Gene` names, as in the summary tables; hits without a gene name are only counted
+# in the miRNA x MAG matrix.
+
+PAIRS = [("miRNA", "MAG"), ("miRNA", "Gene"), ("MAG", "Gene")]
+NODE_PREFIX = {"miRNA": "mir", "MAG": "mag", "Gene": "gene"}
+RANKINGS = [("miRNA_by_MAGs", "miRNA", "MAG"), ("miRNA_by_genes", "miRNA", "Gene"),
+            ("MAG_by_miRNAs", "MAG", "miRNA"), ("MAG_by_genes", "MAG", "Gene")]
+
+
+def incidence_matrices(df):
+    """Sorted node labels per type and a weighted CSR incidence matrix per pair of types."""
+    labels, codes = {}, {}
+    for kind in NODE_PREFIX:
+        values = df[kind].dropna().astype(str)
+        labels[kind] = np.sort(values.unique().astype(str))
+        codes[kind] = pd.Series(np.searchsorted(labels[kind], values), index=values.index)
+    matrices = {}
+    for left, right in PAIRS:
+        both = codes[left].index.intersection(codes[right].index)
+        rows, cols = codes[left].loc[both].to_numpy(), codes[right].loc[both].to_numpy()
+        matrix = sparse.coo_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)),
+                                   shape=(len(labels[left]), len(labels[right]))).tocsr()
+        matrix.sum_duplicates()
+        matrices[(left, right)] = matrix
+    return labels, matrices
+
+
+def save_incidence(path, labels, matrices):
+    arrays = {f"labels_{kind}": values.astype(str) for kind, values in labels.items()}
+    for (left, right), matrix in matrices.items():
+        key = f"{left}_{right}"
+        arrays.update({f"{key}_data": matrix.data, f"{key}_indices": matrix.indices,
+                       f"{key}_indptr": matrix.indptr, f"{key}_shape": np.array(matrix.shape)})
+    np.savez_compressed(path, **arrays)
+
+
+def load_incidence(path):
+    """Labels and matrices written by save_incidence(); matrices are keyed by (row type, column type)."""
+    with np.load(path) as stored:
+        labels = {kind: stored[f"labels_{kind}"] for kind in NODE_PREFIX}
+        matrices = {}
+        for left, right in PAIRS:
+            key = f"{left}_{right}"
+            matrices[(left, right)] = sparse.csr_matrix(
+                (stored[f"{key}_data"], stored[f"{key}_indices"], stored[f"{key}_indptr"]),
+                shape=tuple(stored[f"{key}_shape"]))
+    return labels, matrices
+
+
+def oriented(matrices, rows, cols):
+    """Incidence matrix with `rows` node types as rows."""
+    if (rows, cols) in matrices:
+        return matrices[(rows, cols)]
+    return matrices[(cols, rows)].T.tocsr()
+
+
+def degrees(matrices, kind, other):
+    """Distinct partners of type `other` for every node of type `kind`."""
+    return np.diff(oriented(matrices, kind, other).indptr)
+
+
+def top_k(degree, labels, k):
+    """Indices of the k largest degrees, ties broken by label; no full sort of the degree vector."""
+    k = min(k, int(np.count_nonzero(degree)))
+    if k == 0:
+        return np.array([], dtype=int)
+    threshold = degree[np.argpartition(-degree, k - 1)[k - 1]]
+    above = np.flatnonzero(degree > threshold)
+    ties = np.flatnonzero(degree == threshold)
+    ties = ties[np.argsort(labels[ties], kind="stable")][:k - len(above)]
+    chosen = np.concatenate([above, ties])
+    return chosen[np.lexsort((labels[chosen], -degree[chosen]))]
+
+
+def projection(matrix):
+    """Pairs of rows sharing columns (upper triangle of A.A^T on the 0/1 structure)."""
+    binary = matrix.copy()
+    binary.data = np.ones_like(binary.data)
+    shared = sparse.triu(binary @ binary.T, k=1).tocoo()
+    return shared.row, shared.col, shared.data
+
+
+def write_environment(df, graph_dir, env, k):
+    labels, matrices = incidence_matrices(df)
+    save_incidence(os.path.join(graph_dir, f"{env}_incidence.npz"), labels, matrices)
+
+    # --- Nodes and their degrees ---
+    nodes = []
+    for kind in NODE_PREFIX:
+        table = pd.DataFrame({"node": [f"{NODE_PREFIX[kind]}:{label}" for label in labels[kind]],
+                              "type": kind, "label": labels[kind]})
+        for other in NODE_PREFIX:
+            if other != kind:
+                table[f"n_{other}"] = pd.array(degrees(matrices, kind, other), dtype="Int64")
+        nodes.append(table)
+    pd.concat(nodes, ignore_index=True).to_csv(os.path.join(graph_dir, f"{env}_nodes.tsv"),
+                                               sep="\t", index=False, na_rep="")
+
+    # --- Weighted edge list ---
+    edges = []
+    for left, right in PAIRS:
+        coo = matrices[(left, right)].tocoo()
+        edges.append(pd.DataFrame({"source": [f"{NODE_PREFIX[left]}:{label}" for label in labels[left][coo.row]],
+                                   "target": [f"{NODE_PREFIX[right]}:{label}" for label in labels[right][coo.col]],
+                                   "type": f"{left}-{right}", "sites": coo.data}))
+    edges = pd.concat(edges, ignore_index=True)
+    # No timestamp in the gzip header, so reruns and sharded runs write identical files
+    edges.to_csv(os.path.join(graph_dir, f"{env}_edges.tsv.gz"), sep="\t", index=False,
+                 compression={"method": "gzip", "mtime": 0})
+
+    # --- Top-k rankings ---
+    top = []
+    for ranking, kind, other in RANKINGS:
+        degree = degrees(matrices, kind, other)
+        chosen = top_k(degree, labels[kind], k)
+        top.append(pd.DataFrame({"ranking": ranking, "rank": np.arange(1, len(chosen) + 1),
+                                 kind: labels[kind][chosen], "count": degree[chosen]})
+                   .rename(columns={kind: "node"}))
+    pd.concat(top, ignore_index=True).to_csv(os.path.join(graph_dir, f"{env}_top_k.tsv"), sep="\t", index=False)
+
+    # --- Co-targeting (miRNA projection) and MAG projection ---
+    mirnas = labels["miRNA"]
+    by_mag = pd.DataFrame(dict(zip(["i", "j", "shared_MAGs"], projection(matrices[("miRNA", "MAG")]))))
+    by_gene = pd.DataFrame(dict(zip(["i", "j", "shared_genes"], projection(matrices[("miRNA", "Gene")]))))
+    cotargeting = by_mag.merge(by_gene, on=["i", "j"], how="outer").fillna(0).sort_values(["i", "j"])
+    pd.DataFrame({"miRNA_1": mirnas[cotargeting["i"].astype(int)], "miRNA_2": mirnas[cotargeting["j"].astype(int)],
+                  "shared_MAGs": cotargeting["shared_MAGs"].astype(int),
+                  "shared_genes": cotargeting["shared_genes"].astype(int)}) \
+        .to_csv(os.path.join(graph_dir, f"{env}_cotargeting.tsv"), sep="\t", index=False)
+
+    mags = labels["MAG"]
+    rows, cols, shared = projection(oriented(matrices, "MAG", "miRNA"))
+    order = np.lexsort((cols, rows))
+    pd.DataFrame({"MAG_1": mags[rows[order]], "MAG_2": mags[cols[order]], "shared_miRNAs": shared[order]}) \
+        .to_csv(os.path.join(graph_dir, f"{env}_MAG_projection.tsv"), sep="\t", index=False)
+
+    return len(edges), {kind: len(values) for kind, values in labels.items()}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 5:
+        print("Usage: interaction_graph.py <HolomiRA_results.tsv> <output_dir> <top_k> <environment> [environment ...]")
+        sys.exit(1)
+
+    input_file = sys.argv[1]
+    graph_dir = os.path.join(sys.argv[2], "graph")
+    k = int(sys.argv[3])
+    environments = sys.argv[4:]
+    profile = StageProfile("interaction_graph")
+    os.makedirs(graph_dir, exist_ok=True)
+
+    # --- Only the columns the graph needs ---
+    columns = ["miRNA", "MAG", "Gene", "Environment"]
+    if os.path.getsize(input_file) > 0:
+        df = pd.read_csv(input_file, sep="\t", usecols=columns, dtype=str)
+    else:
+        df = pd.DataFrame(columns=columns, dtype=str)
+
+    for env in environments:
+        n_edges, n_nodes = write_environment(df[df["Environment"] == env].reset_index(drop=True), graph_dir, env, k)
+        profile.count("edges", n_edges)
+        print(f"{env}: {n_nodes['miRNA']} miRNAs, {n_nodes['MAG']} MAGs, {n_nodes['Gene']} genes, {n_edges} edges")
@@ -2,115 +2,305 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
+import gzip
+import zlib
+import math
+import heapq
+import shutil
+import numpy as np
 import pandas as pd
 import re
+import multiprocessing
 from pathlib import Path
+from stage_profile import StageProfile
+from generate_extended_binding_windows import window
 
 # --- Inputs ---
-rna_dir = sys.argv[1]
-finalresults = sys.argv[2]
-output_dir = sys.argv[3]
-dg_cutoff = float(sys.argv[4])
+# merge_rnaup_results.py <rnaup_dir> <finalresults.txt> <output_dir> <dG_cutoff> [threads] [memory_mb]
+#                        [--flank <nt>] [--best-site] [--samples <sample> ...]
+# The merge is hash-partitioned by contig: finalresults.txt and the parsed RNAup results are spilled
+# to one file per partition, partitions are merged in parallel (`threads` at a time, each within
+# its share of `memory_mb`), and the per-partition results are streamed back into
+# HolomiRA_results.tsv / HolomiRA_discarded.tsv in the original row order.
+# With --samples only the RNAup folders of those samples are read, and the RNAup summary is written
+# to output_dir instead of rnaup_dir, with the number of its rows per sample (RNAup_summary_counts.tsv;
+# append mode merges the new samples this way, see append_store.py).
+# --flank is the flank of the binding windows (generate_extended_binding_windows.py, default 150);
+# an RNAup result is kept when its interaction lies on the site within its window.
+# --best-site: the inputs were prepared in best-site mode (prepare_rnaup_inputs.py); the rows listed
+# in each sample's unconfirmed_sites.tsv take the RNAup result of the best site of their gene, and
+# the RNAup_confirmation column tells them ("best_site") from the rows folded themselves ("folded").
+args = sys.argv[1:]
+best_site = "--best-site" in args
+args = [arg for arg in args if arg != "--best-site"]
+flank = window
+if "--flank" in args:
+    flank = int(args[args.index("--flank") + 1])
+    del args[args.index("--flank"):args.index("--flank") + 2]
+samples = None
+if "--samples" in args:
+    samples = sorted(args[args.index("--samples") + 1:])
+    args = args[:args.index("--samples")]
+rna_dir = args[0]
+finalresults = args[1]
+output_dir = args[2]
+dg_cutoff = float(args[3])
+threads = int(args[4]) if len(args) > 4 else 1
+memory_mb = max(1, int(args[5])) if len(args) > 5 else 2000
+profile = StageProfile("merge_rnaup_results")
+
+RNAUP_COLUMNS = ["Contig", "Start", "End", "miRNA", "pos1", "pos2", "mirNA_pairing",
+                 "dG_total", "dG_binding", "dG_opening_target", "dG_opening_miRNA"]
+DG_COLUMNS = ["dG_total", "dG_binding", "dG_opening_target", "dG_opening_miRNA"]
+KEYS = ["miRNA", "Contig", "Start", "End"]
+UNCONFIRMED = "unconfirmed_sites.tsv"
+CHUNKSIZE = 100000
+# In-memory size of a table relative to its TSV size (pandas objects, merge copies)
+MEMORY_PER_TSV_BYTE = 6
 
 # --- Create output directory if needed ---
 os.makedirs(output_dir, exist_ok=True)
+part_dir = os.path.join(output_dir, ".merge_partitions")
+shutil.rmtree(part_dir, ignore_errors=True)
+os.makedirs(part_dir)
+
+
+def partition_of(contig, n_partitions):
+    # crc32, not hash(): partitions must agree across processes
+    return zlib.crc32(str(contig).encode()) % n_partitions
+
+
+def part_path(kind, p):
+    return os.path.join(part_dir, f"{kind}_{p}.tsv")
 
-print("Reading finalresults.txt...")
-final_df = pd.read_csv(finalresults, sep="\t")
+
+def rnaup_walk():
+    """os.walk of the RNAup folders to merge, in sorted order."""
+    roots = [rna_dir] if samples is None else [os.path.join(rna_dir, s) for s in samples]
+    for top in roots:
+        for root, dirs, files in os.walk(top):
+            dirs.sort()
+            yield root, dirs, sorted(files)
+
+
+# --- Number of partitions: `threads` of them must fit in the memory budget together ---
+input_bytes = os.path.getsize(finalresults)
+for root, _, files in rnaup_walk():
+    input_bytes += sum(os.path.getsize(os.path.join(root, f)) for f in files if "_rnaup.txt" in f)
+n_partitions = max(threads, math.ceil(MEMORY_PER_TSV_BYTE * input_bytes * threads / (memory_mb * 1024 ** 2)))
+print(f"Merging in {n_partitions} partitions, {threads} at a time")
 
 print("Scanning RNAup output files...")
-rna_rows = []
-for root, _, files in os.walk(rna_dir):
-    for f in files:
-        if not f.endswith("_rnaup.txt"):
-            continue
-        file_path = os.path.join(root, f)
-        try:
-            with open(file_path, encoding="utf-8") as file:
-                lines = [line.strip() for line in file if line.strip()]
-        except UnicodeDecodeError:
-            with open(file_path, encoding="latin1", errors="ignore") as file:
-                lines = [line.strip() for line in file if line.strip()]
-
-        if len(lines) < 2:
-            continue
+summary_path = os.path.join(rna_dir if samples is None else output_dir, "RNAup_summary_results.tsv")
+rna_parts = {}
+n_rnaup = 0
+summary_counts = {}
+with open(summary_path, "w") as summary:
+    summary.write("\t".join(RNAUP_COLUMNS) + "\n")
+    # Sorted walk: the summary rows come out in the same order on every file system (and for sharded runs)
+    for root, _, files in rnaup_walk():
+        sample_rows = summary_counts.setdefault(os.path.relpath(root, rna_dir).split(os.sep)[0], [0])
+        for f in files:
+            # Storage-budget runs gzip the RNAup outputs
+            if not f.endswith(("_rnaup.txt", "_rnaup.txt.gz")):
+                continue
+            file_path = os.path.join(root, f)
+            opener = gzip.open if f.endswith(".gz") else open
+            try:
+                with opener(file_path, "rt", encoding="utf-8") as file:
+                    lines = [line.strip() for line in file if line.strip()]
+            except UnicodeDecodeError:
+                with opener(file_path, "rt", encoding="latin1", errors="ignore") as file:
+                    lines = [line.strip() for line in file if line.strip()]
 
-        header = lines[0].lstrip(">")
-        align_line = lines[1]
+            if len(lines) < 2:
+                continue
 
-        energy_match = re.search(r"\(([-\d\.]+) = ([-\d\.]+) \+ ([-\d\.]+) \+ ([-\d\.]+)\)", align_line)
-        coord_match = re.search(r"(\d+),(\d+)\s+:\s+(\d+,\d+)", align_line)
+            header = lines[0].lstrip(">")
+            align_line = lines[1]
 
-        if not (energy_match and coord_match):
-            continue
+            energy_match = re.search(r"\(([-\d\.]+) = ([-\d\.]+) \+ ([-\d\.]+) \+ ([-\d\.]+)\)", align_line)
+            coord_match = re.search(r"(\d+),(\d+)\s+:\s+(\d+,\d+)", align_line)
 
-        dg_total = float(energy_match.group(1))
-        dg_binding = float(energy_match.group(2))
-        dg_open_target = float(energy_match.group(3))
-        dg_open_mirna = float(energy_match.group(4))
-        pos1 = int(coord_match.group(1))
-        pos2 = int(coord_match.group(2))
-        mirna_pairing = coord_match.group(3)
-
-        # Parse filename to extract miRNA, contig, and coordinates
-        match = re.match(r"(.+?)_(gnl_X_.+?)_(\d+)_(\d+)_rnaup\.txt", f)
-        if not match:
-            continue
+            if not (energy_match and coord_match):
+                continue
 
-        mirna = match.group(1)
-        contig = match.group(2).replace("gnl_X_", "gnl|X|")
-        start = int(match.group(3))
-        end = int(match.group(4))
-
-        rna_rows.append({
-            "Contig": contig,
-            "Start": start,
-            "End": end,
-            "miRNA": mirna,
-            "pos1": pos1,
-            "pos2": pos2,
-            "mirNA_pairing": mirna_pairing,
-            "dG_total": dg_total,
-            "dG_binding": dg_binding,
-            "dG_opening_target": dg_open_target,
-            "dG_opening_miRNA": dg_open_mirna
-        })
-
-rna_df = pd.DataFrame(rna_rows)
-
-if rna_df.empty:
-    print("[!] RNAup result DataFrame is empty. No valid entries parsed.")
-    summary_path = os.path.join(rna_dir, "RNAup_summary_results.tsv")
-    rna_df.to_csv(summary_path, sep="\t", index=False)
-    final_df["dG_total"] = pd.NA
-    final_df["dG_binding"] = pd.NA
-    final_df["dG_opening_target"] = pd.NA
-    final_df["dG_opening_miRNA"] = pd.NA
-    final_df.to_csv(os.path.join(output_dir, "HolomiRA_discarded.tsv"), sep="\t", index=False)
-    open(os.path.join(output_dir, "HolomiRA_results.tsv"), "w").close()
-    sys.exit(0)
+            dg_total = float(energy_match.group(1))
+            dg_binding = float(energy_match.group(2))
+            dg_open_target = float(energy_match.group(3))
+            dg_open_mirna = float(energy_match.group(4))
+            pos1 = int(coord_match.group(1))
+            pos2 = int(coord_match.group(2))
+            mirna_pairing = coord_match.group(3)
+
+            # Parse filename to extract miRNA, contig, and coordinates
+            match = re.match(r"(.+?)_(gnl_X_.+?)_(\d+)_(\d+)_rnaup\.txt(?:\.gz)?$", f)
+            if not match:
+                continue
+
+            mirna = match.group(1)
+            contig = match.group(2).replace("gnl_X_", "gnl|X|")
+            start = int(match.group(3))
+            end = int(match.group(4))
 
-summary_path = os.path.join(rna_dir, "RNAup_summary_results.tsv")
-rna_df.to_csv(summary_path, sep="\t", index=False)
+            # --- Stream the row to the summary and to its partition ---
+            line = "\t".join(str(v) for v in [contig, start, end, mirna, pos1, pos2, mirna_pairing,
+                                             dg_total, dg_binding, dg_open_target, dg_open_mirna]) + "\n"
+            summary.write(line)
+            sample_rows[0] += 1
+            p = partition_of(contig, n_partitions)
+            if p not in rna_parts:
+                rna_parts[p] = open(part_path("rnaup", p), "w")
+                rna_parts[p].write("\t".join(RNAUP_COLUMNS) + "\n")
+            rna_parts[p].write(line)
+            n_rnaup += 1
+for handle in rna_parts.values():
+    handle.close()
 print(f"Summary saved: {summary_path}")
+if samples is not None:
+    with open(os.path.join(output_dir, "RNAup_summary_counts.tsv"), "w") as out:
+        out.write("sample\trows\n")
+        for sample in samples:
+            out.write(f"{sample}\t{summary_counts.get(sample, [0])[0]}\n")
 
-# --- Filter: Keep rows where the binding is inside the target region ---
-rna_df_filtered = rna_df[(rna_df["pos1"] > 150) & (rna_df["pos2"] < 186)]
+# --- Spill finalresults.txt to the partitions, tagged with its row number ---
+# Values are kept as read (dtype=str), so every partition writes them back unchanged
+print("Partitioning finalresults.txt...")
+final_parts = {}
+final_columns = None
+n_hits = 0
+for chunk in pd.read_csv(finalresults, sep="\t", dtype=str, chunksize=CHUNKSIZE):
+    final_columns = list(chunk.columns)
+    chunk.insert(0, "_row", range(n_hits, n_hits + len(chunk)))
+    n_hits += len(chunk)
+    partitions = chunk["Contig"].map(lambda contig: partition_of(contig, n_partitions))
+    for p, rows in chunk.groupby(partitions, sort=False):
+        new = p not in final_parts
+        if new:
+            final_parts[p] = open(part_path("final", p), "w")
+        rows.to_csv(final_parts[p], sep="\t", index=False, header=new)
+for handle in final_parts.values():
+    handle.close()
 
-# --- Ensure consistent types for merging ---
-for col in ["Start", "End"]:
-    final_df[col] = pd.to_numeric(final_df[col], errors="coerce").astype("Int64")
-    rna_df_filtered[col] = pd.to_numeric(rna_df_filtered[col], errors="coerce").astype("Int64")
+# --- Best-site mode: rows confirmed by the best site of their gene, partitioned alike ---
+n_unconfirmed = 0
+if best_site:
+    unconfirmed_parts = {}
+    for root, _, files in rnaup_walk():
+        if UNCONFIRMED not in files:
+            continue
+        rows = pd.read_csv(os.path.join(root, UNCONFIRMED), sep="\t", dtype={"Contig": str, "miRNA": str, "Locus_tag": str})
+        n_unconfirmed += len(rows)
+        for p, part in rows.groupby(rows["Contig"].map(lambda contig: partition_of(contig, n_partitions)), sort=False):
+            new = p not in unconfirmed_parts
+            if new:
+                unconfirmed_parts[p] = open(part_path("unconfirmed", p), "w")
+            part.to_csv(unconfirmed_parts[p], sep="\t", index=False, header=new)
+    for handle in unconfirmed_parts.values():
+        handle.close()
+    profile.count("unconfirmed", n_unconfirmed)
+if final_columns is None:
+    final_columns = list(pd.read_csv(finalresults, sep="\t", nrows=0).columns)
+profile.count("hits", n_hits)
+profile.count("rnaup_results", n_rnaup)
+profile.count("partitions", n_partitions)
+
+
+def merge_partition(p):
+    """Merge one partition; writes its valid and discarded rows (with _row) and returns their counts."""
+    final_df = pd.read_csv(part_path("final", p), sep="\t", dtype=str)
+    final_df["_row"] = final_df["_row"].astype(int)
+    if os.path.exists(part_path("rnaup", p)):
+        rna_df = pd.read_csv(part_path("rnaup", p), sep="\t", dtype={"Contig": str, "miRNA": str, "mirNA_pairing": str})
+    else:
+        rna_df = pd.DataFrame({c: pd.Series(dtype=float if c not in ("Contig", "miRNA", "mirNA_pairing") else str)
+                               for c in RNAUP_COLUMNS})
+
+    # --- Filter: Keep rows where the binding is inside the target region ---
+    # Site position in its window, as binding_window() in generate_extended_binding_windows.py:
+    # `left` nt of window before the site centre (fewer at a contig start), then the site itself
+    center = (rna_df["Start"] + rna_df["End"]) // 2
+    left = np.minimum(flank, center - 1)
+    site_length = rna_df["End"] - rna_df["Start"] + 1
+    rna_df_filtered = rna_df[(rna_df["pos1"] > left) & (rna_df["pos2"] < left + site_length)].copy()
+
+    # --- Ensure consistent types for merging ---
+    for col in ["Start", "End"]:
+        final_df[col] = pd.to_numeric(final_df[col], errors="coerce").astype("Int64")
+        rna_df_filtered[col] = pd.to_numeric(rna_df_filtered[col], errors="coerce").astype("Int64")
+
+    if best_site:
+        # Rows of unconfirmed sites are joined to the RNAup result of the best site of their gene
+        if os.path.exists(part_path("unconfirmed", p)):
+            unconfirmed = pd.read_csv(part_path("unconfirmed", p), sep="\t",
+                                      dtype={"Contig": str, "miRNA": str, "Locus_tag": str})
+        else:
+            unconfirmed = pd.DataFrame(columns=KEYS + ["Locus_tag", "best_Start", "best_End"])
+        unconfirmed = unconfirmed.drop_duplicates(subset=KEYS + ["Locus_tag"])
+        for col in ["Start", "End", "best_Start", "best_End"]:
+            unconfirmed[col] = pd.to_numeric(unconfirmed[col], errors="coerce").astype("Int64")
+        final_df = final_df.merge(unconfirmed, how="left", on=KEYS + ["Locus_tag"])
+        flagged = final_df["best_Start"].notna()
+        final_df["_Start"] = final_df["best_Start"].where(flagged, final_df["Start"])
+        final_df["_End"] = final_df["best_End"].where(flagged, final_df["End"])
+        merged = pd.merge(final_df, rna_df_filtered.rename(columns={"Start": "_Start", "End": "_End"}), how="left",
+                          on=["miRNA", "Contig", "_Start", "_End"])
+        merged["RNAup_confirmation"] = np.where(flagged.to_numpy(), "best_site", "folded")
+        merged = merged[["_row"] + merged_columns]
+    else:
+        merged = pd.merge(final_df, rna_df_filtered, how="left", on=KEYS)
+    # Unmatched hits leave gaps, so the RNAup columns are floating point, as in an unpartitioned merge
+    for col in ["pos1", "pos2"] + DG_COLUMNS:
+        merged[col] = merged[col].astype(float)
+
+    # --- Filter based on dG_total threshold ---
+    keep = merged["dG_total"] <= dg_cutoff
+    merged[keep].to_csv(part_path("valid", p), sep="\t", index=False, header=False)
+    merged[~keep].to_csv(part_path("discarded", p), sep="\t", index=False, header=False)
+    return int(keep.sum()), int((~keep).sum())
 
-print("Merging finalresults with RNAup information...")
-merged = pd.merge(final_df, rna_df_filtered, how="left", on=["miRNA", "Contig", "Start", "End"])
 
-# --- Filter based on dG_total threshold ---
-valid = merged[merged["dG_total"] <= dg_cutoff]
-discarded = merged[~(merged["dG_total"] <= dg_cutoff)]
+def stream_rows(kind, partitions, out_path, header):
+    """Write the partition outputs of one kind to out_path, in finalresults.txt row order."""
+    handles = [open(part_path(kind, p)) for p in partitions]
+    key = lambda line: int(line.split("\t", 1)[0])
+    with open(out_path, "w") as out:
+        out.write(header)
+        for line in heapq.merge(*handles, key=key):
+            out.write(line.split("\t", 1)[1])
+    for handle in handles:
+        handle.close()
+
+
+merged_columns = final_columns + [c for c in RNAUP_COLUMNS if c not in KEYS] + (["RNAup_confirmation"] if best_site else [])
+
+if n_rnaup == 0:
+    print("[!] RNAup result DataFrame is empty. No valid entries parsed.")
+    # The summary keeps its header and no rows; every hit is discarded with empty energies
+    with open(os.path.join(output_dir, "HolomiRA_discarded.tsv"), "w") as out:
+        out.write("\t".join(final_columns + DG_COLUMNS) + "\n")
+        for chunk in pd.read_csv(finalresults, sep="\t", dtype=str, chunksize=CHUNKSIZE):
+            for col in DG_COLUMNS:
+                chunk[col] = pd.NA
+            chunk.to_csv(out, sep="\t", index=False, header=False)
+    open(os.path.join(output_dir, "HolomiRA_results.tsv"), "w").close()
+    shutil.rmtree(part_dir, ignore_errors=True)
+    sys.exit(0)
+
+print("Merging finalresults with RNAup information...")
+partitions = sorted(final_parts)
+# Forked workers inherit the module state; a spawned worker would re-run this script
+with multiprocessing.get_context("fork").Pool(min(threads, max(1, len(partitions)))) as pool:
+    counts = pool.map(merge_partition, partitions)
+n_valid = sum(c[0] for c in counts)
+n_discarded = sum(c[1] for c in counts)
 
 # --- Save final tables ---
-valid.to_csv(os.path.join(output_dir, "HolomiRA_results.tsv"), sep="\t", index=False)
-discarded.to_csv(os.path.join(output_dir, "HolomiRA_discarded.tsv"), sep="\t", index=False)
+profile.count("valid", n_valid)
+profile.count("discarded", n_discarded)
+header = "\t".join(merged_columns) + "\n"
+stream_rows("valid", partitions, os.path.join(output_dir, "HolomiRA_results.tsv"), header)
+stream_rows("discarded", partitions, os.path.join(output_dir, "HolomiRA_discarded.tsv"), header)
+shutil.rmtree(part_dir, ignore_errors=True)
 
-print(f"\nMerge complete!\n   Valid hits:     {len(valid)}\n   Discarded hits: {len(discarded)}")
+print(f"\nMerge complete!\n   Valid hits:     {n_valid}\n   Discarded hits: {n_discarded}")
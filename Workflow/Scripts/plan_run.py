@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import math
+import argparse
+import yaml
+from shards import load_samples, shard_samples
+from calibrate_flank import read_fasta, recommended_flank
+from resource_model import (ResourceModel, SAFETY, MIN_MEM_MB, PROKKA_NT_PER_THREAD, count_records,
+                            file_size, genome_nt, query_bytes)
+
+## HolomiRA: pre-run cost estimate and cluster plan
+#
+#   plan_run.py [--config Config/config.yaml] [--set key=value ...] [--reference <out_dir>]
+#               [--cores 32] [--mem-gb 128] [--walltime 24] [--max-shards 64] [--json plan.json]
+#
+# Reads the config, sample_tab, the input FASTAs and the miRNA panel, and estimates before anything
+# runs, per sample and stage:
+#   genome nt -> CDS >= 150 nt (candidate windows) -> windows x miRNAs (RNAhybrid scan pairs)
+#   -> hits (scan pairs x hit rate) -> RNAup folds (hits x folds per hit) -> RNAup input bytes
+#   -> affected CDS (hits x query bytes per hit) -> SUPER-FOCUS jobs of the superfocus_mode
+# Runtime and peak memory per job come from the resource model (Scripts/resource_model.py) with the
+# calibration of a previous run; the work ratios (CDS per nt, hits per scan pair, folds per hit,
+# bytes written per nt and per fold) are measured from that run's stage records and outputs
+# (--reference, default: the configured out_dir). They hold for the same miRNA panel, energy and
+# pvalue; without a reference run the hit rate is taken as the pvalue, an upper bound for random
+# targets. The plan picks the fewest shards (shards.py) whose slowest shard, followed by the
+# cohort-wide rules and SUPER-FOCUS, fits in the walltime on one node of --cores and --mem-gb, with
+# the actual crc32 sample partition, and a batch_size.
+
+# Work ratios used without a reference run
+DEFAULT_WORKLOAD = {
+    "cds_per_nt": 1 / 1100,      # bacterial genomes: ~0.9 CDS per kb
+    "windows_per_cds": 0.97,     # CDS of at least 150 nt (filter_cds)
+    "folds_per_hit": 1.0,        # every hit inside a CDS window is folded
+    "sample_bytes_per_nt": 10.0,  # Prokka annotation, candidate windows, hits and binding windows
+    "rnaup_bytes_per_fold": 2000.0,
+    "query_bytes_per_hit": 1000.0,  # SUPER-FOCUS queries: one affected CDS (~1 kb) per hit at most
+    "unique_query_fraction": 1.0,   # share of the query bytes left after dedup_affected_cds
+}
+# Bytes of one affected CDS in the SUPER-FOCUS queries (header and sequence)
+CDS_QUERY_BYTES = 1000
+# Bytes of the RNAup input header (>miRNA_contig_start_end) and newlines, besides the sequences
+FOLD_HEADER_BYTES = 48
+# Rules run once per sample, in dependency order; all others run once per cohort
+SAMPLE_RULES = ["annotate_prokka", "filter_cds", "id", "five_prime", "find_targets", "format_rnahybrid",
+                "get_indiv_metrics", "extract_significant_binding_windows", "prepare_rnaup_inputs", "run_rnaup"]
+PYTHON_RULES = ["filter_cds", "id", "five_prime", "format_rnahybrid", "get_indiv_metrics",
+                "extract_significant_binding_windows", "prepare_rnaup_inputs"]
+COHORT_RULES = ["aggregate_bsites", "aggregate_finalresults", "aggregate_binding_windows", "merge_rnaup_results",
+                "summary", "impacted", "interaction_graph", "plt_histogram", "plt_venn", "plt_top"]
+# Fraction of the walltime the plan fills, and the per-sample Python time a batch should reach
+HEADROOM = 0.8
+TARGET_BATCH_S = 600
+
+
+def load_config(path, overrides):
+    with open(path) as handle:
+        config = yaml.safe_load(handle)
+    for override in overrides:
+        key, _, value = override.partition("=")
+        config[key] = yaml.safe_load(value)
+    return config
+
+
+def stage_items(out_dir, stage):
+    """{sample: items} of the stage records of a run."""
+    stage_dir = os.path.join(out_dir, "benchmarks", "stages", stage)
+    items = {}
+    if os.path.isdir(stage_dir):
+        for name in os.listdir(stage_dir):
+            with open(os.path.join(stage_dir, name)) as handle:
+                record = json.load(handle)
+            items[record["sample"]] = record.get("items", {})
+    return items
+
+
+def load_environments(path):
+    """{sample: environment} of the `id` metadata table (sample, taxonomy, environment)."""
+    environments = {}
+    with open(path) as handle:
+        for line in handle:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) >= 3:
+                environments[fields[0]] = fields[2]
+    return environments
+
+
+def tree_bytes(*paths):
+    total = 0
+    for path in paths:
+        if os.path.isfile(path):
+            total += file_size(path)
+        for root, _, files in os.walk(path):
+            total += sum(file_size(os.path.join(root, f)) for f in files)
+    return total
+
+
+def measure_workload(reference, n_mirnas):
+    """Work ratios of a finished run; DEFAULT_WORKLOAD for the ones it cannot tell.
+
+    Returns (workload, hits_per_pair or None, number of reference samples)."""
+    workload = dict(DEFAULT_WORKLOAD)
+    cds, hits, folds = (stage_items(reference, s) for s in ("five_prime", "format_rnahybrid", "prepare_rnaup_inputs"))
+    samples = [s for s in cds if s in hits and s in folds
+               and os.path.exists(os.path.join(reference, "annotation", s, f"{s}.fna"))]
+    if not samples:
+        return workload, None, 0
+    total = {"nt": 0, "cds": 0, "windows": 0, "hits": 0, "folds": 0, "sample_bytes": 0, "rnaup_bytes": 0}
+    for s in samples:
+        total["nt"] += genome_nt(os.path.join(reference, "annotation", s, f"{s}.fna"))
+        total["cds"] += cds[s].get("cds", 0)
+        total["windows"] += count_records(os.path.join(reference, "target_fasta", f"{s}_filtered.fa"))
+        total["hits"] += hits[s].get("hits", 0)
+        total["folds"] += folds[s].get("folds", 0)
+        total["sample_bytes"] += tree_bytes(*[os.path.join(reference, p.format(s=s)) for p in (
+            "annotation/{s}", "target_fasta/{s}_filtered.fa", "target_fasta/{s}_CDS.fa", "structure/{s}",
+            "rnahybrid/{s}_putative_targets.tsv", "rnahybrid/{s}_putative_targets.tsv.gz",
+            "rnahybrid/{s}_bsites.tsv", "rnahybrid/{s}_finalresults.tsv")])
+        total["rnaup_bytes"] += tree_bytes(os.path.join(reference, "RNAup", s))
+    if total["nt"] and total["cds"]:
+        workload["cds_per_nt"] = total["cds"] / total["nt"]
+        workload["sample_bytes_per_nt"] = total["sample_bytes"] / total["nt"]
+    if total["cds"] and total["windows"]:
+        workload["windows_per_cds"] = total["windows"] / total["cds"]
+    if total["hits"]:
+        workload["folds_per_hit"] = total["folds"] / total["hits"]
+    if total["folds"] and total["rnaup_bytes"]:
+        workload["rnaup_bytes_per_fold"] = total["rnaup_bytes"] / total["folds"]
+    queries = query_bytes(os.path.join(reference, "function"))
+    if total["hits"] and queries:
+        workload["query_bytes_per_hit"] = queries / total["hits"]
+        unique = file_size(os.path.join(reference, "function", "unique", "unique_affected_cds.fasta"))
+        if unique:
+            workload["unique_query_fraction"] = min(1.0, unique / queries)
+    pairs = total["windows"] * n_mirnas
+    return workload, (total["hits"] / pairs if pairs else None), len(samples)
+
+
+def sample_work(nt, n_mirnas, workload, hit_rate, fold_input_bytes, top_k=0, top_k_scope="gene"):
+    """Work units of one sample."""
+    cds = nt * workload["cds_per_nt"]
+    windows = cds * workload["windows_per_cds"]
+    pairs = windows * n_mirnas
+    hits = pairs * hit_rate
+    folds = hits * workload["folds_per_hit"]
+    if top_k and top_k_scope == "gene":
+        folds = min(folds, top_k * n_mirnas * cds)
+    return {"genome_nt": nt, "cds": cds, "windows": windows, "scan_pairs": pairs, "hits": hits, "folds": folds,
+            "fold_bytes": folds * fold_input_bytes,
+            "query_bytes": min(hits * workload["query_bytes_per_hit"], cds * CDS_QUERY_BYTES),
+            "disk_bytes": nt * workload["sample_bytes_per_nt"] + folds * workload["rnaup_bytes_per_fold"]}
+
+
+def job_costs(model, rule, work, max_threads):
+    """(threads, runtime_s, mem_mb request) of one job of a per-sample rule."""
+    feature = {"annotate_prokka": work["genome_nt"], "find_targets": work["scan_pairs"],
+               "run_rnaup": work["fold_bytes"]}.get(rule, work["genome_nt"])
+    threads = max(1, min(max_threads, round(work["genome_nt"] / PROKKA_NT_PER_THREAD))) if rule == "annotate_prokka" else 1
+    runtime_s = max(0.0, model.estimate(rule, "runtime_s", feature))
+    mem_mb = max(MIN_MEM_MB, model.estimate(rule, "mem_mb", feature) * SAFETY["mem_mb"])
+    return threads, runtime_s, mem_mb
+
+
+def superfocus_jobs(model, mode, env_bytes, unique_fraction, threads, floor_mb):
+    """{job: (threads, runtime_s, mem_mb request)} of the SUPER-FOCUS jobs of a superfocus_mode."""
+    rule, features = {
+        "per_environment": ("run_superfocus_MAG_env", env_bytes),
+        "dedup": ("annotate_unique_cds", {"unique": sum(env_bytes.values()) * unique_fraction}),
+        "batched": ("batch_superfocus_MAG", {"batched": sum(env_bytes.values())}),
+    }[mode]
+    return {job: (threads, max(0.0, model.estimate(rule, "runtime_s", feature)),
+                  max(MIN_MEM_MB, floor_mb, model.estimate(rule, "mem_mb", feature) * SAFETY["mem_mb"]))
+            for job, feature in features.items() if feature > 0}
+
+
+def shard_wall_s(costs, members, cores, mem_mb):
+    """Wall time of one shard on a node: bounded by its core-seconds, memory-seconds and longest sample."""
+    core_s = sum(threads * runtime_s for s in members for threads, runtime_s, _ in costs[s].values())
+    mem_s = sum(runtime_s * mem for s in members for _, runtime_s, mem in costs[s].values())
+    chain_s = max((sum(runtime_s for _, runtime_s, _ in costs[s].values()) for s in members), default=0.0)
+    return max(core_s / cores, mem_s / mem_mb, chain_s)
+
+
+def hours(seconds):
+    return f"{seconds / 3600:.2f} h" if seconds >= 3600 else f"{seconds / 60:.1f} min"
+
+
+def size(n_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n_bytes < 1024:
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f} TB"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate the cost of a HolomiRA run and suggest a cluster plan.")
+    parser.add_argument("--config", default="Config/config.yaml")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="override a config value, as with snakemake --config")
+    parser.add_argument("--reference", help="out_dir of a finished run to calibrate on (default: the configured out_dir)")
+    parser.add_argument("--hit-rate", type=float, help="RNAhybrid hits per scanned window and miRNA (default: measured, or pvalue)")
+    parser.add_argument("--cores", type=int, default=os.cpu_count(), help="cores per node (default: this machine's)")
+    parser.add_argument("--mem-gb", type=float, default=64, help="memory per node in GB (default: 64)")
+    parser.add_argument("--walltime", type=float, default=24, help="allocation walltime in hours (default: 24)")
+    parser.add_argument("--max-shards", type=int, default=64, help="largest number of shards considered (default: 64)")
+    parser.add_argument("--json", help="also write the plan to this file")
+    args = parser.parse_args()
+
+    config = load_config(args.config, args.set)
+    out_dir = config.get("out_dir", "Results")
+    reference = args.reference or out_dir
+    samples = load_samples(config["sample_tab"])
+    mirnas = read_fasta(config["ref_mir"])
+    n_mirnas = len(mirnas)
+    mirna_nt = sum(map(len, mirnas.values())) / max(1, n_mirnas)
+    flank = config.get("rnaup_flank", 150)
+    if flank == "auto":
+        flank = recommended_flank(os.path.join(out_dir, "benchmarks", "rnaup_flank_calibration.json"), 150)
+    max_threads = config.get("prokka_max_threads", 8)
+    calibration = config.get("resource_calibration", os.path.join(reference, "benchmarks", "resource_calibration.json"))
+    model = ResourceModel(calibration, max_threads=max_threads)
+
+    # --- Work ratios: reference run, then defaults ---
+    workload, measured_rate, n_reference = measure_workload(reference, n_mirnas)
+    hit_rate = args.hit_rate if args.hit_rate is not None else measured_rate if measured_rate is not None else config["pvalue"]
+    fold_input_bytes = FOLD_HEADER_BYTES + mirna_nt + 2 * flank + 1
+
+    # --- Per-sample work units and job costs ---
+    environments = load_environments(config["id"])
+    missing = [s for s in samples if not os.path.exists(os.path.join(config["fasta_dir"], f"{s}.fa"))]
+    if missing:
+        print(f"[!] {len(missing)} samples have no FASTA in {config['fasta_dir']}: {', '.join(missing[:10])}"
+              f"{' ...' if len(missing) > 10 else ''}")
+        sys.exit(1)
+    work = {s: sample_work(genome_nt(os.path.join(config["fasta_dir"], f"{s}.fa")), n_mirnas, workload, hit_rate,
+                           fold_input_bytes, config.get("top_k_sites", 0), config.get("top_k_scope", "gene"))
+            for s in samples}
+    costs = {s: {rule: job_costs(model, rule, work[s], max_threads) for rule in SAMPLE_RULES} for s in samples}
+
+    # --- Per-stage totals ---
+    units = {"annotate_prokka": "genome_nt", "five_prime": "cds", "filter_cds": "windows",
+             "find_targets": "scan_pairs", "format_rnahybrid": "hits", "prepare_rnaup_inputs": "folds",
+             "run_rnaup": "folds"}
+    stages = []
+    for rule in SAMPLE_RULES:
+        unit = units.get(rule, "genome_nt")
+        stages.append({"stage": rule, "jobs": len(samples), "unit": unit,
+                       "work": sum(work[s][unit] for s in samples),
+                       "core_h": sum(costs[s][rule][0] * costs[s][rule][1] for s in samples) / 3600,
+                       "max_job_s": max(costs[s][rule][1] for s in samples),
+                       "peak_mem_mb": max(costs[s][rule][2] for s in samples)})
+    # Cohort-wide rules run once; their inputs grow with the RNAup outputs
+    rnaup_bytes = sum(work[s]["folds"] for s in samples) * workload["rnaup_bytes_per_fold"]
+    cohort_s = cohort_mem = 0.0
+    for rule in COHORT_RULES:
+        cohort_s += max(0.0, model.estimate(rule, "runtime_s", rnaup_bytes))
+        cohort_mem = max(cohort_mem, model.estimate(rule, "mem_mb", rnaup_bytes) * SAFETY["mem_mb"])
+    stages.append({"stage": "cohort-wide", "jobs": len(COHORT_RULES), "unit": "rnaup_bytes", "work": rnaup_bytes,
+                   "core_h": cohort_s / 3600, "max_job_s": cohort_s, "peak_mem_mb": max(MIN_MEM_MB, cohort_mem)})
+    # SUPER-FOCUS runs after the cohort-wide rules, on the affected CDS of each environment
+    sf_mode = config.get("superfocus_mode", "per_environment")
+    env_bytes = {}
+    for s in samples:
+        if environments.get(s) in config["environment"]:
+            env_bytes[environments[s]] = env_bytes.get(environments[s], 0.0) + work[s]["query_bytes"]
+    sf_jobs = superfocus_jobs(model, sf_mode, env_bytes, workload["unique_query_fraction"],
+                              config.get("superfocus_threads", 4), config.get("superfocus_mem_mb", 16000))
+    sf_core_s = sum(threads * runtime_s for threads, runtime_s, _ in sf_jobs.values())
+    sf_mem_s = sum(runtime_s * mem for _, runtime_s, mem in sf_jobs.values())
+    sf_max_s = max((runtime_s for _, runtime_s, _ in sf_jobs.values()), default=0.0)
+    sf_wall_s = max(sf_core_s / args.cores, sf_mem_s / (args.mem_gb * 1024), sf_max_s)
+    stages.append({"stage": f"superfocus ({sf_mode})", "jobs": len(sf_jobs), "unit": "query_bytes",
+                   "work": sum(env_bytes.values()), "core_h": sf_core_s / 3600, "max_job_s": sf_max_s,
+                   "peak_mem_mb": max((mem for _, _, mem in sf_jobs.values()), default=MIN_MEM_MB)})
+    cohort_s += sf_wall_s
+    disk_bytes = sum(work[s]["disk_bytes"] for s in samples) + rnaup_bytes
+
+    # --- Shards: fewest whose slowest shard fits in the walltime ---
+    mem_mb = args.mem_gb * 1024
+    budget_s = args.walltime * 3600 * HEADROOM
+    plan = None
+    for n_shards in range(1, min(args.max_shards, len(samples)) + 1):
+        walls = [shard_wall_s(costs, shard_samples(samples, n_shards, i), args.cores, mem_mb) for i in range(n_shards)]
+        plan = {"shards": n_shards, "shard_wall_s": max(walls), "samples_per_shard": max(
+            len(shard_samples(samples, n_shards, i)) for i in range(n_shards))}
+        if max(walls) + cohort_s <= budget_s:
+            break
+    fits = plan["shard_wall_s"] + cohort_s <= budget_s
+
+    # --- batch_size: one worker per core, or enough samples to amortise the interpreter start ---
+    python_s = sum(costs[s][rule][1] for s in samples for rule in PYTHON_RULES) / max(1, len(samples))
+    batch_size = 0
+    if python_s < TARGET_BATCH_S and plan["samples_per_shard"] > args.cores:
+        batch_size = max(1, min(math.ceil(plan["samples_per_shard"] / args.cores), math.ceil(TARGET_BATCH_S / max(python_s, 1e-3))))
+    prokka_threads = min(args.cores, max(costs[s]["annotate_prokka"][0] for s in samples))
+    peak_mem_mb = max(stage["peak_mem_mb"] for stage in stages)
+
+    # --- Report ---
+    print(f"{len(samples)} samples, {size(sum(w['genome_nt'] for w in work.values()))} of genomes, "
+          f"{n_mirnas} miRNAs, rnaup_flank {flank}")
+    print(f"Calibration: {calibration if model.calibration else 'none (built-in defaults)'}; work ratios from "
+          f"{f'{n_reference} samples of {reference}' if n_reference else 'defaults'}; hit rate {hit_rate:.3g} per scan pair")
+    print(f"\n{'stage':<38}{'jobs':>6}{'work':>14}  {'unit':<12}{'core-h':>9}{'max job':>12}{'peak mem':>11}")
+    for stage in stages:
+        print(f"{stage['stage']:<38}{stage['jobs']:>6}{stage['work']:>14.4g}  {stage['unit']:<12}"
+              f"{stage['core_h']:>9.2f}{hours(stage['max_job_s']):>12}{stage['peak_mem_mb']:>8.0f} MB")
+    total_core_h = sum(stage["core_h"] for stage in stages)
+    print(f"\nTotal: {total_core_h:.2f} core-h, peak job memory {peak_mem_mb:.0f} MB, disk {size(disk_bytes)} "
+          f"in {out_dir} (without storage_budget)")
+    print(f"\nPlan for nodes of {args.cores} cores and {args.mem_gb:g} GB, {args.walltime:g} h walltime:")
+    print(f"  shards: {plan['shards']} (at most {plan['samples_per_shard']} samples and {hours(plan['shard_wall_s'])} "
+          f"per shard, then {hours(cohort_s)} cohort-wide and SUPER-FOCUS)")
+    print(f"  prokka_max_threads: {prokka_threads}, batch_size: {batch_size}, --cores {args.cores}")
+    if not fits:
+        print(f"  [!] {plan['shards']} shards do not fit in {HEADROOM:.0%} of the walltime; raise --max-shards or the "
+              "walltime, or lower the RNAup load (top_k_sites, rnaup_flank)")
+    if peak_mem_mb > mem_mb:
+        print(f"  [!] The largest job requests {peak_mem_mb:.0f} MB, more than a node has; lower superfocus_mem_mb "
+              "or use larger nodes")
+    if plan["shards"] > 1:
+        print(f"\n  snakemake -s Workflow/Snakefile --config shards={plan['shards']} shard=$i out_dir=Shards/$i "
+              f"batch_size={batch_size} prokka_max_threads={prokka_threads} --cores {args.cores}")
+    else:
+        print(f"\n  snakemake -s Workflow/Snakefile --config batch_size={batch_size} "
+              f"prokka_max_threads={prokka_threads} --cores {args.cores}")
+
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump({"samples": len(samples), "mirnas": n_mirnas, "rnaup_flank": flank, "hit_rate": hit_rate,
+                       "workload": workload, "calibration": calibration if model.calibration else None,
+                       "stages": stages, "total_core_h": total_core_h, "peak_mem_mb": peak_mem_mb,
+                       "disk_bytes": disk_bytes, "cohort_wall_s": cohort_s, "fits_walltime": fits,
+                       "plan": dict(plan, cores=args.cores, mem_gb=args.mem_gb, walltime_h=args.walltime,
+                                    prokka_max_threads=prokka_threads, batch_size=batch_size)}, out, indent=1)
+        print(f"\nPlan written to {args.json}")
@@ -13,17 +13,20 @@ df = pd.read_csv(input_file, sep='\t')
 # --- Get unique environments ---
 unique_environments = df['Environment'].unique()
 
-def generate_plots(env, file_prefix, output_prefix):
+def top20(rankings, ranking, node, count):
+    """First 20 rows of one ranking of the interaction graph (already ranked by interaction_graph.py)."""
+    table = rankings[rankings['ranking'] == ranking].iloc[:20, ]
+    return table.rename(columns={'node': node, 'count': count})[[node, count]]
+
+def generate_plots(env, graph_dir):
     try:
-        # Read the tables into pandas DataFrames
-        table1 = pd.read_csv(f"{file_prefix}_{env}.tsv", sep="\t")
-        table2 = pd.read_csv(f"{output_prefix}_{env}.tsv", sep="\t")
-        
-        # Prepare data for plotting, sorting values, and getting top 20
-        df_taxa_top20 = table1[['miRNA', 'num_unique_MAG']].sort_values(by='num_unique_MAG', ascending=False).iloc[:20,]
-        df_genes_top20 = table1[['miRNA', 'num_unique_genes']].sort_values(by='num_unique_genes', ascending=False).iloc[:20,]
-        df_mir_top20 = table2[['MAG', 'num_unique_miRNAs']].sort_values(by='num_unique_miRNAs', ascending=False).iloc[:20,]
-        df_mag_genes_top20 = table2[['MAG', 'num_unique_genes']].sort_values(by='num_unique_genes', ascending=False).iloc[:20,]
+        # Top-k rankings computed from the sparse incidence matrices
+        rankings = pd.read_csv(f"{graph_dir}/{env}_top_k.tsv", sep="\t")
+
+        df_taxa_top20 = top20(rankings, 'miRNA_by_MAGs', 'miRNA', 'num_unique_MAG')
+        df_genes_top20 = top20(rankings, 'miRNA_by_genes', 'miRNA', 'num_unique_genes')
+        df_mir_top20 = top20(rankings, 'MAG_by_miRNAs', 'MAG', 'num_unique_miRNAs')
+        df_mag_genes_top20 = top20(rankings, 'MAG_by_genes', 'MAG', 'num_unique_genes')
 
         # Create a 2x2 subplot layout
         fig, axs = plt.subplots(2, 2, figsize=(16, 12))  # 2x2 grid with larger size
@@ -78,4 +81,4 @@ def generate_plots(env, file_prefix, output_prefix):
 
 # --- Loop over each unique environment and generate the plots ---
 for env in unique_environments:
-    generate_plots(env, f'{out_dir}/final_results/MAG_result_table_summary_miRNA', f'{out_dir}/final_results/MAG_result_table_summary_taxonomy')
\ No newline at end of file
+    generate_plots(env, f'{out_dir}/graph')
\ No newline at end of file
@@ -6,80 +6,165 @@ import os
 import pandas as pd
 from Bio import SeqIO
 import re
+from stage_profile import StageProfile
+
+
+def load_mirnas(mirna_file):
+    """miRNA sequences by name; shared by every sample."""
+    return SeqIO.to_dict(SeqIO.parse(mirna_file, "fasta"))
+
+
+UNCONFIRMED = "unconfirmed_sites.tsv"
+
+
+def fold_id(mirna, contig, start, end):
+    safe_contig = re.sub(r"[^a-zA-Z0-9_]", "_", contig)
+    return f"{mirna}_{safe_contig}_{start}_{end}"
+
+
+def select_best_sites(df, distance):
+    """Best-site mode: the sites folded, and the folded site each other row is confirmed by.
+
+    Per (miRNA, Locus_tag) the site with the lowest MFE (then p-value) is folded, and so is every
+    other site more than `distance` nt from all the sites of that gene folded before it. Returns the
+    folded (miRNA, Contig, Start, End) keys and, for each row whose own site is not folded, the
+    (Start, End) of the nearest folded site of its gene."""
+    df = df.assign(_gene=df["Locus_tag"].fillna(""))
+    ranked = df.assign(_mfe=pd.to_numeric(df["MFE"], errors="coerce"),
+                       _p=pd.to_numeric(df["Pvalue"], errors="coerce")).sort_values(["_mfe", "_p"], kind="stable")
+    kept = {}
+    for _, row in ranked.iterrows():
+        sites = kept.setdefault((row["miRNA"], row["_gene"]), [])
+        if all(abs(int(row["Start"]) - start) > distance for _, start, _ in sites):
+            sites.append((row["Contig"], int(row["Start"]), int(row["End"])))
+    folded = {(mirna, contig, start, end) for (mirna, _), sites in kept.items() for contig, start, end in sites}
+    best = {}
+    for i, row in df.iterrows():
+        if (row["miRNA"], row["Contig"], int(row["Start"]), int(row["End"])) in folded:
+            continue
+        sites = kept[(row["miRNA"], row["_gene"])]
+        _, start, end = min(sites, key=lambda site: abs(site[1] - int(row["Start"])))
+        best[i] = (start, end)
+    return folded, best
+
+
+def prepare_rnaup_inputs(result_file, mirnas, fasta_file, output_folder, best_site_distance=None):
+    """One RNAup input (<miRNA>&<window>) per hit of a sample; returns the number of folds prepared.
+
+    With best_site_distance set (best-site mode, see select_best_sites) only the best site per
+    (miRNA, gene) and the sites farther than best_site_distance nt from it are folded; the other
+    rows are listed in unconfirmed_sites.tsv with the site that confirms them, for
+    merge_rnaup_results.py --best-site."""
+    with StageProfile("prepare_rnaup_inputs", os.path.basename(os.path.normpath(output_folder))) as profile:
+        # --- Load data ---
+        df = pd.read_csv(result_file, sep="\t")
+        required_cols = {"Start", "End", "Contig", "miRNA"}
+        if not required_cols.issubset(df.columns):
+            raise ValueError(f"Missing columns: {required_cols - set(df.columns)}")
+
+        df["Start"] = pd.to_numeric(df["Start"], errors="coerce")
+        df["End"] = pd.to_numeric(df["End"], errors="coerce")
+        df = df.dropna(subset=["Start", "End"])
+
+        # --- Load sequences ---
+        targets = list(SeqIO.parse(fasta_file, "fasta"))
+
+        # --- Best-site mode: fold the best site per (miRNA, gene), flag the others ---
+        folded = None
+        if best_site_distance is not None:
+            df = df[df["miRNA"].isin(mirnas)]
+            folded, best = select_best_sites(df, best_site_distance)
+            unconfirmed = df.loc[list(best), ["miRNA", "Contig", "Start", "End", "Locus_tag"]].astype({"Start": int, "End": int})
+            unconfirmed["best_Start"] = [best[i][0] for i in unconfirmed.index]
+            unconfirmed["best_End"] = [best[i][1] for i in unconfirmed.index]
+            # Without best-site mode every site is folded once, whatever the number of rows naming it
+            n_sites = len(set(zip(df["miRNA"], df["Contig"], df["Start"].astype(int), df["End"].astype(int))))
+
+        # --- Prepare output ---
+        print("Generating RNAup inputs...")
+        os.makedirs(output_folder, exist_ok=True)
+        metadata_list = []
+        prepared = set()
+
+        for _, row in df.iterrows():
+            contig = row["Contig"]
+            start = int(row["Start"])
+            end = int(row["End"])
+            mirna = row["miRNA"]
+            if folded is not None and ((mirna, contig, start, end) not in folded or (mirna, contig, start, end) in prepared):
+                continue
 
-# --- Input arguments ---
-result_file = sys.argv[1]
-mirna_file = sys.argv[2]
-fasta_file = sys.argv[3]
-output_folder = sys.argv[4]
-
-# --- Load data ---
-df = pd.read_csv(result_file, sep="\t")
-required_cols = {"Start", "End", "Contig", "miRNA"}
-if not required_cols.issubset(df.columns):
-    raise ValueError(f"Missing columns: {required_cols - set(df.columns)}")
-
-df["Start"] = pd.to_numeric(df["Start"], errors="coerce")
-df["End"] = pd.to_numeric(df["End"], errors="coerce")
-df = df.dropna(subset=["Start", "End"])
-
-# --- Load sequences ---
-mirnas = SeqIO.to_dict(SeqIO.parse(mirna_file, "fasta"))
-targets = list(SeqIO.parse(fasta_file, "fasta"))
-
-# --- Prepare output ---
-print("Generating RNAup inputs...")
-os.makedirs(output_folder, exist_ok=True)
-metadata_list = []
-
-for _, row in df.iterrows():
-    contig = row["Contig"]
-    start = int(row["Start"])
-    end = int(row["End"])
-    mirna = row["miRNA"]
-
-    try:
-        mi_seq = str(mirnas[mirna].seq)
-    except KeyError:
-        print(f"[!] miRNA not found: {mirna}")
-        continue
-
-    found = False
-    for record in targets:
-        if contig in record.id:
             try:
-                range_str = record.id.split(":")[1]
-                win_start, win_end = map(int, range_str.split("-"))
-            except Exception:
+                mi_seq = str(mirnas[mirna].seq)
+            except KeyError:
+                print(f"[!] miRNA not found: {mirna}")
                 continue
 
-            if win_start <= start and end <= win_end:
-                target_seq = str(record.seq)
-                found = True
-                break
+            found = False
+            for record in targets:
+                if contig in record.id:
+                    try:
+                        range_str = record.id.split(":")[1]
+                        win_start, win_end = map(int, range_str.split("-"))
+                    except Exception:
+                        continue
 
-    if not found:
-        print(f"[!] No matching window found for: {contig}:{start}-{end}")
-        continue
+                    if win_start <= start and end <= win_end:
+                        target_seq = str(record.seq)
+                        found = True
+                        break
 
-    safe_contig = re.sub(r"[^a-zA-Z0-9_]", "_", contig)
-    seq_id = f"{mirna}_{safe_contig}_{start}_{end}"
-    output_path = os.path.join(output_folder, f"{seq_id}.fa")
-    with open(output_path, "w") as f:
-        f.write(f">{seq_id}\n{mi_seq}&{target_seq}\n")
-
-    metadata_list.append({
-        "file": f"{seq_id}.fa",
-        "miRNA": mirna,
-        "Contig": contig,
-        "Start": start,
-        "End": end
-    })
-
-# --- Save metadata ---
-metadata_df = pd.DataFrame(metadata_list)
-metadata_df.to_csv(os.path.join(output_folder, "input_metadata.tsv"), sep="\t", index=False)
-
-# --- Completion marker ---
-open(os.path.join(output_folder, ".inputs_prepared"), "w").close()
-print("Done.")
\ No newline at end of file
+            if not found:
+                print(f"[!] No matching window found for: {contig}:{start}-{end}")
+                continue
+
+            seq_id = fold_id(mirna, contig, start, end)
+            prepared.add((mirna, contig, start, end))
+            output_path = os.path.join(output_folder, f"{seq_id}.fa")
+            with open(output_path, "w") as f:
+                f.write(f">{seq_id}\n{mi_seq}&{target_seq}\n")
+
+            metadata_list.append({
+                "file": f"{seq_id}.fa",
+                "miRNA": mirna,
+                "Contig": contig,
+                "Start": start,
+                "End": end
+            })
+
+        # --- Save metadata ---
+        metadata_df = pd.DataFrame(metadata_list)
+        profile.count("hits", len(df))
+        profile.count("folds", len(metadata_list))
+        metadata_df.to_csv(os.path.join(output_folder, "input_metadata.tsv"), sep="\t", index=False)
+        if folded is not None:
+            unconfirmed.to_csv(os.path.join(output_folder, UNCONFIRMED), sep="\t", index=False)
+            profile.count("unconfirmed_sites", len(unconfirmed))
+            profile.count("folds_avoided", n_sites - len(folded))
+            print(f"Best-site mode: {len(metadata_list)} folds, {len(unconfirmed)} rows confirmed by the best "
+                  f"site of their gene, {n_sites - len(folded)} folds avoided")
+        elif os.path.exists(os.path.join(output_folder, UNCONFIRMED)):
+            os.remove(os.path.join(output_folder, UNCONFIRMED))
+
+        # --- Inputs and results of sites no longer folded (an earlier run, another mode) ---
+        current = {f"{fold_id(*key)}.fa" for key in prepared}
+        for name in os.listdir(output_folder):
+            stem = re.sub(r"(_rnaup\.txt(\.gz)?|\.fa)$", "", name)
+            if stem != name and f"{stem}.fa" not in current:
+                os.remove(os.path.join(output_folder, name))
+
+        # --- Completion marker ---
+        open(os.path.join(output_folder, ".inputs_prepared"), "w").close()
+        print("Done.")
+        return len(metadata_list)
+
+
+if __name__ == "__main__":
+    # --- Input arguments ---
+    result_file = sys.argv[1]
+    mirna_file = sys.argv[2]
+    fasta_file = sys.argv[3]
+    output_folder = sys.argv[4]
+    # Optional: best-site mode with this distance in nt
+    best_site_distance = int(sys.argv[5]) if len(sys.argv) > 5 else None
+    prepare_rnaup_inputs(result_file, load_mirnas(mirna_file), fasta_file, output_folder, best_site_distance)
\ No newline at end of file
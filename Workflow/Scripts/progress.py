@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import glob
+import time
+import socket
+import argparse
+import subprocess
+from collections import deque
+
+## HolomiRA: live progress of long-running jobs
+#
+# Long-running stages publish a status record per job to $HOLOMIRA_STATUS_DIR/<stage>/<job>.json
+# (the Snakefile sets it to {out_dir}/status), rewritten atomically every few seconds:
+#   state (running/done/failed), phase, items done/total and their unit, throughput over the last
+#   minute and since the start, ETA, current RSS of the job's process tree, host, pid, timestamps.
+# In-process stages use ProgressReporter directly (run_rnaup.py, batch_superfocus.py). External
+# tools are run through `watch`, which follows the tool's process tree:
+#   progress.py watch <stage> <job> [--total-records F | --total-glob G] [--track-file F | --count-glob G] -- <command>
+#     --track-file : progress is the read offset of an input file (RNAhybrid reads its targets in order)
+#     --count-glob : progress is the number of files matching a pattern (SUPER-FOCUS alignments per query file)
+# `status` aggregates the records of a run, flags stragglers and throughput drops, and exits:
+#   progress.py status <out_dir> [--stage S] [--watch SECONDS] [--json]
+
+STATUS_ENV = "HOLOMIRA_STATUS_DIR"
+INTERVAL = 10            # seconds between status writes
+RATE_WINDOW = 60         # seconds of history for the recent throughput
+STALE_AFTER = 6          # intervals without an update before a running job is reported as stale
+STRAGGLER_FACTOR = 2.0   # ETA above this multiple of the stage's median ETA
+SLOWDOWN_FACTOR = 0.5    # recent throughput below this fraction of the job's own mean
+
+
+def process_tree(root):
+    """PIDs of root and all its descendants (Linux /proc)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as handle:
+                # The command name may contain spaces; the parent PID follows its closing parenthesis
+                ppid = int(handle.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [root]
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+
+def rss_mb(pids):
+    """Current resident memory of the given processes, in MB."""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as handle:
+                for line in handle:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+                        break
+        except (OSError, ValueError):
+            continue
+    return total / 1024
+
+
+def read_offset(pids, path):
+    """Largest file offset at which any of the processes has `path` open (None when it is not open)."""
+    target = os.path.realpath(path)
+    offset = None
+    for pid in pids:
+        try:
+            fds = os.listdir(f"/proc/{pid}/fd")
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                if os.readlink(f"/proc/{pid}/fd/{fd}") != target:
+                    continue
+                with open(f"/proc/{pid}/fdinfo/{fd}") as handle:
+                    pos = int(handle.readline().split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            offset = pos if offset is None else max(offset, pos)
+    return offset
+
+
+def count_records(path):
+    """Number of FASTA records in a file."""
+    try:
+        with open(path, "rb") as handle:
+            return sum(chunk.count(b">") for chunk in iter(lambda: handle.read(1 << 20), b""))
+    except OSError:
+        return 0
+
+
+class ProgressReporter:
+    def __init__(self, stage, job, total=None, unit="items", status_dir=None, interval=INTERVAL):
+        self.stage = stage
+        self.job = job or "all"
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+        self.phase = None
+        self.done = 0
+        self.pids = None
+        self.started = time.time()
+        self.history = deque([(self.started, 0)])
+        self.last_write = 0.0
+        self.status_dir = status_dir or os.environ.get(STATUS_ENV)
+        self.publish("running", force=True)
+
+    def advance(self, n=1):
+        self.update(self.done + n)
+
+    def update(self, done, phase=None):
+        self.done = done
+        if phase:
+            self.phase = phase
+        self.publish("running")
+
+    def finish(self):
+        self.publish("done", force=True)
+
+    def fail(self):
+        self.publish("failed", force=True)
+
+    def record(self, state):
+        now = time.time()
+        self.history.append((now, self.done))
+        while len(self.history) > 2 and now - self.history[1][0] > RATE_WINDOW:
+            self.history.popleft()
+        elapsed = now - self.started
+        first_time, first_done = self.history[0]
+        recent = (self.done - first_done) / (now - first_time) if now > first_time else None
+        mean = self.done / elapsed if elapsed > 0 else None
+        remaining = self.total - self.done if self.total is not None else None
+        eta = None
+        if state == "running" and remaining is not None and recent:
+            eta = remaining / recent
+        return {
+            "stage": self.stage,
+            "job": self.job,
+            "state": state,
+            "phase": self.phase,
+            "unit": self.unit,
+            "done": self.done,
+            "total": self.total,
+            "fraction": self.done / self.total if self.total else None,
+            "rate_per_s": recent,
+            "mean_rate_per_s": mean,
+            "eta_s": eta,
+            "rss_mb": rss_mb(self.pids or process_tree(os.getpid())),
+            "elapsed_s": elapsed,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "started": self.started,
+            "updated": now,
+            "interval_s": self.interval,
+        }
+
+    def publish(self, state, force=False):
+        """Rewrite the status file, at most once per interval unless forced."""
+        if not self.status_dir or (not force and time.time() - self.last_write < self.interval):
+            return
+        path = os.path.join(self.status_dir, self.stage, f"{self.job}.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as out:
+            json.dump(self.record(state), out)
+        os.replace(tmp_path, path)
+        self.last_write = time.time()
+
+
+def watch_process(process, reporter, track_file=None, count_glob=None):
+    """Wait for a subprocess, publishing its progress every interval; returns its exit code."""
+    size = os.path.getsize(track_file) if track_file and os.path.exists(track_file) else 0
+    while True:
+        try:
+            retcode = process.wait(timeout=reporter.interval)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        reporter.pids = process_tree(process.pid) + [os.getpid()]
+        done = reporter.done
+        if track_file and size:
+            offset = read_offset(reporter.pids, track_file)
+            if offset is not None:
+                done = round(min(1.0, offset / size) * reporter.total) if reporter.total else offset
+        elif count_glob:
+            done = len(glob.glob(count_glob))
+        reporter.update(done)
+    reporter.pids = None
+    return retcode
+
+
+# --- Aggregation of the status files of a run ---
+def load_status(status_dir, stage=None):
+    records = []
+    for path in sorted(glob.glob(os.path.join(status_dir, stage or "*", "*.json"))):
+        try:
+            with open(path) as handle:
+                records.append(json.load(handle))
+        except (OSError, ValueError):
+            # Being replaced right now; it is picked up on the next refresh
+            continue
+    return records
+
+
+def flag(record, now, median_eta):
+    if record["state"] != "running":
+        return ""
+    if now - record["updated"] > STALE_AFTER * record.get("interval_s", INTERVAL):
+        return "stale"
+    notes = []
+    if median_eta and record["eta_s"] and record["eta_s"] > STRAGGLER_FACTOR * median_eta:
+        notes.append("straggler")
+    if record["rate_per_s"] is not None and record["mean_rate_per_s"] and record["elapsed_s"] > RATE_WINDOW \
+            and record["rate_per_s"] < SLOWDOWN_FACTOR * record["mean_rate_per_s"]:
+        notes.append("slowing")
+    return ",".join(notes)
+
+
+def duration(seconds):
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def summarize(records, now):
+    """Per-stage totals and per-job rows (running jobs first, longest ETA first)."""
+    stages = {}
+    for record in records:
+        stages.setdefault(record["stage"], []).append(record)
+    summary, rows = [], []
+    for stage, jobs in sorted(stages.items()):
+        running = [j for j in jobs if j["state"] == "running"]
+        etas = sorted(j["eta_s"] for j in running if j["eta_s"] is not None)
+        median_eta = etas[len(etas) // 2] if etas else None
+        for job in jobs:
+            job["flag"] = flag(job, now, median_eta)
+        summary.append({
+            "stage": stage,
+            "running": len(running),
+            "done": sum(j["state"] == "done" for j in jobs),
+            "failed": sum(j["state"] == "failed" for j in jobs),
+            "items_done": sum(j["done"] for j in jobs),
+            "items_total": sum(j["total"] or 0 for j in jobs),
+            "rate_per_s": sum(j["rate_per_s"] or 0 for j in running if j["flag"] != "stale"),
+            "rss_mb": sum(j["rss_mb"] or 0 for j in running if j["flag"] != "stale"),
+            "max_eta_s": etas[-1] if etas else None,
+        })
+        rows.extend(jobs)
+    order = {"running": 0, "failed": 1, "done": 2}
+    rows.sort(key=lambda j: (order.get(j["state"], 3), -(j["eta_s"] or 0), j["stage"], j["job"]))
+    return summary, rows
+
+
+def print_status(status_dir, stage=None):
+    now = time.time()
+    records = load_status(status_dir, stage)
+    if not records:
+        print(f"No status records in {status_dir}")
+        return
+    summary, rows = summarize(records, now)
+    print(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)))
+    print(f"{'stage':<22}{'run':>5}{'done':>6}{'fail':>6}{'items':>22}{'items/s':>11}{'RSS MB':>10}{'max ETA':>11}")
+    for s in summary:
+        items = f"{s['items_done']}/{s['items_total'] or '?'}"
+        print(f"{s['stage']:<22}{s['running']:>5}{s['done']:>6}{s['failed']:>6}{items:>22}"
+              f"{s['rate_per_s']:>11.1f}{s['rss_mb']:>10.0f}{duration(s['max_eta_s']):>11}")
+    print()
+    print(f"{'stage':<22}{'job':<28}{'state':<9}{'progress':>24}{'items/s':>10}{'ETA':>10}{'RSS MB':>9}  {'host':<12}{'flag'}")
+    for j in rows:
+        progress = f"{j['done']}/{j['total'] if j['total'] is not None else '?'} {j['unit']}"
+        if j["fraction"] is not None:
+            progress = f"{100 * j['fraction']:.0f}% {progress}"
+        rate = f"{j['rate_per_s']:.1f}" if j["rate_per_s"] is not None else "-"
+        print(f"{j['stage']:<22}{j['job'][:27]:<28}{j['state']:<9}{progress:>24}{rate:>10}"
+              f"{duration(j['eta_s']):>10}{j['rss_mb'] or 0:>9.0f}  {j['host'][:11]:<12}{j['flag']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish or aggregate HolomiRA job progress.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    watch = sub.add_parser("watch", help="Run a command and publish its progress.")
+    watch.add_argument("stage")
+    watch.add_argument("job")
+    watch.add_argument("--unit", default="items")
+    watch.add_argument("--total-records", help="FASTA file whose number of records is the total.")
+    watch.add_argument("--total-glob", help="The total is the number of files matching this pattern.")
+    watch.add_argument("--track-file", help="Input file read sequentially by the command.")
+    watch.add_argument("--count-glob", help="Files matching this pattern are the items done.")
+
+    status = sub.add_parser("status", help="Aggregate the status records of a run.")
+    status.add_argument("out_dir")
+    status.add_argument("--stage")
+    status.add_argument("--watch", type=float, metavar="SECONDS", help="Refresh every SECONDS until interrupted.")
+    status.add_argument("--json", action="store_true", help="Print the records and stage totals as JSON.")
+    # The watched command follows `--` and is never parsed as options of this script
+    argv = sys.argv[1:]
+    cmd = argv[argv.index("--") + 1:] if "--" in argv else []
+    args = parser.parse_args(argv[:argv.index("--")] if "--" in argv else argv)
+
+    if args.command == "status":
+        status_dir = os.path.join(args.out_dir, "status")
+        if args.json:
+            summary, rows = summarize(load_status(status_dir, args.stage), time.time())
+            json.dump({"stages": summary, "jobs": rows}, sys.stdout, indent=1)
+            print()
+            return
+        while True:
+            print_status(status_dir, args.stage)
+            if not args.watch:
+                return
+            time.sleep(args.watch)
+            print()
+
+    if not cmd:
+        parser.error("watch needs a command after --")
+    total = None
+    if args.total_records:
+        total = count_records(args.total_records)
+    elif args.total_glob:
+        total = len(glob.glob(args.total_glob))
+    reporter = ProgressReporter(args.stage, args.job, total, args.unit)
+    # The command inherits stdin/stdout, so it can still be piped or redirected by the caller
+    retcode = watch_process(subprocess.Popen(cmd), reporter, args.track_file, args.count_glob)
+    if retcode == 0:
+        if total is not None:
+            reporter.done = total
+        reporter.finish()
+    else:
+        reporter.fail()
+    sys.exit(retcode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import glob
+import json
+from functools import lru_cache
+
+## HolomiRA: input-size-aware resource model
+#
+# Imported by the Snakefile. Every rule gets threads, mem_mb and runtime (minutes) callables that
+# look at the job's inputs when it is scheduled:
+#   annotate_prokka : genome size (nt)
+#   find_targets    : candidate windows x miRNAs
+#   run_rnaup       : bytes of the RNAup input files (hits x window length)
+#   SUPER-FOCUS     : bytes of the affected CDS queries (run_superfocus_MAG_env, annotate_unique_cds,
+#                     batch_superfocus_MAG)
+#   other rules     : total input size (bytes)
+# Estimates are linear in that size (intercept + slope). The built-in defaults are conservative;
+# calibrate_resources.py fits both terms from the run profile of a finished run
+# ({out_dir}/benchmarks/resource_calibration.json), which the next run picks up.
+
+# Uncalibrated defaults: (intercept, slope per feature unit) for peak memory (MB) and wall time (s)
+DEFAULTS = {
+    "annotate_prokka": {"mem_mb": (1000, 2e-4), "runtime_s": (60, 1e-4)},
+    "find_targets": {"mem_mb": (500, 0), "runtime_s": (30, 1e-4)},
+    "run_rnaup": {"mem_mb": (1000, 0), "runtime_s": (30, 1e-2)},
+    "run_superfocus_MAG_env": {"mem_mb": (8000, 0), "runtime_s": (600, 1e-3)},
+    "annotate_unique_cds": {"mem_mb": (8000, 0), "runtime_s": (600, 1e-3)},
+    "batch_superfocus_MAG": {"mem_mb": (8000, 0), "runtime_s": (600, 1e-3)},
+    "calibrate_rnaup_flank": {"mem_mb": (1000, 0), "runtime_s": (1800, 0)},
+}
+FALLBACK = {"mem_mb": (300, 1e-5), "runtime_s": (60, 1e-6)}
+
+# Head-room over the estimate; both grow with each retry (--retries)
+SAFETY = {"mem_mb": 1.5, "runtime_s": 2.0}
+MIN_MEM_MB = 500
+PROKKA_NT_PER_THREAD = 1_000_000
+
+
+def count_records(path):
+    """Number of FASTA records in a file (0 when it does not exist yet)."""
+    try:
+        with open(path, "rb") as handle:
+            return sum(chunk.count(b">") for chunk in iter(lambda: handle.read(1 << 20), b""))
+    except OSError:
+        return 0
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def genome_nt(fasta):
+    return file_size(fasta)
+
+
+@lru_cache(maxsize=None)
+def count_mirnas(path):
+    # The miRNA file is shared by every find_targets job; read it once
+    return count_records(path)
+
+
+def scan_pairs(targets, mirnas):
+    return count_records(targets) * count_mirnas(mirnas)
+
+
+def fold_bytes(rnaup_dir):
+    try:
+        return sum(e.stat().st_size for e in os.scandir(rnaup_dir) if e.name.endswith(".fa"))
+    except OSError:
+        return 0
+
+
+def query_bytes(function_dir, environment="*"):
+    """Bytes of the SUPER-FOCUS query files (affected CDS) of one or every MAGs_{environment} folder."""
+    return sum(file_size(path) for path in glob.glob(os.path.join(function_dir, f"MAGs_{environment}", "*.fasta")))
+
+
+def input_bytes(paths):
+    return sum(file_size(path) for path in paths if os.path.isfile(path))
+
+
+# Feature of each rule, from its Snakemake input and wildcards
+FEATURES = {
+    "annotate_prokka": lambda input, wildcards: genome_nt(input[0]),
+    "find_targets": lambda input, wildcards: scan_pairs(input.fasta, input.ref_mir),
+    "run_rnaup": lambda input, wildcards: fold_bytes(os.path.dirname(input.marker)),
+    "run_superfocus_MAG_env": lambda input, wildcards: query_bytes(os.path.dirname(input[0]), wildcards.env),
+    "annotate_unique_cds": lambda input, wildcards: file_size(input[0]),
+    "batch_superfocus_MAG": lambda input, wildcards: query_bytes(os.path.dirname(input[0])),
+}
+
+
+class ResourceModel:
+    def __init__(self, calibration_path=None, max_threads=8):
+        self.max_threads = max_threads
+        self.calibration = {}
+        self.calibration_path = calibration_path
+        if calibration_path and os.path.exists(calibration_path):
+            with open(calibration_path) as handle:
+                self.calibration = json.load(handle).get("rules", {})
+
+    def feature(self, rule, input, wildcards=None):
+        if rule in FEATURES:
+            return FEATURES[rule](input, wildcards)
+        return input_bytes(input)
+
+    def estimate(self, rule, field, feature):
+        fitted = self.calibration.get(rule, {}).get(field)
+        intercept, slope = fitted or DEFAULTS.get(rule, FALLBACK)[field]
+        return intercept + slope * feature
+
+    def threads(self, rule):
+        """Threads callable; only Prokka scales with genome size, the other tools are single-threaded."""
+        def threads(wildcards, input):
+            if rule != "annotate_prokka":
+                return 1
+            return max(1, min(self.max_threads, round(self.feature(rule, input, wildcards) / PROKKA_NT_PER_THREAD)))
+        return threads
+
+    def mem_mb(self, rule, floor=MIN_MEM_MB):
+        """Memory callable, in MB; never below floor (e.g. a user-set request such as superfocus_mem_mb)."""
+        def mem_mb(wildcards, input, attempt):
+            estimate = self.estimate(rule, "mem_mb", self.feature(rule, input, wildcards))
+            return int(max(MIN_MEM_MB, floor, estimate * SAFETY["mem_mb"] * attempt))
+        return mem_mb
+
+    def runtime(self, rule):
+        """Runtime callable, in minutes (Snakemake's unit)."""
+        def runtime(wildcards, input, attempt):
+            estimate = self.estimate(rule, "runtime_s", self.feature(rule, input, wildcards))
+            return max(1, int(estimate * SAFETY["runtime_s"] * attempt / 60 + 0.5))
+        return runtime
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import sqlite3
+import argparse
+import pandas as pd
+from stage_profile import StageProfile
+
+## HolomiRA: indexed SQLite store of the final results
+#
+#   results_db.py build <HolomiRA_results.tsv> <RNAup_summary_results.tsv> <out.sqlite>
+#   results_db.py query <out.sqlite> [--mirna X] [--mag Y] [--gene Z] [--rank Genus --taxon g__W] ...
+#
+# Tables: `results` (HolomiRA_results.tsv plus one column per taxonomy rank) and `rnaup`
+# (RNAup_summary_results.tsv). The files are loaded in chunks, so they never have to fit in memory.
+# Lookups by miRNA, MAG, Locus_tag, Gene, Environment or taxonomy rank use an index.
+# From Python: `query(db_path, mirna="bta-miR-21", gene="dnaK")` returns a DataFrame.
+
+TAXONOMY_LEVELS = {
+    'd__': 'Domain',
+    'p__': 'Phylum',
+    'c__': 'Class',
+    'o__': 'Order',
+    'f__': 'Family',
+    'g__': 'Genus',
+    's__': 'Species'
+}
+RESULT_COLUMNS = ["MAG", "Contig", "Start", "End", "miRNA", "Locus_tag", "MFE", "Pvalue", "Gene",
+                  "cds_start", "cds_end", "start_gene", "end_gene", "Taxonomy", "Environment", "pos1", "pos2",
+                  "mirNA_pairing", "dG_total", "dG_binding", "dG_opening_target", "dG_opening_miRNA"]
+RNAUP_COLUMNS = ["Contig", "Start", "End", "miRNA", "pos1", "pos2", "mirNA_pairing", "dG_total", "dG_binding",
+                 "dG_opening_target", "dG_opening_miRNA"]
+INDEXES = {
+    "results": [["miRNA"], ["MAG"], ["Locus_tag"], ["Gene"], ["Environment"], ["miRNA", "Gene"],
+                ["miRNA", "MAG"]] + [[rank] for rank in TAXONOMY_LEVELS.values()],
+    "rnaup": [["miRNA"], ["Contig", "Start", "End"]],
+}
+CHUNKSIZE = 200000
+
+
+def split_taxonomy(taxonomy):
+    """One column per GTDB rank (d__ ... s__) from the Taxonomy strings."""
+    ranks = pd.DataFrame(index=taxonomy.index, columns=list(TAXONOMY_LEVELS.values()), dtype=object)
+    for i, parts in taxonomy.fillna("").str.split(";").items():
+        for part in parts:
+            part = part.strip()
+            name = TAXONOMY_LEVELS.get(part[:3])
+            if name and pd.isna(ranks.at[i, name]):
+                ranks.at[i, name] = part
+    return ranks
+
+
+def load_table(con, table, path, columns, with_taxonomy=False):
+    """Append a TSV to a table chunk by chunk; an empty, blank or missing file gives an empty table."""
+    n_rows = 0
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        try:
+            for chunk in pd.read_csv(path, sep="\t", chunksize=CHUNKSIZE):
+                if with_taxonomy:
+                    chunk = pd.concat([chunk, split_taxonomy(chunk["Taxonomy"])], axis=1)
+                chunk.to_sql(table, con, if_exists="append", index=False)
+                n_rows += len(chunk)
+        except pd.errors.EmptyDataError:
+            # A blank file without a header line, as older merges wrote when there were no RNAup results
+            pass
+    if n_rows == 0:
+        names = columns + (list(TAXONOMY_LEVELS.values()) if with_taxonomy else [])
+        con.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(f'[{n}]' for n in names)})")
+    return n_rows
+
+
+def build_database(results_path, rnaup_path, db_path):
+    """Build the store next to its final location and move it in place once complete."""
+    tmp_path = f"{db_path}.tmp{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    con = sqlite3.connect(tmp_path)
+    con.execute("PRAGMA journal_mode = OFF")
+    con.execute("PRAGMA synchronous = OFF")
+    n_results = load_table(con, "results", results_path, RESULT_COLUMNS, with_taxonomy=True)
+    n_rnaup = load_table(con, "rnaup", rnaup_path, RNAUP_COLUMNS)
+    for table, indexes in INDEXES.items():
+        for columns in indexes:
+            name = f"idx_{table}_{'_'.join(columns)}"
+            con.execute(f"CREATE INDEX {name} ON {table} ({', '.join(f'[{c}]' for c in columns)})")
+    con.execute("ANALYZE")
+    con.commit()
+    con.close()
+    os.replace(tmp_path, db_path)
+    return n_results, n_rnaup
+
+
+def query(db_path, mirna=None, mag=None, gene=None, locus_tag=None, environment=None, rank=None, taxon=None,
+          columns=None, distinct=False, limit=None, table="results"):
+    """Rows of `table` matching every given filter (exact matches), as a DataFrame."""
+    filters = {"miRNA": mirna, "MAG": mag, "Gene": gene, "Locus_tag": locus_tag, "Environment": environment}
+    if rank:
+        if rank not in TAXONOMY_LEVELS.values():
+            raise ValueError(f"Unknown taxonomy rank: {rank} (expected one of {', '.join(TAXONOMY_LEVELS.values())})")
+        filters[rank] = taxon
+    where = [(column, value) for column, value in filters.items() if value is not None]
+    select = ", ".join(f"[{c}]" for c in columns) if columns else "*"
+    sql = f"SELECT {'DISTINCT ' if distinct else ''}{select} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(f"[{column}] = ?" for column, _ in where)
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    with sqlite3.connect(f"file:{db_path}?mode=ro", uri=True) as con:
+        return pd.read_sql_query(sql, con, params=[value for _, value in where])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the indexed HolomiRA results store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Build the SQLite store from the final result tables.")
+    build.add_argument("results", help="HolomiRA_results.tsv")
+    build.add_argument("rnaup", help="RNAup_summary_results.tsv")
+    build.add_argument("db", help="Output SQLite file.")
+
+    ask = sub.add_parser("query", help="Look up results; filters are combined with AND.")
+    ask.add_argument("db", help="SQLite file written by `build`.")
+    ask.add_argument("--mirna")
+    ask.add_argument("--mag")
+    ask.add_argument("--gene")
+    ask.add_argument("--locus-tag")
+    ask.add_argument("--environment")
+    ask.add_argument("--rank", choices=list(TAXONOMY_LEVELS.values()), help="Taxonomy rank to filter on (Domain ... Species), used with --taxon.")
+    ask.add_argument("--taxon", help="Rank value with its prefix, e.g. g__Prevotella.")
+    ask.add_argument("--columns", help="Comma-separated columns to print (default: all).")
+    ask.add_argument("--distinct", action="store_true", help="Print each distinct row once.")
+    ask.add_argument("--limit", type=int)
+    ask.add_argument("--table", choices=["results", "rnaup"], default="results")
+    ask.add_argument("--sql", help="Run this SQL statement instead of the filters.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        profile = StageProfile("index_results")
+        n_results, n_rnaup = build_database(args.results, args.rnaup, args.db)
+        profile.count("results", n_results)
+        profile.count("rnaup", n_rnaup)
+        print(f"Indexed {n_results} results and {n_rnaup} RNAup records in {args.db}")
+        return
+
+    if bool(args.rank) != bool(args.taxon):
+        parser.error("--rank and --taxon must be given together")
+    if args.sql:
+        with sqlite3.connect(f"file:{args.db}?mode=ro", uri=True) as con:
+            rows = pd.read_sql_query(args.sql, con)
+    else:
+        rows = query(args.db, args.mirna, args.mag, args.gene, args.locus_tag, args.environment, args.rank,
+                     args.taxon, args.columns.split(",") if args.columns else None, args.distinct, args.limit,
+                     args.table)
+    rows.to_csv(sys.stdout, sep="\t", index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,86 +2,143 @@
 import pandas as pd
 import sys
 import os
+import gzip
+import heapq
+from stage_profile import StageProfile
 
-# --- Retrieve command line arguments: MAG_ID, output directory, and input file ---
-MAG_ID = sys.argv[1]
-out_dir = sys.argv[2]
-input_file = sys.argv[3]
-
-# --- Define file paths for the necessary files ---
-cds_file = f"{out_dir}/annotation/{MAG_ID}/{MAG_ID}_cds_fiveprime.gff"
-tsv_file = f"{out_dir}/annotation/{MAG_ID}/{MAG_ID}.tsv"
-id_info_file = f"{out_dir}/annotation/{MAG_ID}/{MAG_ID}_IDs.txt"
-output_file_path = f"{out_dir}/rnahybrid/{MAG_ID}_bsites.tsv"
-
-# --- Header for the output file (includes start_gene and end_gene) ---
-header = "sample\tseq\tstart\tend\tmir\tID\tmfe\tp\tgene\tcds_start\tcds_end\tstart_gene\tend_gene\n"
-
-# --- If the input file is empty, create a file with only the header and exit ---
-if os.stat(input_file).st_size == 0:
-    with open(output_file_path, "w") as output_file:
-        output_file.write(header)
-    sys.exit()
-
-# --- Read the input file containing miRNA binding information ---
-a = pd.read_csv(input_file, sep=':', names=['seq', 'position', 'nc', 'mir', 'ncmir', 'mfe', 'p', '1', '2', '3', '4', '5'])
-a[['startend', 'strand']] = a['position'].str.split("(", expand=True)
-a[['start', 'end']] = a['startend'].str.split("-", expand=True)
-a['start'] = a['start'].astype(int)
-a['end'] = a['end'].astype(int)
-
-# --- Read the *_cds_fiveprime.gff file (contains gene coordinates) ---
-id_df = pd.read_csv(cds_file, sep="\t", header=None, names=["seq", "cds_start", "cds_end", "ID", "strand"])
-id_df["ID"] = id_df["ID"].str.replace("ID=", "", regex=True).str.strip()
-id_df["cds_start"] = id_df["cds_start"].astype(int)
-id_df["cds_end"] = id_df["cds_end"].astype(int)
-
-# --- Read the gene annotation TSV file and filter for gene entries ---
-tsv = pd.read_csv(tsv_file, sep="\t")
-tsv = tsv[tsv['ftype'] == 'gene'][["locus_tag", "gene"]].drop_duplicates()
-tsv["locus_tag"] = tsv["locus_tag"].str.strip()
-tsv["gene"] = tsv["gene"].fillna("")
-
-# --- Create a list to store merged data from miRNA bindings and gene coordinates ---
-merged_data = []
-for _, row in a.iterrows():
-    matches = id_df[
-        (id_df["seq"] == row["seq"]) &
-        (id_df["cds_start"] <= row["end"]) &
-        (id_df["cds_end"] >= row["start"])
-    ]
-    for _, match in matches.iterrows():
-        merged_data.append({
-            "sample": MAG_ID,
-            "seq": row["seq"],
-            "start": row["start"],
-            "end": row["end"],
-            "mir": row["mir"],
-            "ID": match["ID"],
-            "mfe": row["mfe"],
-            "p": row["p"],
-            "cds_start": match["cds_start"],
-            "cds_end": match["cds_end"]
-        })
-
-# --- If no matches are found, create an empty file with only the header and exit ---
-if not merged_data:
-    with open(output_file_path, "w") as output_file:
-        output_file.write(header)
-    sys.exit()
-
-# --- Create DataFrame from merged data and merge with gene annotations ---
-a_id = pd.DataFrame(merged_data)
-final_data = a_id.merge(tsv, how="left", left_on="ID", right_on="locus_tag")
-final_data = final_data[["sample", "seq", "start", "end", "mir", "ID", "mfe", "p", "gene", "cds_start", "cds_end"]]
-
-# --- Read the {MAG_ID}_ID.txt file to extract gene start and end positions ---
-id_info = pd.read_csv(id_info_file, sep="\t", header=None, names=["seq", "start_gene", "end_gene", "ID_raw", "strand"])
-id_info["ID"] = id_info["ID_raw"].str.replace("ID=", "", regex=True).str.strip()
-id_info = id_info[["ID", "start_gene", "end_gene"]]
-
-# --- Merge the gene start and end info into final_data based on matching ID ---
-final_data = final_data.merge(id_info, on="ID", how="left")
-
-# --- Save only the final merged data to the output file ---
-final_data.to_csv(output_file_path, sep="\t", index=False)
\ No newline at end of file
+# --- Empty RNAhybrid output? (storage-budget runs gzip it; pandas reads it transparently) ---
+def is_empty(path):
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as handle:
+            return not handle.read(1)
+    return os.stat(path).st_size == 0
+
+
+CHUNKSIZE = 100000
+
+
+def rnahybrid_format(MAG_ID, out_dir, input_file, top_k=0, top_k_by="gene", top_k_window=1000):
+    """Join the RNAhybrid hits of one MAG to its CDS and genes ({MAG_ID}_bsites.tsv); returns the number of binding sites.
+
+    With top_k > 0 only the top_k sites with the lowest MFE (then p-value) are kept per (miRNA, gene)
+    or, with top_k_by="window", per (miRNA, contig window of top_k_window nt)."""
+    with StageProfile("format_rnahybrid", MAG_ID) as profile:
+        # --- Define file paths for the necessary files ---
+        cds_file = f"{out_dir}/annotation/{MAG_ID}/{MAG_ID}_cds_fiveprime.gff"
+        tsv_file = f"{out_dir}/annotation/{MAG_ID}/{MAG_ID}.tsv"
+        id_info_file = f"{out_dir}/annotation/{MAG_ID}/{MAG_ID}_IDs.txt"
+        output_file_path = f"{out_dir}/rnahybrid/{MAG_ID}_bsites.tsv"
+
+        # --- Header for the output file (includes start_gene and end_gene) ---
+        header = "sample\tseq\tstart\tend\tmir\tID\tmfe\tp\tgene\tcds_start\tcds_end\tstart_gene\tend_gene\n"
+
+        # --- If the input file is empty, create a file with only the header and exit ---
+        if is_empty(input_file):
+            with open(output_file_path, "w") as output_file:
+                output_file.write(header)
+            return 0
+
+        # --- Read the *_cds_fiveprime.gff file (contains gene coordinates) ---
+        id_df = pd.read_csv(cds_file, sep="\t", header=None, names=["seq", "cds_start", "cds_end", "ID", "strand"])
+        id_df["ID"] = id_df["ID"].str.replace("ID=", "", regex=True).str.strip()
+        id_df["cds_start"] = id_df["cds_start"].astype(int)
+        id_df["cds_end"] = id_df["cds_end"].astype(int)
+
+        # --- Read the gene annotation TSV file and filter for gene entries ---
+        tsv = pd.read_csv(tsv_file, sep="\t")
+        tsv = tsv[tsv['ftype'] == 'gene'][["locus_tag", "gene"]].drop_duplicates()
+        tsv["locus_tag"] = tsv["locus_tag"].str.strip()
+        tsv["gene"] = tsv["gene"].fillna("")
+
+        # --- Read the miRNA binding information chunk by chunk and match it to the CDS ---
+        # With top_k, each (miRNA, gene) or (miRNA, contig window) keeps its best sites in a heap of
+        # size top_k whose root is the worst kept site (highest MFE, then highest p-value, then latest)
+        merged_data = []
+        heaps = {}
+        n_hits = n_sites = 0
+        for a in pd.read_csv(input_file, sep=':', names=['seq', 'position', 'nc', 'mir', 'ncmir', 'mfe', 'p', '1', '2', '3', '4', '5'], chunksize=CHUNKSIZE):
+            a[['startend', 'strand']] = a['position'].str.split("(", expand=True)
+            a[['start', 'end']] = a['startend'].str.split("-", expand=True)
+            a['start'] = a['start'].astype(int)
+            a['end'] = a['end'].astype(int)
+            n_hits += len(a)
+
+            for _, row in a.iterrows():
+                matches = id_df[
+                    (id_df["seq"] == row["seq"]) &
+                    (id_df["cds_start"] <= row["end"]) &
+                    (id_df["cds_end"] >= row["start"])
+                ]
+                for _, match in matches.iterrows():
+                    site = {
+                        "sample": MAG_ID,
+                        "seq": row["seq"],
+                        "start": row["start"],
+                        "end": row["end"],
+                        "mir": row["mir"],
+                        "ID": match["ID"],
+                        "mfe": row["mfe"],
+                        "p": row["p"],
+                        "cds_start": match["cds_start"],
+                        "cds_end": match["cds_end"]
+                    }
+                    n_sites += 1
+                    if not top_k:
+                        merged_data.append(site)
+                        continue
+                    if top_k_by == "gene":
+                        group = (row["mir"], match["ID"])
+                    else:
+                        group = (row["mir"], row["seq"], row["start"] // top_k_window)
+                    item = (-float(row["mfe"]), -float(row["p"]), -n_sites, site)
+                    heap = heaps.setdefault(group, [])
+                    if len(heap) < top_k:
+                        heapq.heappush(heap, item)
+                    else:
+                        heapq.heappushpop(heap, item)
+        profile.count("hits", n_hits)
+
+        # --- Kept sites, back in input order ---
+        if top_k:
+            kept = sorted((item for heap in heaps.values() for item in heap), key=lambda item: -item[2])
+            merged_data = [item[3] for item in kept]
+            dropped = n_sites - len(merged_data)
+            profile.count("dropped_sites", dropped)
+            print(f"{MAG_ID}: kept the best {top_k} sites per (miRNA, {top_k_by}): "
+                  f"{len(merged_data)} of {n_sites} sites, {dropped} dropped", file=sys.stderr)
+
+        # --- If no matches are found, create an empty file with only the header and exit ---
+        if not merged_data:
+            with open(output_file_path, "w") as output_file:
+                output_file.write(header)
+            return 0
+
+        # --- Create DataFrame from merged data and merge with gene annotations ---
+        a_id = pd.DataFrame(merged_data)
+        final_data = a_id.merge(tsv, how="left", left_on="ID", right_on="locus_tag")
+        final_data = final_data[["sample", "seq", "start", "end", "mir", "ID", "mfe", "p", "gene", "cds_start", "cds_end"]]
+
+        # --- Read the {MAG_ID}_ID.txt file to extract gene start and end positions ---
+        id_info = pd.read_csv(id_info_file, sep="\t", header=None, names=["seq", "start_gene", "end_gene", "ID_raw", "strand"])
+        id_info["ID"] = id_info["ID_raw"].str.replace("ID=", "", regex=True).str.strip()
+        id_info = id_info[["ID", "start_gene", "end_gene"]]
+
+        # --- Merge the gene start and end info into final_data based on matching ID ---
+        final_data = final_data.merge(id_info, on="ID", how="left")
+        profile.count("bsites", len(final_data))
+
+        # --- Save only the final merged data to the output file ---
+        final_data.to_csv(output_file_path, sep="\t", index=False)
+        return len(final_data)
+
+
+if __name__ == "__main__":
+    # --- Retrieve command line arguments: MAG_ID, output directory, input file and optional top-k settings ---
+    # rnahybrid_format.py <MAG_ID> <out_dir> <input_file> [top_k] [gene|window] [window_nt]
+    top_k = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    top_k_by = sys.argv[5] if len(sys.argv) > 5 else "gene"
+    top_k_window = int(sys.argv[6]) if len(sys.argv) > 6 else 1000
+    if top_k_by not in ("gene", "window"):
+        print(f"Unknown top-k scope '{top_k_by}' (expected 'gene' or 'window')")
+        sys.exit(1)
+    rnahybrid_format(sys.argv[1], sys.argv[2], sys.argv[3], top_k, top_k_by, top_k_window)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import glob
+import html
+import pandas as pd
+
+## HolomiRA: run profile report
+#
+# Joins the Snakemake benchmark files ({out_dir}/benchmarks/<rule>/<sample|env|all>.tsv) with the
+# stage records written by the scripts ({out_dir}/benchmarks/stages/<rule>/<sample>.json) into:
+#   run_profile.json : one record per job (machine-readable)
+#   run_profile.tsv  : per-rule totals ranked by wall-clock cost
+#   run_profile.html : the same ranking plus the most expensive jobs
+
+if len(sys.argv) < 2:
+    print("Usage: run_profile.py <output_dir>")
+    sys.exit(1)
+
+out_dir = sys.argv[1]
+bench_dir = os.path.join(out_dir, "benchmarks")
+stage_dir = os.path.join(bench_dir, "stages")
+
+# Snakemake benchmark columns -> run profile fields (memory in MB, I/O in MB)
+BENCH_COLUMNS = {
+    "s": "wall_s",
+    "cpu_time": "cpu_s",
+    "max_rss": "max_rss_mb",
+    "io_in": "io_in_mb",
+    "io_out": "io_out_mb",
+    "mean_load": "mean_load",
+}
+
+# --- Read the Snakemake benchmark files ---
+jobs = {}
+for path in sorted(glob.glob(os.path.join(bench_dir, "*", "*.tsv"))):
+    rule = os.path.basename(os.path.dirname(path))
+    job = os.path.splitext(os.path.basename(path))[0]
+    try:
+        bench = pd.read_csv(path, sep="\t")
+    except (pd.errors.EmptyDataError, pd.errors.ParserError):
+        print(f"[!] Unreadable benchmark file skipped: {path}")
+        continue
+    # Repeated benchmarks (benchmark: repeat(...)) are averaged
+    means = bench.apply(pd.to_numeric, errors="coerce").mean()
+    record = {"rule": rule, "job": job}
+    for column, field in BENCH_COLUMNS.items():
+        value = means.get(column)
+        record[field] = None if value is None or pd.isna(value) else float(value)
+    jobs[(rule, job)] = record
+
+# --- Attach the script-level stage records (item counts, bytes, script RSS) ---
+for path in sorted(glob.glob(os.path.join(stage_dir, "*", "*.json"))):
+    rule = os.path.basename(os.path.dirname(path))
+    job = os.path.splitext(os.path.basename(path))[0]
+    try:
+        with open(path) as handle:
+            stage = json.load(handle)
+    except (OSError, ValueError):
+        print(f"[!] Unreadable stage record skipped: {path}")
+        continue
+    record = jobs.setdefault((rule, job), {"rule": rule, "job": job})
+    record["items"] = stage.get("items", {})
+    for field in ("wall_s", "cpu_s", "max_rss_mb", "read_bytes", "write_bytes"):
+        if field in stage:
+            record[f"script_{field}"] = stage[field]
+            # Jobs without a benchmark file (e.g. scripts run by hand) fall back to the script's own timing
+            if record.get(field) is None and field in BENCH_COLUMNS.values():
+                record[field] = stage[field]
+
+if not jobs:
+    print(f"No benchmark files found in {bench_dir}")
+    sys.exit(0)
+
+records = sorted(jobs.values(), key=lambda r: (r["rule"], r["job"]))
+with open(os.path.join(bench_dir, "run_profile.json"), "w") as out:
+    json.dump({"out_dir": os.path.abspath(out_dir), "jobs": records}, out, indent=1)
+
+# --- Per-rule totals, ranked by cost ---
+df = pd.DataFrame(records)
+for field in BENCH_COLUMNS.values():
+    if field not in df.columns:
+        df[field] = None
+    df[field] = pd.to_numeric(df[field], errors="coerce")
+
+summary = df.groupby("rule").agg(
+    jobs=("job", "count"),
+    wall_s=("wall_s", "sum"),
+    mean_wall_s=("wall_s", "mean"),
+    max_wall_s=("wall_s", "max"),
+    cpu_s=("cpu_s", "sum"),
+    max_rss_mb=("max_rss_mb", "max"),
+    io_in_mb=("io_in_mb", "sum"),
+    io_out_mb=("io_out_mb", "sum"),
+)
+total_wall = summary["wall_s"].sum()
+summary["wall_share_pct"] = 100 * summary["wall_s"] / total_wall if total_wall else 0.0
+
+# Item counts (hits, windows, folds, ...) summed per rule
+if "items" in df.columns:
+    items = pd.DataFrame([i if isinstance(i, dict) else {} for i in df["items"]], index=df.index)
+    if not items.empty:
+        items["rule"] = df["rule"]
+        item_totals = items.groupby("rule").sum(min_count=1)
+        summary = summary.join(item_totals.astype("Int64").add_prefix("items_"))
+
+summary = summary.sort_values(["wall_s", "cpu_s"], ascending=False).reset_index()
+summary.round(3).to_csv(os.path.join(bench_dir, "run_profile.tsv"), sep="\t", index=False)
+
+# --- HTML report ---
+top_jobs = df.sort_values("wall_s", ascending=False).head(25)[
+    ["rule", "job", "wall_s", "cpu_s", "max_rss_mb", "io_in_mb", "io_out_mb"]]
+with open(os.path.join(bench_dir, "run_profile.html"), "w") as out:
+    out.write("<html><head><meta charset='utf-8'><title>HolomiRA run profile</title>"
+              "<style>body{font-family:sans-serif} table{border-collapse:collapse} "
+              "td,th{border:1px solid #ccc;padding:2px 6px;text-align:right}</style></head><body>\n")
+    out.write(f"<h1>HolomiRA run profile</h1>\n<p>{html.escape(os.path.abspath(out_dir))}: "
+              f"{len(df)} jobs, {total_wall:.1f} s total wall-clock time</p>\n")
+    out.write("<h2>Rules ranked by wall-clock time</h2>\n")
+    out.write(summary.round(3).to_html(index=False, na_rep=""))
+    out.write("\n<h2>Most expensive jobs</h2>\n")
+    out.write(top_jobs.round(3).to_html(index=False, na_rep=""))
+    out.write("\n</body></html>\n")
+
+print(f"Run profile written to {bench_dir} (run_profile.json, run_profile.tsv, run_profile.html)")
+for _, row in summary.head(5).iterrows():
+    print(f"   {row['rule']:<40} {row['wall_s']:>10.1f} s  ({row['wall_share_pct']:.1f}%)")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import glob
+import gzip
+import hashlib
+import subprocess
+from stage_profile import StageProfile
+from progress import ProgressReporter
+
+## HolomiRA: resumable RNAup folding for one sample
+#
+# Folds every <hit>.fa prepared by prepare_rnaup_inputs.py into <hit>_rnaup.txt (`RNAup -b`), as
+# the original shell loop did. Each finished fold is appended to a completion journal
+# (.rnaup_journal.tsv: input file, SHA-1 of the input, output size) and flushed to disk, so a
+# restarted job skips folds that are already done and still valid instead of refolding the sample.
+# Storage-budget mode (--storage-budget) gzips each output on write (<hit>_rnaup.txt.gz) and removes
+# the prepared inputs once every fold of the sample is done. Progress (folds done/total, folds per
+# second, ETA) is published to the run's status directory (see progress.py).
+
+JOURNAL = ".rnaup_journal.tsv"
+
+if len(sys.argv) < 2:
+    print("Usage: run_rnaup.py <rnaup_sample_dir> [--storage-budget]")
+    sys.exit(1)
+
+rnaup_dir = sys.argv[1]
+storage_budget = "--storage-budget" in sys.argv[2:]
+profile = StageProfile("run_rnaup", os.path.basename(os.path.normpath(rnaup_dir)))
+journal_path = os.path.join(rnaup_dir, JOURNAL)
+
+
+def file_sha1(path):
+    with open(path, "rb") as handle:
+        return hashlib.sha1(handle.read()).hexdigest()
+
+
+def rnaup_output(fa_name):
+    suffix = "_rnaup.txt.gz" if storage_budget else "_rnaup.txt"
+    return os.path.join(rnaup_dir, fa_name[:-len(".fa")] + suffix)
+
+
+def is_valid_output(path, size):
+    """A fold is valid when its output still has the size it had when it was journaled."""
+    return os.path.exists(path) and os.path.getsize(path) == size and size > 0
+
+
+# --- Read the journal of a previous (interrupted) attempt ---
+completed = {}
+if os.path.exists(journal_path):
+    with open(journal_path) as journal:
+        for line in journal:
+            fields = line.rstrip("\n").split("\t")
+            # A line cut short by the interruption is ignored; that fold is simply redone
+            if len(fields) != 3 or not fields[2].isdigit():
+                continue
+            completed[fields[0]] = (fields[1], int(fields[2]))
+
+fa_files = sorted(os.path.basename(p) for p in glob.glob(os.path.join(rnaup_dir, "*.fa")))
+print(f"RNAup inputs: {len(fa_files)} ({len(completed)} in journal)")
+progress = ProgressReporter("run_rnaup", profile.sample, len(fa_files), "folds")
+
+# --- Fold the remaining hits, journaling each one as soon as its output is complete ---
+n_skipped = n_folded = 0
+with open(journal_path, "a") as journal:
+    for fa_name in fa_files:
+        fa_path = os.path.join(rnaup_dir, fa_name)
+        out_path = rnaup_output(fa_name)
+        digest = file_sha1(fa_path)
+
+        done = completed.get(fa_name)
+        if done and done[0] == digest and is_valid_output(out_path, done[1]):
+            n_skipped += 1
+            progress.advance()
+            continue
+
+        # Write to a temporary file and rename, so a killed fold never leaves a partial output
+        tmp_path = out_path + ".tmp"
+        with open(fa_path) as fa:
+            if storage_budget:
+                fold = subprocess.run(["RNAup", "-b"], stdin=fa, stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL, cwd=rnaup_dir)
+                retcode = fold.returncode
+                with gzip.open(tmp_path, "wb") as out:
+                    out.write(fold.stdout)
+            else:
+                with open(tmp_path, "w") as out:
+                    retcode = subprocess.call(["RNAup", "-b"], stdin=fa, stdout=out,
+                                              stderr=subprocess.DEVNULL, cwd=rnaup_dir)
+        if retcode != 0:
+            os.remove(tmp_path)
+            progress.fail()
+            print(f"ERROR: RNAup exited with code {retcode} on {fa_name}; "
+                  f"{n_folded + n_skipped} completed folds are kept in {journal_path}")
+            sys.exit(retcode if retcode > 0 else 1)
+        os.replace(tmp_path, out_path)
+
+        journal.write(f"{fa_name}\t{digest}\t{os.path.getsize(out_path)}\n")
+        journal.flush()
+        os.fsync(journal.fileno())
+        n_folded += 1
+        progress.advance()
+
+# --- Remove the dot-plot files RNAup -b writes next to its outputs ---
+for path in glob.glob(os.path.join(rnaup_dir, "*_w*_u*.out")):
+    os.remove(path)
+
+# --- Storage budget: the prepared inputs are consumed ---
+if storage_budget:
+    for fa_name in fa_files:
+        os.remove(os.path.join(rnaup_dir, fa_name))
+
+profile.count("folds", n_folded)
+profile.count("resumed", n_skipped)
+progress.finish()
+print(f"RNAup done: {n_folded} folded, {n_skipped} resumed from the journal")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import zlib
+import shutil
+import argparse
+
+## HolomiRA: sharded cohort runs
+#
+#   shards.py plan <sample_tab> <n_shards>
+#   shards.py reduce <out_dir> <sample_tab> <shard_out_dir> [shard_out_dir ...]
+#
+# With `shards: N` and `shard: i` in the config, the Snakefile runs only the samples of shard i,
+# up to their per-sample outputs (annotation, RNAhybrid hits, binding sites, binding windows and
+# RNAup folds), into that shard's own out_dir. Shards can run on different machines or clusters.
+# A sample's shard depends on its ID only (crc32 of the ID modulo N), so adding samples to
+# sample_tab never moves the others.
+#
+# `reduce` links the per-sample outputs of every shard into one out_dir (hard links, copies across
+# file systems), checking that each sample of sample_tab is complete in exactly one shard. Running
+# the workflow on that out_dir without `shards` then builds only the cohort-wide files (all_bsites,
+# finalresults, sig_hits, RNAup merge), final results, summaries and plots. They are concatenated
+# in sample_tab order as in a single-node run, so the merged outputs are byte-identical to it.
+
+# Per-sample outputs, relative to out_dir; directories are linked file by file
+SAMPLE_PATHS = [
+    "annotation/{sample}",
+    "target_fasta/{sample}_filtered.fa",
+    "target_fasta/{sample}_CDS.fa",
+    "rnahybrid/{sample}_putative_targets.tsv",
+    "rnahybrid/{sample}_putative_targets.tsv.gz",
+    "rnahybrid/{sample}_bsites.tsv",
+    "rnahybrid/{sample}_finalresults.tsv",
+    "structure/{sample}",
+    "RNAup/{sample}",
+]
+# A sample is complete once its RNAup folds are done
+DONE_PATH = "RNAup/{sample}/.done"
+
+
+def shard_of(sample, n_shards):
+    # crc32, not hash(): every machine must agree on the shard of a sample
+    return zlib.crc32(str(sample).encode()) % n_shards
+
+
+def load_samples(sample_tab):
+    # pandas is imported here: link_file is also used from the Prokka environment (annotation_cache.py)
+    import pandas as pd
+    return pd.read_csv(sample_tab, header=0, sep="\t")["SampleID"].drop_duplicates().to_list()
+
+
+def shard_samples(samples, n_shards, shard):
+    """Samples of one shard, in sample_tab order."""
+    return [s for s in samples if shard_of(s, n_shards) == shard]
+
+
+def link_file(src, dst):
+    """Hard-link src to dst, or copy it (with its timestamps) when a link is not possible."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+        if os.path.samefile(src, dst):
+            return
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def link_path(src, dst):
+    """Link a file, or every file below a directory; returns the number of files."""
+    if os.path.isfile(src):
+        link_file(src, dst)
+        return 1
+    n_files = 0
+    for root, dirs, files in os.walk(src):
+        dirs.sort()
+        for f in sorted(files):
+            link_file(os.path.join(root, f), os.path.join(dst, os.path.relpath(root, src), f))
+            n_files += 1
+    return n_files
+
+
+def sample_records(shard_dir, sample):
+    """Benchmark files and stage records of the per-sample jobs of one sample."""
+    benchmarks = os.path.join(shard_dir, "benchmarks")
+    if not os.path.isdir(benchmarks):
+        return []
+    records = []
+    for rule in sorted(os.listdir(benchmarks)):
+        if os.path.isfile(os.path.join(benchmarks, rule, f"{sample}.tsv")):
+            records.append(os.path.join("benchmarks", rule, f"{sample}.tsv"))
+    stages = os.path.join(benchmarks, "stages")
+    if os.path.isdir(stages):
+        for stage in sorted(os.listdir(stages)):
+            if os.path.isfile(os.path.join(stages, stage, f"{sample}.json")):
+                records.append(os.path.join("benchmarks", "stages", stage, f"{sample}.json"))
+    return records
+
+
+def plan(sample_tab, n_shards):
+    samples = load_samples(sample_tab)
+    print("shard\tsamples\tfirst\tlast")
+    for shard in range(n_shards):
+        members = shard_samples(samples, n_shards, shard)
+        print(f"{shard}\t{len(members)}\t{members[0] if members else ''}\t{members[-1] if members else ''}")
+
+
+def reduce(out_dir, sample_tab, shard_dirs):
+    samples = load_samples(sample_tab)
+    found = {}
+    for sample in samples:
+        found[sample] = [d for d in shard_dirs if os.path.exists(os.path.join(d, DONE_PATH.format(sample=sample)))]
+    missing = [s for s, dirs in found.items() if not dirs]
+    duplicated = [s for s, dirs in found.items() if len(dirs) > 1]
+    if missing or duplicated:
+        if missing:
+            print(f"[!] {len(missing)} samples are not complete in any shard: {', '.join(missing[:10])}"
+                  f"{' ...' if len(missing) > 10 else ''}")
+        if duplicated:
+            print(f"[!] {len(duplicated)} samples are in several shards: {', '.join(duplicated[:10])}"
+                  f"{' ...' if len(duplicated) > 10 else ''}")
+        sys.exit(1)
+
+    n_files = 0
+    for sample in samples:
+        shard_dir = found[sample][0]
+        paths = [p.format(sample=sample) for p in SAMPLE_PATHS] + sample_records(shard_dir, sample)
+        for path in paths:
+            if os.path.exists(os.path.join(shard_dir, path)):
+                n_files += link_path(os.path.join(shard_dir, path), os.path.join(out_dir, path))
+    print(f"Reduced {len(samples)} samples from {len(shard_dirs)} shards into {out_dir} ({n_files} files)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plan and reduce sharded HolomiRA runs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    plan_parser = commands.add_parser("plan", help="samples per shard")
+    plan_parser.add_argument("sample_tab")
+    plan_parser.add_argument("n_shards", type=int)
+    reduce_parser = commands.add_parser("reduce", help="link the per-sample outputs of the shards into one out_dir")
+    reduce_parser.add_argument("out_dir")
+    reduce_parser.add_argument("sample_tab")
+    reduce_parser.add_argument("shard_dirs", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        plan(args.sample_tab, args.n_shards)
+    else:
+        reduce(args.out_dir, args.sample_tab, args.shard_dirs)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+
+## HolomiRA: per-stage profiling records
+#
+# Scripts create a StageProfile at start-up and count the items they process; the record
+# (wall/CPU time, peak RSS, bytes read/written and item counts) is written at exit to
+# $HOLOMIRA_PROFILE_DIR/<stage>/<sample>.json. The Snakefile sets HOLOMIRA_PROFILE_DIR;
+# when it is unset nothing is written. Used as a context manager (`with StageProfile(...) as
+# profile:`) the record is written when the block ends instead, so a process running several
+# samples (batch_worker.py) gets one record per stage and sample; CPU time and I/O are counted
+# from the creation of the profile, and peak RSS from the start of the block (the process peak is
+# reset through /proc/self/clear_refs; where that is not possible the field is left out, since the
+# process peak would include the samples before). Shell rules can record item counts with:
+#     python Workflow/Scripts/stage_profile.py <stage> <sample> <name>=<count> ...
+
+PROFILE_ENV = "HOLOMIRA_PROFILE_DIR"
+
+
+def read_proc_io():
+    """Bytes read/written by this process, from /proc/self/io (Linux only)."""
+    io = {}
+    try:
+        with open("/proc/self/io") as handle:
+            for line in handle:
+                key, value = line.split(":")
+                io[key] = int(value)
+    except (OSError, ValueError):
+        pass
+    return io.get("read_bytes", 0), io.get("write_bytes", 0)
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of this process (VmHWM, ru_maxrss) to its current RSS; False where unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as handle:
+            handle.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_kb():
+    """Peak RSS of this process since start-up or the last reset, in KB (Linux only)."""
+    try:
+        with open("/proc/self/status") as handle:
+            for line in handle:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+class StageProfile:
+    def __init__(self, stage, sample=None, profile_dir=None):
+        self.stage = stage
+        self.sample = sample or "all"
+        self.items = {}
+        self.started = time.time()
+        self.start_perf = time.perf_counter()
+        self.start_cpu = cpu_seconds()
+        self.start_read, self.start_write = read_proc_io()
+        self.profile_dir = profile_dir or os.environ.get(PROFILE_ENV)
+        # Set on entering a block: (peak RSS reset, children's peak RSS so far)
+        self.block = None
+        if self.profile_dir:
+            atexit.register(self.write)
+
+    def __enter__(self):
+        self.block = (reset_peak_rss(), resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        return self
+
+    def __exit__(self, *exc):
+        self.finish()
+        return False
+
+    def finish(self):
+        """Write the record now rather than at interpreter exit."""
+        if self.profile_dir:
+            atexit.unregister(self.write)
+            self.write()
+
+    def count(self, name, n=1):
+        self.items[name] = self.items.get(name, 0) + int(n)
+
+    def record(self):
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        read_bytes, write_bytes = read_proc_io()
+        record = {
+            "stage": self.stage,
+            "sample": self.sample,
+            "started": self.started,
+            "wall_s": time.perf_counter() - self.start_perf,
+            "cpu_s": cpu_seconds() - self.start_cpu,
+            "max_rss_mb": max(own.ru_maxrss, children.ru_maxrss) / 1024,
+            "read_bytes": read_bytes - self.start_read,
+            "write_bytes": write_bytes - self.start_write,
+            "items": self.items,
+        }
+        if self.block is not None:
+            reset, children_before = self.block
+            own_kb = peak_rss_kb() if reset else None
+            if own_kb is None:
+                del record["max_rss_mb"]
+            else:
+                # The children's peak covers every child reaped so far; it only counts when it grew in the block
+                children_kb = children.ru_maxrss if children.ru_maxrss > children_before else 0
+                record["max_rss_mb"] = max(own_kb, children_kb) / 1024
+        return record
+
+    def write(self):
+        path = os.path.join(self.profile_dir, self.stage, f"{self.sample}.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as out:
+            json.dump(self.record(), out)
+        os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: stage_profile.py <stage> <sample> [name=count ...]")
+        sys.exit(1)
+    profile = StageProfile(sys.argv[1], sys.argv[2])
+    for arg in sys.argv[3:]:
+        name, value = arg.split("=", 1)
+        profile.count(name, value or 0)
+    # Timing belongs to the calling shell rule (see its benchmark file); keep only the counts
+    if profile.profile_dir:
+        atexit.unregister(profile.write)
+        path = os.path.join(profile.profile_dir, profile.stage, f"{profile.sample}.json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as out:
+            json.dump({"stage": profile.stage, "sample": profile.sample, "items": profile.items}, out)
@@ -5,52 +5,111 @@ import matplotlib.pyplot as plt
 from matplotlib_venn import venn2, venn3
 import warnings
 import sys
+import os
 
 ##HolomiRA: summaries tables
+#   summary.py <HolomiRA_results.tsv> <out_dir> [--append]
+# With --append (append mode, see append_store.py) only the rows of the samples added to
+# HolomiRA_results.tsv since the last run are summarised and merged into the existing tables.
 input_file=sys.argv[1]
 out_dir=sys.argv[2]
- 
-# --- Read the final file into a pandas DataFrame ---
-df = pd.read_csv(input_file, sep='\t')
+append = "--append" in sys.argv[3:]
+
+
+def summarise(df):
+    """Per-environment MAG (taxonomy) and miRNA summary tables, keyed by file name."""
+    tables = {}
+
+    # --- Get the unique values in the 'Environment' column ---
+    unique_environments = df['Environment'].unique()
+
+    # --- Loop over each unique environment and perform the grouping and calculations ---
+    for env in unique_environments:
+        # Create a subset DataFrame for the current environment
+        subset_df = df[df['Environment'] == env]
+
+        # Group by 'MAG' and calculate the required information for each MAG
+        grouped_data_taxonomy = subset_df.groupby('MAG').agg({
+            'Taxonomy': ['nunique', lambda x: ', '.join(x.dropna().unique())],
+            'miRNA': ['nunique', lambda x: ', '.join(x.dropna().unique())],
+            'Gene': ['nunique', lambda x: ', '.join(x.dropna().unique())]
+        }).reset_index()
 
-# --- Get the unique values in the 'Environment' column ---
-unique_environments = df['Environment'].unique()
+        # Flatten the multi-level column index
+        grouped_data_taxonomy.columns = ['MAG', 'num_Taxonomy', 'Taxonomy', 'num_unique_miRNAs', 'unique_miRNAs', 'num_unique_genes', 'unique_genes']
 
-# --- Loop over each unique environment and perform the grouping and calculations ---
-for env in unique_environments:
-    # Create a subset DataFrame for the current environment
-    subset_df = df[df['Environment'] == env]
+        # Reorder the columns as needed
+        grouped_data_taxonomy = grouped_data_taxonomy[['MAG', 'num_Taxonomy', 'Taxonomy', 'num_unique_miRNAs', 'num_unique_genes', 'unique_miRNAs', 'unique_genes']]
 
-    # Group by 'MAG' and calculate the required information for each MAG
-    grouped_data_taxonomy = subset_df.groupby('MAG').agg({
-        'Taxonomy': ['nunique', lambda x: ', '.join(x.dropna().unique())],
-        'miRNA': ['nunique', lambda x: ', '.join(x.dropna().unique())],
-        'Gene': ['nunique', lambda x: ', '.join(x.dropna().unique())]
-    }).reset_index()
+        # Table saved as "MAG_result_table_summary_taxonomy_<environment>.tsv"
+        tables[f'MAG_result_table_summary_taxonomy_{env}.tsv'] = grouped_data_taxonomy
 
-    # Flatten the multi-level column index
-    grouped_data_taxonomy.columns = ['MAG', 'num_Taxonomy', 'Taxonomy', 'num_unique_miRNAs', 'unique_miRNAs', 'num_unique_genes', 'unique_genes']
+        # Group by 'miRNA' and calculate the required information for each miRNA
+        grouped_data_miRNA = subset_df.groupby('miRNA').agg({
+            'Taxonomy': ['nunique', lambda x: ', '.join(x.dropna().unique())],
+            'MAG': ['nunique', lambda x: ', '.join(x.dropna().unique())],
+            'Gene': ['nunique', lambda x: ', '.join(x.dropna().unique())]
+        }).reset_index()
 
-    # Reorder the columns as needed
-    grouped_data_taxonomy = grouped_data_taxonomy[['MAG', 'num_Taxonomy', 'Taxonomy', 'num_unique_miRNAs', 'num_unique_genes', 'unique_miRNAs', 'unique_genes']]
+        # Flatten the multi-level column index
+        grouped_data_miRNA.columns = ['miRNA', 'num_unique_Taxa', 'unique_Taxa', 'num_unique_MAG', 'unique_MAG', 'num_unique_genes', 'unique_genes']
 
-    # Save the result to a new file named "MAG_result_table_summary_taxonomy_<environment>.tsv"
-    grouped_data_taxonomy.to_csv(f'{out_dir}/final_results/MAG_result_table_summary_taxonomy_{env}.tsv', sep='\t', index=False)
+        # Reorder the columns as needed
+        grouped_data_miRNA = grouped_data_miRNA[['miRNA', 'num_unique_Taxa','num_unique_MAG', 'num_unique_genes', 'unique_Taxa', 'unique_MAG', 'unique_genes']]
 
-    # Group by 'miRNA' and calculate the required information for each miRNA
-    grouped_data_miRNA = subset_df.groupby('miRNA').agg({
-        'Taxonomy': ['nunique', lambda x: ', '.join(x.dropna().unique())],
-        'MAG': ['nunique', lambda x: ', '.join(x.dropna().unique())],
-        'Gene': ['nunique', lambda x: ', '.join(x.dropna().unique())]
-    }).reset_index()
+        # Table saved as "MAG_result_table_summary_miRNA_<environment>.tsv"
+        tables[f'MAG_result_table_summary_miRNA_{env}.tsv'] = grouped_data_miRNA
 
-    # Flatten the multi-level column index
-    grouped_data_miRNA.columns = ['miRNA', 'num_unique_Taxa', 'unique_Taxa', 'num_unique_MAG', 'unique_MAG', 'num_unique_genes', 'unique_genes']
+    return tables
 
-    # Reorder the columns as needed
-    grouped_data_miRNA = grouped_data_miRNA[['miRNA', 'num_unique_Taxa','num_unique_MAG', 'num_unique_genes', 'unique_Taxa', 'unique_MAG', 'unique_genes']]
 
-    # Save the result to a new file named "MAG_result_table_summary_miRNA_<environment>.tsv"
-    grouped_data_miRNA.to_csv(f'{out_dir}/final_results/MAG_result_table_summary_miRNA_{env}.tsv', sep='\t', index=False)
+def merge_lists(old, new):
+    """', '-joined unique values of old followed by those of new not already in it."""
+    values = [v for v in old.split(', ') if v]
+    values += [v for v in new.split(', ') if v and v not in values]
+    return ', '.join(values)
+
+
+def combine(old, new, key):
+    """Summary of the rows behind two summary tables: MAGs are disjoint, miRNAs may be in both."""
+    new = new.astype(str)
+    both = old[key].isin(new[key])
+    if both.any():
+        count_columns = [c for c in old.columns if c.startswith('num_')]
+        list_columns = [c for c in old.columns if c != key and not c.startswith('num_')]
+        shared = old[both].set_index(key)
+        added = new.set_index(key).loc[shared.index]
+        for column in list_columns:
+            shared[column] = [merge_lists(a, b) for a, b in zip(shared[column], added[column])]
+        for count, column in zip(count_columns, list_columns):
+            shared[count] = [str(len(v.split(', ')) if v else 0) for v in shared[column]]
+        old = pd.concat([old[~both], shared.reset_index()[old.columns]])
+        new = new[~new[key].isin(shared.index)]
+    return pd.concat([old, new[old.columns]]).sort_values(key, kind='stable')
+
+
+# --- Read the final file into a pandas DataFrame ---
+df = pd.read_csv(input_file, sep='\t')
+
+if not append:
+    for name, table in summarise(df).items():
+        table.to_csv(f'{out_dir}/final_results/{name}', sep='\t', index=False)
+else:
+    from append_store import AppendStore
+    results = AppendStore(out_dir, "HolomiRA_results")
+    store = AppendStore(out_dir, "summary")
+    added, rebuild = store.pending(results.samples, source=results.generation)
+    tables = summarise(df if rebuild else df[df['MAG'].isin(added)])
+    for name, table in tables.items():
+        if not rebuild and os.path.exists(store.path(name)):
+            key = 'MAG' if '_taxonomy_' in name else 'miRNA'
+            old = pd.read_csv(store.path(name), sep='\t', dtype=str, keep_default_na=False)
+            table = combine(old, table, key)
+        table.to_csv(store.path(name), sep='\t', index=False)
+    store.commit({sample: results.samples[sample] for sample in added}, source=results.generation)
+    for name in os.listdir(store.dir):
+        if name.endswith('.tsv'):
+            store.publish(name, f'{out_dir}/final_results/{name}')
+    print(f"Summary: {'rebuilt from' if rebuild else 'appended'} {len(added)} samples")
 
 print("Summary tables generated and saved successfully.")
\ No newline at end of file
@@ -37,6 +37,13 @@ def generate_blank_figure(message, output_path):
     print(f"Blank figure saved with message: '{message}'")
 
 
+# --- Set members in sorted order, so the summary does not depend on the hash seed ---
+def members(values):
+    if not values:
+        return "set()"
+    return "{" + ", ".join(repr(v) for v in sorted(values, key=str)) + "}"
+
+
 # --- Function to create combined Venn diagrams ---
 def create_combined_venn_diagram(df, unique_environments):
     mirna_sets = [set(df[df['Environment'] == env]['miRNA']) for env in unique_environments]
@@ -50,48 +57,48 @@ def create_combined_venn_diagram(df, unique_environments):
             venn2([mirna_sets[0], mirna_sets[1]], set_labels=unique_environments, set_colors=[palette[0], palette[1]], ax=axs[0])
             axs[0].set_title('Unique miRNA', fontsize=14)
             f.write('### miRNA\n')
-            f.write(f"Unique to {unique_environments[0]}: {mirna_sets[0] - mirna_sets[1]}\n")
-            f.write(f"Unique to {unique_environments[1]}: {mirna_sets[1] - mirna_sets[0]}\n")
-            f.write(f"Shared: {mirna_sets[0] & mirna_sets[1]}\n\n")
+            f.write(f"Unique to {unique_environments[0]}: {members(mirna_sets[0] - mirna_sets[1])}\n")
+            f.write(f"Unique to {unique_environments[1]}: {members(mirna_sets[1] - mirna_sets[0])}\n")
+            f.write(f"Shared: {members(mirna_sets[0] & mirna_sets[1])}\n\n")
 
             venn2([gene_sets[0], gene_sets[1]], set_labels=unique_environments, set_colors=[palette[0], palette[1]], ax=axs[1])
             axs[1].set_title('Unique Gene', fontsize=14)
             f.write('### Gene\n')
-            f.write(f"Unique to {unique_environments[0]}: {gene_sets[0] - gene_sets[1]}\n")
-            f.write(f"Unique to {unique_environments[1]}: {gene_sets[1] - gene_sets[0]}\n")
-            f.write(f"Shared: {gene_sets[0] & gene_sets[1]}\n\n")
+            f.write(f"Unique to {unique_environments[0]}: {members(gene_sets[0] - gene_sets[1])}\n")
+            f.write(f"Unique to {unique_environments[1]}: {members(gene_sets[1] - gene_sets[0])}\n")
+            f.write(f"Shared: {members(gene_sets[0] & gene_sets[1])}\n\n")
 
             venn2([taxonomy_sets[0], taxonomy_sets[1]], set_labels=unique_environments, set_colors=[palette[0], palette[1]], ax=axs[2])
             axs[2].set_title('Unique Taxonomy', fontsize=14)
             f.write('### Taxonomy\n')
-            f.write(f"Unique to {unique_environments[0]}: {taxonomy_sets[0] - taxonomy_sets[1]}\n")
-            f.write(f"Unique to {unique_environments[1]}: {taxonomy_sets[1] - taxonomy_sets[0]}\n")
-            f.write(f"Shared: {taxonomy_sets[0] & taxonomy_sets[1]}\n\n")
+            f.write(f"Unique to {unique_environments[0]}: {members(taxonomy_sets[0] - taxonomy_sets[1])}\n")
+            f.write(f"Unique to {unique_environments[1]}: {members(taxonomy_sets[1] - taxonomy_sets[0])}\n")
+            f.write(f"Shared: {members(taxonomy_sets[0] & taxonomy_sets[1])}\n\n")
 
         elif num_environments == 3:
             venn3([mirna_sets[0], mirna_sets[1], mirna_sets[2]], set_labels=unique_environments, set_colors=[palette[0], palette[1], palette[2]], ax=axs[0])
             axs[0].set_title('Unique miRNA', fontsize=14)
             f.write('### miRNA\n')
-            f.write(f"Unique to {unique_environments[0]}: {mirna_sets[0] - mirna_sets[1] - mirna_sets[2]}\n")
-            f.write(f"Unique to {unique_environments[1]}: {mirna_sets[1] - mirna_sets[0] - mirna_sets[2]}\n")
-            f.write(f"Unique to {unique_environments[2]}: {mirna_sets[2] - mirna_sets[0] - mirna_sets[1]}\n")
-            f.write(f"Shared: {mirna_sets[0] & mirna_sets[1] & mirna_sets[2]}\n\n")
+            f.write(f"Unique to {unique_environments[0]}: {members(mirna_sets[0] - mirna_sets[1] - mirna_sets[2])}\n")
+            f.write(f"Unique to {unique_environments[1]}: {members(mirna_sets[1] - mirna_sets[0] - mirna_sets[2])}\n")
+            f.write(f"Unique to {unique_environments[2]}: {members(mirna_sets[2] - mirna_sets[0] - mirna_sets[1])}\n")
+            f.write(f"Shared: {members(mirna_sets[0] & mirna_sets[1] & mirna_sets[2])}\n\n")
 
             venn3([gene_sets[0], gene_sets[1], gene_sets[2]], set_labels=unique_environments, set_colors=[palette[0], palette[1], palette[2]], ax=axs[1])
             axs[1].set_title('Unique Gene', fontsize=14)
             f.write('### Gene\n')
-            f.write(f"Unique to {unique_environments[0]}: {gene_sets[0] - gene_sets[1] - gene_sets[2]}\n")
-            f.write(f"Unique to {unique_environments[1]}: {gene_sets[1] - gene_sets[0] - gene_sets[2]}\n")
-            f.write(f"Unique to {unique_environments[2]}: {gene_sets[2] - gene_sets[0] - gene_sets[1]}\n")
-            f.write(f"Shared: {gene_sets[0] & gene_sets[1] & gene_sets[2]}\n\n")
+            f.write(f"Unique to {unique_environments[0]}: {members(gene_sets[0] - gene_sets[1] - gene_sets[2])}\n")
+            f.write(f"Unique to {unique_environments[1]}: {members(gene_sets[1] - gene_sets[0] - gene_sets[2])}\n")
+            f.write(f"Unique to {unique_environments[2]}: {members(gene_sets[2] - gene_sets[0] - gene_sets[1])}\n")
+            f.write(f"Shared: {members(gene_sets[0] & gene_sets[1] & gene_sets[2])}\n\n")
 
             venn3([taxonomy_sets[0], taxonomy_sets[1], taxonomy_sets[2]], set_labels=unique_environments, set_colors=[palette[0], palette[1], palette[2]], ax=axs[2])
             axs[2].set_title('Unique Taxonomy', fontsize=14)
             f.write('### Taxonomy\n')
-            f.write(f"Unique to {unique_environments[0]}: {taxonomy_sets[0] - taxonomy_sets[1] - taxonomy_sets[2]}\n")
-            f.write(f"Unique to {unique_environments[1]}: {taxonomy_sets[1] - taxonomy_sets[0] - taxonomy_sets[2]}\n")
-            f.write(f"Unique to {unique_environments[2]}: {taxonomy_sets[2] - taxonomy_sets[0] - taxonomy_sets[1]}\n")
-            f.write(f"Shared: {taxonomy_sets[0] & taxonomy_sets[1] & taxonomy_sets[2]}\n\n")
+            f.write(f"Unique to {unique_environments[0]}: {members(taxonomy_sets[0] - taxonomy_sets[1] - taxonomy_sets[2])}\n")
+            f.write(f"Unique to {unique_environments[1]}: {members(taxonomy_sets[1] - taxonomy_sets[0] - taxonomy_sets[2])}\n")
+            f.write(f"Unique to {unique_environments[2]}: {members(taxonomy_sets[2] - taxonomy_sets[0] - taxonomy_sets[1])}\n")
+            f.write(f"Shared: {members(taxonomy_sets[0] & taxonomy_sets[1] & taxonomy_sets[2])}\n\n")
 
         plt.subplots_adjust(top=0.85, wspace=0.3)
         plt.suptitle('Venn Diagrams for miRNA, Gene, and Taxonomy', fontsize=16)